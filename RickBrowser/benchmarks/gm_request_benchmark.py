@@ -0,0 +1,136 @@
+"""
+GM_xmlhttpRequest 后端基准测试
+在本地启动 HTTP/1.1 服务器，通过 GMRequestService 并发请求小响应和大响应，
+校验按块回传的内容，并统计服务器接受的TCP连接数以确认长连接复用
+
+用法（在 RickBrowser 目录下运行）：
+    python benchmarks/gm_request_benchmark.py [请求数]
+"""
+
+import base64
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gm_request import GMRequestService
+
+SMALL_BODY = "你好，用户脚本！".encode('utf-8') * 20
+LARGE_BODY = os.urandom(4 * 1024 * 1024)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """测试服务器：/small 返回文本，/large 返回 4MB 二进制，/echo 回显请求体"""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with Handler.lock:
+            Handler.connections += 1
+
+    def do_GET(self):
+        if self.path == '/large':
+            self.send_body(LARGE_BODY, 'application/octet-stream')
+        else:
+            self.send_body(SMALL_BODY, 'text/plain; charset=utf-8')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_body(body, 'text/plain; charset=utf-8')
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Collector:
+    """收集每个请求的事件"""
+
+    def __init__(self, expected):
+        self.results = {}
+        self.remaining = expected
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def on_event(self, key, event, data):
+        with self.lock:
+            result = self.results.setdefault(key, {'chunks': [], 'events': 0})
+            result['events'] += 1
+            if event == 'chunk':
+                result['chunks'].append(data['data'])
+            elif event in ('load', 'error', 'timeout'):
+                result['final'] = event
+                result['error'] = data.get('error')
+                self.remaining -= 1
+                if self.remaining == 0:
+                    self.done.set()
+
+
+def run(service, collector, requests_to_send):
+    """提交全部请求并等待完成，返回耗时（秒）"""
+    start = time.perf_counter()
+    for key, request in requests_to_send:
+        service.open(key, request)
+    collector.done.wait(120)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    requests_to_send = [(f"small-{i}", {'url': f"{base}/small"}) for i in range(count)]
+    requests_to_send += [(f"large-{i}", {'url': f"{base}/large", 'binary': True}) for i in range(4)]
+    requests_to_send.append(("echo", {'url': f"{base}/echo", 'method': 'POST', 'data': "回显"}))
+
+    collector = Collector(len(requests_to_send))
+    service = GMRequestService(max_workers=6, on_event=collector.on_event)
+    elapsed = run(service, collector, requests_to_send)
+    service.shutdown()
+    server.shutdown()
+
+    failures = 0
+    large_digest = hashlib.sha256(LARGE_BODY).hexdigest()
+    for key, _ in requests_to_send:
+        result = collector.results.get(key, {})
+        if result.get('final') != 'load':
+            failures += 1
+            print(f"{key} 失败: {result.get('final')} {result.get('error')}")
+            continue
+
+        if key.startswith('large'):
+            body = b''.join(base64.b64decode(chunk) for chunk in result['chunks'])
+            ok = hashlib.sha256(body).hexdigest() == large_digest and len(result['chunks']) > 1
+        elif key == 'echo':
+            ok = ''.join(result['chunks']) == "回显"
+        else:
+            ok = ''.join(result['chunks']) == SMALL_BODY.decode('utf-8')
+        if not ok:
+            failures += 1
+            print(f"{key} 内容不一致")
+
+    print(f"请求数: {len(requests_to_send)}（其中 4 个 4MB 二进制响应）")
+    print(f"耗时: {elapsed * 1000:.1f} ms")
+    print(f"TCP连接数: {Handler.connections}")
+    print(f"失败: {failures}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
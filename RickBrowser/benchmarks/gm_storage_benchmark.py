@@ -0,0 +1,101 @@
+"""
+GM 存储同步基准测试
+合成一个使用 GM_setValue/GM_getValue 的脚本和若干打开着它的页面，模拟“写入后立即重新加载”：
+导航开始时注入的存储快照还是旧值，写入随后才到达。检查并统计：
+    写入到达后重新同步各页面的耗时（与浏览器的 handle_storage_changed 一样）
+    重新同步后页面脚本集合中的快照是否为新值，下次创建的文档能读到新值
+    只有运行该脚本的页面收到变化
+
+用法（在 RickBrowser 目录下运行）：
+    python benchmarks/gm_storage_benchmark.py [页面数]
+"""
+
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QUrl
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtWebEngineWidgets import QWebEnginePage
+from script_injector import ScriptInjector
+
+SCRIPT = """// ==UserScript==
+// @name         计数器
+// @namespace    http://example.com
+// @match        https://counter.test/*
+// @grant        GM_getValue
+// @grant        GM_setValue
+// ==/UserScript==
+
+GM_setValue('count', GM_getValue('count', 0) + 1);
+location.reload();
+"""
+
+
+def get_snapshot(page):
+    """页面脚本集合中授权脚本包的存储快照"""
+    for script in page.scripts().toList():
+        match = re.search(r'window\.__rickGM\.seed\("[0-9a-f]+", "[^"]*", (\{.*?\})\);',
+                          script.sourceCode())
+        if match:
+            return json.loads(match.group(1))
+    return None
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    app = QApplication(sys.argv)
+
+    with tempfile.TemporaryDirectory() as scripts_dir:
+        with open(os.path.join(scripts_dir, "counter.user.js"), 'w', encoding='utf-8') as f:
+            f.write(SCRIPT)
+
+        injector = ScriptInjector(scripts_dir)
+        url = QUrl("https://counter.test/")
+        other_url = QUrl("https://other.test/")
+        injector.wait_for_scripts(url)
+
+        # 一半页面运行计数器脚本，另一半不运行
+        pages = [(QWebEnginePage(), url if index % 2 == 0 else other_url) for index in range(count)]
+        for page, page_url in pages:
+            injector.inject_to_page(page, page_url)
+
+        # 各页面收到的变化
+        received = {}
+
+        def resync(origin, changes):
+            for index, (page, page_url) in enumerate(pages):
+                injector.inject_to_page(page, page_url)
+                page_changes = injector.filter_storage_changes(changes, page_url)
+                if page_changes and str(index) != origin:
+                    received[index] = page_changes
+
+        injector.storageChanged.connect(resync)
+
+        # 第 0 个页面写入：重新加载时的导航已经用旧快照同步过，写入在这之后到达
+        key = injector.get_gm_key(injector.scripts[0])
+        payload = json.dumps([{'key': key, 'set': {'count': "1"}, 'del': []}])
+        start = time.perf_counter()
+        injector.handle_storage_write(payload, "0")
+        elapsed = time.perf_counter() - start
+
+        snapshots = [get_snapshot(page) for page, page_url in pages if page_url == url]
+        print(f"页面数: {count}，写入并重新同步耗时 {elapsed * 1000:.1f} ms")
+        print(f"重新加载的页面读到: {snapshots[0]}")
+
+        ok = all(snapshot == {'count': "1"} for snapshot in snapshots)
+        ok = ok and sorted(received) == [index for index in range(2, count, 2)]
+        injector.close()
+
+    app.quit()
+    print("结果正确" if ok else "结果不符合预期")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+URL匹配引擎基准测试
+先校验匹配规则的正确性矩阵，再测量索引查找的吞吐量
+
+用法（在 RickBrowser 目录下运行）：
+    python benchmarks/match_benchmark.py [脚本数量]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from url_matcher import MatchIndex, PatternError, compile_pattern
+
+# (规则类型, 模式, URL, 是否匹配)
+CASES = [
+    # @match：协议
+    ('match', '*://*/*', 'https://example.com/', True),
+    ('match', '*://*/*', 'http://example.com/a?b=1', True),
+    ('match', '*://*/*', 'ftp://example.com/', False),
+    ('match', '*://*/*', 'file:///C:/a.html', False),
+    ('match', 'https://example.com/*', 'http://example.com/', False),
+    ('match', '<all_urls>', 'file:///tmp/a.html', True),
+    ('match', 'file:///*', 'file:///tmp/a.html', True),
+    # @match：主机
+    ('match', '*://*.example.com/*', 'https://example.com/', True),
+    ('match', '*://*.example.com/*', 'https://a.b.example.com/x', True),
+    ('match', '*://*.example.com/*', 'https://badexample.com/', False),
+    ('match', '*://example.com/*', 'https://www.example.com/', False),
+    ('match', '*://EXAMPLE.com/*', 'https://example.com/', True),
+    ('match', '*://example.com/*', 'https://user@example.com:8080/', True),
+    # @match：路径（包含查询，不包含片段）
+    ('match', '*://example.com/foo*', 'https://example.com/foo/bar', True),
+    ('match', '*://example.com/foo*', 'https://example.com/bar/foo', False),
+    ('match', '*://example.com/*/edit', 'https://example.com/doc/edit#top', True),
+    ('match', '*://example.com/a?b=*', 'https://example.com/a?b=1', True),
+    ('match', '*://example.com/', 'https://example.com/x', False),
+    # @include：通配符
+    ('include', '*', 'https://anything.test/', True),
+    ('include', 'http*://www.example.com/*', 'https://www.example.com/a', True),
+    ('include', '*://*.example.com/*', 'https://example.com/', False),
+    ('include', '*://*.google.tld/*', 'https://www.google.co.uk/search', True),
+    ('include', '*://*.google.tld/*', 'https://www.google.com/', True),
+    ('include', '*://*.google.tld/*', 'https://www.google.x/', False),
+    ('include', 'https://example.com/*', 'HTTPS://EXAMPLE.COM/A', True),
+    # @include：正则
+    ('include', r'/^https?:\/\/(www\.)?github\.com\//', 'https://github.com/a', True),
+    ('include', r'/^https?:\/\/(www\.)?github\.com\//', 'https://gist.github.com/a', False),
+    ('include', r'/WIKI/i', 'https://en.wikipedia.org/wiki/A', True),
+]
+
+# 加载时应被拒绝的模式
+INVALID = [
+    ('match', 'example.com/*'),
+    ('match', 'chrome://*/*'),
+    ('match', 'https://*example.com/*'),
+    ('match', 'https://example.com'),
+    ('match', 'file://host/*'),
+    ('include', '/[unclosed/'),
+    ('include', '/abc/z'),
+    ('include', '   '),
+]
+
+
+def check_correctness():
+    """运行正确性矩阵，返回失败数量"""
+    failures = 0
+
+    for kind, pattern, url, expected in CASES:
+        actual = compile_pattern(pattern, kind).matches(url)
+
+        # 通过索引查找应得到相同结论
+        index = MatchIndex()
+        index.add('s', [compile_pattern(pattern, kind)], [])
+        indexed = index.lookup(url) == ['s']
+
+        if actual != expected or indexed != expected:
+            failures += 1
+            print(f"失败: @{kind} {pattern!r} {url!r} 期望 {expected}，"
+                  f"实际 {actual}（索引 {indexed}）")
+
+    for kind, pattern in INVALID:
+        try:
+            compile_pattern(pattern, kind)
+        except PatternError:
+            continue
+        failures += 1
+        print(f"失败: @{kind} {pattern!r} 应被拒绝")
+
+    total = len(CASES) + len(INVALID)
+    print(f"正确性矩阵: {total - failures}/{total} 通过")
+    return failures
+
+
+def build_index(script_count):
+    """生成合成的脚本规则索引"""
+    index = MatchIndex()
+    for i in range(script_count):
+        if i % 10 == 0:
+            matches = [compile_pattern('*://*/*', 'match')]
+        elif i % 10 == 1:
+            matches = [compile_pattern(f'/^https:\\/\\/site{i}\\.test\\//', 'include')]
+        elif i % 10 == 2:
+            matches = [compile_pattern(f'*://*.site{i}.test/*', 'include')]
+        else:
+            matches = [compile_pattern(f'*://*.site{i}.test/path/*', 'match')]
+        excludes = [compile_pattern(f'*://*/logout{i}*', 'include')] if i % 7 == 0 else []
+        index.add(f'script{i}', matches, excludes)
+    return index
+
+
+def run_throughput(script_count, iterations=20000):
+    """测量索引查找的吞吐量"""
+    index = build_index(script_count)
+    urls = [
+        f'https://www.site{i % script_count}.test/path/page{i}?q={i}#frag'
+        for i in range(200)
+    ]
+
+    # 预热来源缓存
+    for url in urls:
+        index.lookup(url)
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        index.lookup(urls[i % len(urls)])
+    elapsed = time.perf_counter() - start
+
+    print(f"{script_count} 个脚本: {iterations / elapsed:,.0f} 次查找/秒 "
+          f"（{elapsed / iterations * 1e6:.1f} µs/次）")
+
+
+def main():
+    if check_correctness():
+        sys.exit(1)
+
+    counts = [int(sys.argv[1])] if len(sys.argv) > 1 else [10, 100, 1000]
+    for count in counts:
+        run_throughput(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+ScriptInjector 基准测试套件
+生成 10/100/1000 个合成用户脚本和URL语料，测量：
+    load_scripts     冷启动（无元数据缓存）与热启动，以及启动后第一次导航的等待时间
+    parse_metadata   元数据解析吞吐量
+    should_inject    逐脚本匹配吞吐量
+    pattern_matches  单个模式匹配吞吐量（含编译缓存）
+    plan_injection   端到端注入计划延迟（索引查找 + 分组 + 脚本包哈希）
+
+结果以JSON输出，可与上一版本的结果比较以发现性能退化。
+
+用法（在 RickBrowser 目录下运行）：
+    python benchmarks/script_injector_benchmark.py [--sizes 10,100,1000]
+        [--output results.json] [--baseline old.json] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QUrl
+from script_injector import ScriptInjector
+
+# 合成脚本使用的站点
+DOMAINS = [
+    "github.com", "bilibili.com", "bing.com", "zhihu.com", "baidu.com",
+    "wikipedia.org", "stackoverflow.com", "youtube.com", "qq.com", "csdn.net",
+    "taobao.com", "jd.com", "douban.com", "weibo.com", "example.edu.cn",
+]
+
+RUN_AT = ["document-start", "document-end", "document-idle"]
+
+
+def make_metadata(rng, index):
+    """生成一个接近真实脚本的元数据块"""
+    domain = DOMAINS[index % len(DOMAINS)]
+    lines = [
+        "// ==UserScript==",
+        f"// @name         合成脚本 {index}",
+        f"// @namespace    https://scripts.example.com/{index}",
+        f"// @version      {rng.randint(0, 9)}.{rng.randint(0, 99)}",
+        "// @description  基准测试用的合成脚本",
+        "// @author       benchmark",
+    ]
+
+    kind = index % 6
+    if kind == 0:
+        lines.append("// @match        *://*/*")
+    elif kind == 1:
+        lines.append(f"// @match        https://*.{domain}/*")
+        lines.append(f"// @match        https://{domain}/*")
+    elif kind == 2:
+        lines.append(f"// @match        https://www.{domain}/{rng.choice(['a', 'search', 'video'])}/*")
+    elif kind == 3:
+        escaped = domain.replace('.', '\\.')
+        lines.append(f"// @include      /^https?:\\/\\/([a-z]+\\.)?{escaped}\\//")
+    elif kind == 4:
+        lines.append(f"// @include      http*://*.{domain.split('.')[0]}.tld/*")
+    else:
+        lines.append(f"// @match        *://*.site{index}.test/*")
+
+    if rng.random() < 0.3:
+        lines.append("// @exclude      *://*/login*")
+    lines.append(f"// @run-at       {rng.choice(RUN_AT)}")
+    if rng.random() < 0.2:
+        lines.append("// @noframes")
+    lines.append("// @grant        none")
+    lines.append("// ==/UserScript==")
+    return "\n".join(lines)
+
+
+def make_script(rng, index):
+    """生成完整脚本：元数据块 + 若干KB正文"""
+    body = "\n".join(
+        f"    document.querySelectorAll('.item-{i}').forEach(function(el) {{ el.dataset.seen = '1'; }});"
+        for i in range(rng.randint(20, 200))
+    )
+    return f"{make_metadata(rng, index)}\n\n(function() {{\n    'use strict';\n{body}\n}})();\n"
+
+
+def make_urls(rng, count=500):
+    """生成URL语料"""
+    paths = ["/", "/search?q=test", "/video/BV1xx", "/a/123", "/login", "/user/profile#tab"]
+    urls = []
+    for _ in range(count):
+        domain = rng.choice(DOMAINS)
+        sub = rng.choice(["www.", "m.", "", "api."])
+        urls.append(f"https://{sub}{domain}{rng.choice(paths)}")
+    return urls
+
+
+def measure(func, iterations):
+    """运行 func(i) 若干次，返回每次平均耗时（微秒）"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_size(size, rng):
+    """测量一个规模下的全部指标"""
+    results = {}
+
+    with tempfile.TemporaryDirectory() as scripts_dir:
+        sources = [make_script(rng, i) for i in range(size)]
+        for i, source in enumerate(sources):
+            with open(os.path.join(scripts_dir, f"script{i:04d}.user.js"), 'w', encoding='utf-8') as f:
+                f.write(source)
+
+        # load_scripts：冷启动与热启动（等待后台加载完成）
+        start = time.perf_counter()
+        injector = ScriptInjector(scripts_dir)
+        injector.wait_for_scripts()
+        results['load_scripts_cold_ms'] = (time.perf_counter() - start) * 1000
+        injector.resource_cache.shutdown()
+
+        start = time.perf_counter()
+        injector = ScriptInjector(scripts_dir)
+        injector.wait_for_scripts()
+        results['load_scripts_warm_ms'] = (time.perf_counter() - start) * 1000
+
+        # 启动后第一次导航的等待时间（只等待可能匹配的脚本）
+        start = time.perf_counter()
+        first = ScriptInjector(scripts_dir)
+        first.plan_injection(QUrl("https://www.github.com/"))
+        results['first_navigation_warm_ms'] = (time.perf_counter() - start) * 1000
+        first.wait_for_scripts()
+        first.resource_cache.shutdown()
+
+        # parse_metadata
+        results['parse_metadata_us'] = measure(
+            lambda i: injector.parse_metadata(sources[i % size]), max(1000, size))
+
+        urls = [QUrl(url) for url in make_urls(rng)]
+        url_strings = [url.toString() for url in urls]
+        scripts = injector.scripts
+
+        # should_inject：一个URL对全部脚本逐一判断
+        results['should_inject_us'] = measure(
+            lambda i: injector.should_inject(scripts[i % size], urls[i % len(urls)]), 20000)
+
+        # pattern_matches
+        patterns = [script['matches'][0] for script in scripts if script['matches']]
+        results['pattern_matches_us'] = measure(
+            lambda i: injector.pattern_matches(patterns[i % len(patterns)],
+                                               url_strings[i % len(url_strings)],
+                                               'match' if i % 2 else 'include'), 20000)
+
+        # plan_injection：先冷（每个来源首次），再热
+        results['plan_injection_cold_us'] = measure(
+            lambda i: injector.plan_injection(urls[i % len(urls)]), len(urls))
+        results['plan_injection_warm_us'] = measure(
+            lambda i: injector.plan_injection(urls[i % len(urls)]), 5000)
+
+        injector.resource_cache.shutdown()
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与基准结果比较，返回退化的指标列表"""
+    regressions = []
+    for size, metrics in results['sizes'].items():
+        old_metrics = baseline.get('sizes', {}).get(size, {})
+        for name, value in metrics.items():
+            old = old_metrics.get(name)
+            if old and value > old * (1 + tolerance):
+                regressions.append((size, name, old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ScriptInjector 基准测试")
+    parser.add_argument("--sizes", default="10,100,1000", help="脚本数量，逗号分隔")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="用于比较的历史结果JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="允许的退化比例（默认 0.25 即 25%%）")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+    rng = random.Random(args.seed)
+
+    results = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'sizes': {}
+    }
+
+    # 屏蔽 ScriptInjector 的加载日志
+    real_stdout = sys.stdout
+    for size in [int(value) for value in args.sizes.split(',')]:
+        sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+        try:
+            results['sizes'][str(size)] = run_size(size, rng)
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+
+        metrics = results['sizes'][str(size)]
+        print(f"[{size} 个脚本]")
+        for name, value in metrics.items():
+            print(f"  {name:<28} {value:12.2f}")
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for size, name, old, new in regressions:
+            print(f"性能退化: {size} 个脚本 {name} {old:.2f} -> {new:.2f}")
+        if regressions:
+            sys.exit(1)
+        print("未发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
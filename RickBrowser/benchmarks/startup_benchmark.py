@@ -0,0 +1,83 @@
+"""
+用户脚本启动耗时基准测试
+比较冷启动（无元数据缓存）与热启动（使用元数据缓存）的脚本加载时间
+
+用法（在 RickBrowser 目录下运行）：
+    python benchmarks/startup_benchmark.py [脚本数量]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication
+from script_injector import ScriptInjector
+
+SCRIPT_TEMPLATE = """// ==UserScript==
+// @name         合成脚本 {index}
+// @namespace    http://example.com
+// @version      1.{index}
+// @description  启动基准测试用的合成脚本
+// @match        *://*.site{index}.test/*
+// @include      /^https?:\\/\\/mirror{index}\\.test\\//
+// @exclude      *://*/logout*
+// @run-at       document-end
+// @grant        GM_getValue
+// @grant        GM_setValue
+// ==/UserScript==
+
+(function() {{
+    'use strict';
+{body}
+}})();
+"""
+
+
+def create_scripts(scripts_dir, count):
+    """生成合成脚本库，每个脚本带约 20KB 的正文"""
+    body = "    console.log('padding');\n" * 700
+    for index in range(count):
+        path = os.path.join(scripts_dir, f"script{index:04d}.user.js")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(SCRIPT_TEMPLATE.format(index=index, body=body))
+
+
+def time_startup(scripts_dir):
+    """测量创建 ScriptInjector 并等待后台加载全部脚本的耗时"""
+    start = time.perf_counter()
+    injector = ScriptInjector(scripts_dir)
+    injector.wait_for_scripts()
+    elapsed = time.perf_counter() - start
+    return elapsed, len(injector.scripts)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    app = QCoreApplication(sys.argv)
+
+    # 屏蔽逐个脚本的加载日志
+    real_stdout = sys.stdout
+
+    with tempfile.TemporaryDirectory() as scripts_dir:
+        create_scripts(scripts_dir, count)
+
+        sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+        try:
+            cold, loaded = time_startup(scripts_dir)
+            warm, _ = time_startup(scripts_dir)
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+
+    print(f"脚本数量: {loaded}")
+    print(f"冷启动（解析全部脚本）: {cold * 1000:.1f} ms")
+    print(f"热启动（元数据缓存）:   {warm * 1000:.1f} ms")
+    if warm > 0:
+        print(f"加速比: {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+脚本自动更新基准测试
+在本地启动模拟的脚本托管服务器（支持 ETag 和范围请求），对合成脚本执行三轮检查：
+    第一轮  服务器上的版本更高：只读取元数据块，再下载完整脚本
+    第二轮  条件请求命中，服务器返回 304
+    第三轮  没有缓存验证信息、版本相同：只读取元数据块
+统计每轮的结果、耗时和服务器发送的字节数
+
+用法（在 RickBrowser 目录下运行）：
+    python benchmarks/update_benchmark.py [脚本数量]
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication
+from script_injector import ScriptInjector
+from script_updater import ScriptUpdater
+
+SCRIPT_TEMPLATE = """// ==UserScript==
+// @name         合成脚本 {index}
+// @namespace    http://example.com
+// @version      {version}
+// @match        *://*.site{index}.test/*
+// @updateURL    {base}/scripts/{index}.user.js
+// @downloadURL  {base}/scripts/{index}.user.js
+// ==/UserScript==
+
+(function() {{
+{body}
+}})();
+"""
+
+BODY = "    console.log('padding');\n" * 4000
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """托管 /scripts/<序号>.user.js，版本为 server_version"""
+
+    protocol_version = "HTTP/1.1"
+    base = ""
+    server_version_text = "1.1"
+    bytes_sent = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        index = self.path.rsplit('/', 1)[-1].split('.')[0]
+        body = SCRIPT_TEMPLATE.format(index=index, version=Handler.server_version_text,
+                                      base=Handler.base, body=BODY).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        # 支持 bytes=0-N 形式的范围请求
+        status = 200
+        byte_range = self.headers.get('Range', '')
+        if byte_range.startswith('bytes=0-'):
+            body = body[:int(byte_range[len('bytes=0-'):]) + 1]
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/javascript; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        # 分块写入，客户端读到元数据块后关闭连接时停止
+        try:
+            for start in range(0, len(body), 16 * 1024):
+                self.wfile.write(body[start:start + 16 * 1024])
+                with Handler.lock:
+                    Handler.bytes_sent += len(body[start:start + 16 * 1024])
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    """忽略客户端提前关闭连接产生的错误"""
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+def run_round(updater, items):
+    """执行一轮检查，返回 (各状态计数, 耗时秒, 服务器发送字节数)"""
+    results = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_result(result):
+        with lock:
+            results.append(result)
+            if len(results) == len(items):
+                done.set()
+
+    updater.on_result = on_result
+    Handler.bytes_sent = 0
+    start = time.perf_counter()
+    updater.check(items)
+    done.wait(120)
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+        if result['status'] == 'error':
+            print(f"  {result['name']}: {result['error']}")
+    return counts, elapsed, Handler.bytes_sent, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    app = QCoreApplication(sys.argv)
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Handler.base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        # parse_metadata 不依赖注入器的状态
+        updater = ScriptUpdater(state_dir, lambda content: ScriptInjector.parse_metadata(None, content),
+                                max_workers=4)
+
+        items = [{
+            'id': f"script{index}",
+            'name': f"合成脚本 {index}",
+            'version': "1.0",
+            'hash': "",
+            'update_url': f"{Handler.base}/scripts/{index}.user.js",
+            'download_url': f"{Handler.base}/scripts/{index}.user.js"
+        } for index in range(count)]
+
+        full_size = len(SCRIPT_TEMPLATE.format(index=0, version="1.1", base=Handler.base,
+                                               body=BODY).encode('utf-8'))
+        print(f"脚本数量: {count}，每个脚本约 {full_size // 1024} KB")
+
+        counts, elapsed, sent, results = run_round(updater, items)
+        print(f"第一轮（有新版本）: {counts}，{elapsed * 1000:.0f} ms，服务器发送 {sent // 1024} KB")
+        ok = counts.get('updated') == count and all('1.1' in r['content'] for r in results)
+
+        # 注入器写入新脚本后才记录缓存验证信息
+        for result in results:
+            if result['status'] == 'updated':
+                updater.commit_state(result['id'], result['state'])
+
+        for item in items:
+            item['version'] = "1.1"
+        counts, elapsed, sent, _ = run_round(updater, items)
+        print(f"第二轮（条件请求）: {counts}，{elapsed * 1000:.0f} ms，服务器发送 {sent // 1024} KB")
+        ok = ok and counts.get('not_modified') == count
+
+        updater.state.clear()
+        counts, elapsed, sent, _ = run_round(updater, items)
+        print(f"第三轮（只读元数据）: {counts}，{elapsed * 1000:.0f} ms，服务器发送 {sent // 1024} KB")
+        ok = ok and counts.get('current') == count
+
+        updater.shutdown()
+
+    server.shutdown()
+    print("结果正确" if ok else "结果不符合预期")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+书签存储
+按网址的规范键建立哈希索引（O(1) 判断是否已收藏，同一页面的不同写法视为同一书签），
+按标题和网址中的词建立倒排索引，
+增删书签时增量更新，搜索框输入时即时过滤
+"""
+
+from token_index import TokenIndex, tokenize
+from url_canonical import UrlCanonicalizer
+
+
+class BookmarkStore:
+    """书签集合，书签为 {url, title, time}
+
+    书签字典加入后不再修改（需要修改时替换为新字典），
+    因此快照只需浅复制列表
+    """
+
+    # 候选结果少于这个数时，直接检查候选书签的词，不再查倒排索引
+    FILTER_THRESHOLD = 256
+
+    def __init__(self, bookmarks=None, canonicalizer=None):
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+
+        # 网址键 -> 书签，按加入顺序排列
+        self.by_key = {}
+
+        # 网址键 -> 加入序号，用于按加入顺序排列搜索结果
+        self.order = {}
+        self.next_order = 0
+
+        # 词索引在第一次搜索时才建立，之后增量维护；启动时只建立网址索引
+        self.token_index = None
+
+        for bookmark in bookmarks or []:
+            if isinstance(bookmark, dict) and bookmark.get('url'):
+                self.add(bookmark)
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def __iter__(self):
+        return iter(list(self.by_key.values()))
+
+    def key_for(self, url):
+        """书签的索引键（网址的规范键）"""
+        return self.canonicalizer.canonicalize(url)
+
+    @staticmethod
+    def get_tokens(bookmark):
+        """书签标题和网址中的词"""
+        return tokenize(bookmark.get('title', '')) + tokenize(bookmark['url'])
+
+    def contains(self, url):
+        """网址是否已收藏"""
+        return self.key_for(url) in self.by_key
+
+    def get(self, url):
+        """获取网址对应的书签，没有时返回 None"""
+        return self.by_key.get(self.key_for(url))
+
+    def add(self, bookmark):
+        """添加书签（网址已存在时替换），返回书签"""
+        key = self.key_for(bookmark['url'])
+        if key in self.by_key:
+            self.remove(bookmark['url'])
+
+        self.by_key[key] = bookmark
+        self.order[key] = self.next_order
+        self.next_order += 1
+        if self.token_index is not None:
+            self.token_index.add(key, self.get_tokens(bookmark))
+        return bookmark
+
+    def remove(self, url):
+        """删除书签，返回被删除的书签，不存在时返回 None"""
+        key = self.key_for(url)
+        bookmark = self.by_key.pop(key, None)
+        if bookmark is None:
+            return None
+
+        del self.order[key]
+        if self.token_index is not None:
+            self.token_index.remove(key)
+        return bookmark
+
+    def ensure_index(self):
+        """建立词索引（只在第一次调用时建立）"""
+        if self.token_index is not None:
+            return
+        self.token_index = TokenIndex()
+        self.token_index.begin_bulk()
+        for key, bookmark in self.by_key.items():
+            self.token_index.add(key, self.get_tokens(bookmark))
+        self.token_index.end_bulk()
+
+    def snapshot(self):
+        """全部书签的列表（用于保存）"""
+        return list(self.by_key.values())
+
+    def search(self, text, limit=None):
+        """搜索标题或网址中包含以查询词开头的词的书签，按加入顺序排列
+
+        每个查询词都按前缀匹配，便于边输入边搜索
+        """
+        terms = sorted(set(tokenize(text)), key=len, reverse=True)
+        if not terms:
+            results = self.snapshot()
+            return results[:limit] if limit is not None else results
+
+        self.ensure_index()
+        candidates = None
+        for term in terms:
+            if candidates is not None and len(candidates) <= self.FILTER_THRESHOLD:
+                candidates = {key for key in candidates if self.token_index.key_matches(key, term)}
+            else:
+                keys = self.token_index.prefix_keys(term)
+                candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return []
+
+        # 结果较多时按顺序过滤全部书签比排序更快
+        if len(candidates) * 8 > len(self.by_key):
+            results = [bookmark for key, bookmark in self.by_key.items() if key in candidates]
+            return results[:limit] if limit is not None else results
+
+        keys = sorted(candidates, key=self.order.__getitem__)
+        if limit is not None:
+            keys = keys[:limit]
+        return [self.by_key[key] for key in keys]
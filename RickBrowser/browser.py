@@ -16,6 +16,13 @@ from PyQt5.QtWebChannel import QWebChannel
 from PyQt5.QtGui import *
 from new_tab import NewTabPage
 from script_injector import ScriptInjector
+from history_store import HistoryStore
+from history_retention import RetentionPolicy, RetentionWorker
+from page_index import PageIndex
+from url_canonical import UrlCanonicalizer
+from persistence import PersistenceWorker
+from bookmark_store import BookmarkStore
+from omnibox import OmniboxCompleter, OmniboxModel
 
 # 设置高DPI支持（必须在QApplication创建之前）
 if hasattr(Qt, 'AA_EnableHighDpiScaling'):
@@ -45,9 +52,243 @@ class BrowserBridge(QObject):
         """从JavaScript报告视频状态"""
         self.videoDetected.emit(has_video)
 
+class ScriptBridge(QObject):
+    """每个页面独立的用户脚本通道，GM_xmlhttpRequest 的响应只发送给发起请求的页面"""
+    
+    # 请求事件：JSON {id, type, data}
+    xhrEvent = pyqtSignal(str)
+    
+    # 其他页面写入了本页脚本的存储：JSON [{tag, set, del}]
+    storageChanged = pyqtSignal(str)
+    
+    def __init__(self, browser, page):
+        super().__init__(page)
+        self.browser = browser
+        self.page = page
+        self.key = str(id(self))
+        
+        # 页面关闭时中止其全部请求
+        injector, key = browser.script_injector, self.key
+        self.destroyed.connect(lambda: injector.abort_requests(key))
+    
+    @pyqtSlot(str)
+    def xhrOpen(self, payload):
+        """用户脚本发起 GM_xmlhttpRequest"""
+        self.browser.script_injector.open_request(self.key, payload, self.page.url().host(),
+                                                  self.xhrEvent.emit)
+    
+    @pyqtSlot(str)
+    def storageWrite(self, payload):
+        """用户脚本批量写入 GM 存储（按脚本的密钥确定写入哪个脚本的存储）"""
+        self.browser.script_injector.handle_storage_write(payload, self.key)
+    
+    @pyqtSlot(str)
+    def xhrAbort(self, request_id):
+        """用户脚本中止请求"""
+        self.browser.script_injector.abort_request(self.key, request_id)
+    
+    @pyqtSlot(str)
+    def reportScriptTimings(self, payload):
+        """ApplicationWorld 中的用户脚本耗时（页面地址由Python一侧确定）"""
+        self.browser.handle_script_timings(payload, self.page.url())
+
+class BrowserPage(QWebEnginePage):
+    """浏览器页面，在导航开始时同步用户脚本"""
+    
+    def __init__(self, browser, parent=None):
+        super().__init__(parent)
+        self.browser = browser
+        
+        # 最近一次主框架导航的目标，脚本或存储变化时按它重新同步（导航完成前 url() 仍是旧地址）
+        self.script_url = None
+    
+    def acceptNavigationRequest(self, url, nav_type, is_main_frame):
+        """导航请求：在文档创建之前确定要注入的脚本"""
+        if is_main_frame:
+            self.script_url = url
+            self.browser.inject_scripts_to_page(self, url)
+        return super().acceptNavigationRequest(url, nav_type, is_main_frame)
+
+class BookmarkListModel(QAbstractListModel):
+    """书签列表模型，视图只为可见行取数据"""
+    
+    def __init__(self, bookmarks=None, parent=None):
+        super().__init__(parent)
+        self.bookmarks = list(bookmarks or [])
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.bookmarks)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        bookmark = self.bookmarks[index.row()]
+        if role == Qt.DisplayRole:
+            return bookmark.get('title') or bookmark['url']
+        if role in (Qt.ToolTipRole, Qt.UserRole):
+            return bookmark['url']
+        return None
+    
+    def set_bookmarks(self, bookmarks):
+        """替换显示的书签"""
+        self.beginResetModel()
+        self.bookmarks = list(bookmarks)
+        self.endResetModel()
+    
+    def remove_row(self, row):
+        """移除一行"""
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.bookmarks[row]
+        self.endRemoveRows()
+
+class HistoryTableModel(QAbstractTableModel):
+    """历史记录表格模型：滚动到底部时才从数据库按页读取，时间只为可见行格式化"""
+    
+    HEADERS = ["标题", "网址", "访问时间"]
+    
+    # 每次读取的行数
+    PAGE_SIZE = 200
+    
+    def __init__(self, history_store, parent=None):
+        super().__init__(parent)
+        self.history_store = history_store
+        self.rows = []
+        self.exhausted = False
+        self.filters = {}
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return item['title'] or '未知'
+            if column == 1:
+                return item['url']
+            return datetime.fromtimestamp(item['time']).strftime("%Y-%m-%d %H:%M:%S")
+        if role == Qt.ToolTipRole and column < 2:
+            return item['url'] if column == 1 else item['title']
+        if role == Qt.UserRole:
+            return item['url']
+        return None
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+    
+    def fetchMore(self, parent=QModelIndex()):
+        """按上一页最后一条记录继续读取下一页（走时间索引，不使用 OFFSET）"""
+        if parent.isValid() or self.exhausted:
+            return
+        before = (self.rows[-1]['time'], self.rows[-1]['id']) if self.rows else None
+        try:
+            page = self.history_store.get_visits(limit=self.PAGE_SIZE, before=before, **self.filters)
+        except Exception as e:
+            print(f"读取历史记录时出错: {e}")
+            page = []
+        
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+    
+    def set_filter(self, text):
+        """按主机名前缀过滤；包含 :// 时按网址前缀过滤"""
+        text = text.strip()
+        if not text:
+            filters = {}
+        elif '://' in text:
+            filters = {'url_prefix': text}
+        else:
+            host = text.lower()
+            filters = {'host_prefix': host[4:] if host.startswith('www.') else host}
+        
+        self.beginResetModel()
+        self.filters = filters
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+    
+    def clear(self):
+        """清空显示的记录"""
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = True
+        self.endResetModel()
+
+class PageSearchModel(QAbstractTableModel):
+    """网页内容搜索结果的表格模型"""
+    
+    HEADERS = ["标题", "摘要", "网址"]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.rows[index.row()]
+        column = index.column()
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            if column == 0:
+                return item['title'] or '未知'
+            if column == 1:
+                return item['snippet']
+            return item['url']
+        if role == Qt.UserRole:
+            return item['url']
+        return None
+    
+    def set_results(self, rows):
+        """替换搜索结果"""
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
 class Browser(QMainWindow):
     """主浏览器窗口"""
     
+    # 历史记录整理完成（报告，被删除的网址列表，访问次数有变化的网址），从后台线程发到GUI线程
+    historyPruned = pyqtSignal(object, object, object)
+    
+    # 后台写入服务写完统计对话框打开前提交的修改，从后台线程发到GUI线程
+    statisticsFlushed = pyqtSignal()
+    
+    # 历史记录过滤框的防抖间隔（毫秒）
+    HISTORY_FILTER_DELAY = 250
+    
+    # 标签页停留时间每隔这么久记录一次（毫秒），意外退出时最多丢失这么长的时间
+    FOCUS_RECORD_INTERVAL = 60000
+    
+    # 读取各标签页中用户脚本耗时的间隔（毫秒）
+    SCRIPT_TIMING_INTERVAL = 2000
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Rick浏览器")
@@ -56,22 +297,42 @@ class Browser(QMainWindow):
         # 设置应用图标
         self.setWindowIcon(QIcon(self.get_icon_path("browser.png")))
         
-        # 创建脚本注入器
+        # 创建脚本注入器（脚本在后台线程中加载，不阻塞窗口显示；
+        # 脚本文件变化时自动增量重新加载）
         self.script_injector = ScriptInjector()
+        self.script_injector.scriptsChanged.connect(self.handle_scripts_changed)
+        self.script_injector.storageChanged.connect(self.handle_storage_changed)
+        self.script_injector.scriptUpdated.connect(
+            lambda name, version: self.status_bar.showMessage(f"脚本 {name} 已更新到 {version}", 5000))
         
         # 存储新标签页的引用
         self.new_tab_pages = {}
         
+        # 每个网页视图最后记录到历史的网址规范键，只改变片段等不算新的访问
+        self.history_urls = {}
+        
+        # 当前标签页的停留时间段 (网址, 开始时间)，窗口不活动时为 None
+        self.focus_interval = None
+        
         # 视频播放器状态
         self.video_player = None
         self.video_detected = False
         
-        # 书签和历史记录
-        self.bookmarks = []
-        self.history = []
+        # 书签和历史记录（修改由后台线程合并后写入磁盘），按网址的规范键去重
+        self.persistence = PersistenceWorker()
+        self.canonicalizer = UrlCanonicalizer.load(Path("url_canonical.json"))
         self.load_bookmarks()
         self.load_history()
         
+        # 地址栏补全（索引在后台线程中加载和查询）
+        self.omnibox = OmniboxCompleter(self.history_store, self.bookmark_store.snapshot(), self)
+        
+        # 历史记录保留策略（空闲时在后台线程中整理）
+        self.historyPruned.connect(self.handle_history_pruned)
+        self.retention = RetentionWorker(self.history_store,
+                                         RetentionPolicy.load(Path("history_retention.json")),
+                                         self.historyPruned.emit)
+        
         # 下载管理
         self.downloads = []
         self.current_download = None
@@ -90,6 +351,18 @@ class Browser(QMainWindow):
         # 打开主页
         self.open_home_page()
         
+        # 定时记录当前标签页的停留时间
+        self.focus_timer = QTimer(self)
+        self.focus_timer.setInterval(self.FOCUS_RECORD_INTERVAL)
+        self.focus_timer.timeout.connect(self.update_focus)
+        self.focus_timer.start()
+        
+        # 定时读取页面主环境中的用户脚本耗时
+        self.script_timing_timer = QTimer(self)
+        self.script_timing_timer.setInterval(self.SCRIPT_TIMING_INTERVAL)
+        self.script_timing_timer.timeout.connect(self.collect_script_timings)
+        self.script_timing_timer.start()
+        
     def init_ui(self):
         """初始化用户界面"""
         # 创建中央部件
@@ -281,6 +554,7 @@ class Browser(QMainWindow):
             }
         """)
         nav_bar.addWidget(self.url_bar)
+        self.setup_omnibox()
         
         # 搜索按钮
         self.search_btn = QAction(QIcon(self.get_icon_path("search.png")), "搜索", self)
@@ -291,6 +565,7 @@ class Browser(QMainWindow):
         
         # 书签按钮
         self.bookmark_btn = QAction(QIcon(self.get_icon_path("bookmark.png")), "书签", self)
+        self.bookmark_btn.setCheckable(True)
         self.bookmark_btn.triggered.connect(self.toggle_bookmark)
         nav_bar.addAction(self.bookmark_btn)
         
@@ -382,6 +657,9 @@ class Browser(QMainWindow):
         """创建网页视图，配置HTML5播放器支持"""
         web_view = QWebEngineView()
         
+        # 使用自定义页面，在导航时注入用户脚本
+        web_view.setPage(BrowserPage(self, web_view))
+        
         # 获取页面对象
         page = web_view.page()
         
@@ -412,14 +690,19 @@ class Browser(QMainWindow):
         # 设置下载处理
         profile.downloadRequested.connect(self.handle_download_request)
         
+        # 为用户脚本建立与Python的通道（耗时统计等）
+        self.setup_script_channel(page)
+        
         # 设置初始URL
         if url:
             web_view.setUrl(QUrl(url))
         
         # 连接信号
         web_view.urlChanged.connect(self.update_url_bar)
+        web_view.urlChanged.connect(lambda url, view=web_view: self.record_navigation(view, url))
         web_view.loadStarted.connect(self.page_loading_started)
         web_view.loadFinished.connect(self.page_loading_finished)
+        web_view.loadFinished.connect(lambda ok, view=web_view: self.index_page_text(view, ok))
         web_view.loadProgress.connect(self.update_progress_bar)
         
         # 连接全屏信号
@@ -427,6 +710,7 @@ class Browser(QMainWindow):
         
         # 连接标题变化信号
         page.titleChanged.connect(self.update_tab_title)
+        page.titleChanged.connect(lambda title, view=web_view: self.record_title(view, title))
         
         return web_view
     
@@ -457,7 +741,7 @@ class Browser(QMainWindow):
         # 为页面设置WebChannel
         self.setup_web_channel(web_view.page())
         
-        # 为新标签页注入链接处理脚本
+        # 为新标签页注入链接处理脚本（离开新标签页时移除）
         self.inject_new_tab_script(web_view.page())
         
         # 记录这是新标签页
@@ -480,6 +764,97 @@ class Browser(QMainWindow):
         # 注入视频检测脚本
         self.inject_video_detection_script(page)
     
+    def setup_script_channel(self, page):
+        """在独立的 ApplicationWorld 中建立WebChannel，页面脚本无法直接访问
+        
+        收集脚本定时将同一环境中用户脚本的耗时经WebChannel转发给Python；
+        主环境（MainWorld）中用户脚本的耗时记录在文档创建时定义，由 collect_script_timings 读取，
+        不经过页面能看到或伪造的DOM事件。
+        使用 GM API 的用户脚本通过 window.__rickChannel 访问WebChannel
+        """
+        channel = QWebChannel(page)
+        channel.registerObject("browser", self.browser_bridge)
+        
+        # 页面独立的用户脚本通道
+        if getattr(page, 'script_bridge', None) is None:
+            page.script_bridge = ScriptBridge(self, page)
+        channel.registerObject("gm", page.script_bridge)
+        page.setWebChannel(channel, QWebEngineScript.ApplicationWorld)
+        
+        # 每个页面只插入一次
+        if page.scripts().findScript("rick:timing-store").isNull():
+            # 主环境的耗时记录，每个框架都要定义，以免页面在子框架中冒充记录
+            web_script = QWebEngineScript()
+            web_script.setName("rick:timing-store")
+            web_script.setSourceCode(self.script_injector.get_timing_store_source())
+            web_script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+            web_script.setWorldId(QWebEngineScript.MainWorld)
+            web_script.setRunsOnSubFrames(True)
+            page.scripts().insert(web_script)
+        
+        if page.scripts().findScript("rick:script-channel").isNull():
+            web_script = QWebEngineScript()
+            web_script.setName("rick:script-channel")
+            web_script.setSourceCode(self.get_web_channel_js()
+                                     + self.script_injector.get_timing_store_source() + """
+            (function() {
+                var take = %s;
+                var bridge = null;
+                
+                // 批量转发本环境中用户脚本的耗时
+                function flush() {
+                    if (!bridge) return;
+                    var report = take();
+                    if (report) bridge.reportScriptTimings(report);
+                }
+                
+                new QWebChannel(qt.webChannelTransport, function(channel) {
+                    bridge = channel.objects.gm;
+                    window.__rickChannel = channel.objects;
+                    if (window.__rickGM) window.__rickGM.attach(channel.objects);
+                    flush();
+                });
+                setInterval(flush, 2000);
+                window.addEventListener('pagehide', flush);
+            })();
+            """ % ("function() { return %s; }" % self.script_injector.get_timing_take_source()))
+            web_script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+            web_script.setWorldId(QWebEngineScript.ApplicationWorld)
+            web_script.setRunsOnSubFrames(False)
+            page.scripts().insert(web_script)
+    
+    def get_web_channel_js(self):
+        """读取Qt内置的 qwebchannel.js"""
+        if not hasattr(self, 'web_channel_js'):
+            js_file = QFile(":/qtwebchannel/qwebchannel.js")
+            if js_file.open(QIODevice.ReadOnly):
+                self.web_channel_js = bytes(js_file.readAll()).decode('utf-8')
+                js_file.close()
+            else:
+                self.web_channel_js = ""
+        return self.web_channel_js
+    
+    def collect_script_timings(self):
+        """读取各标签页主环境中的用户脚本耗时"""
+        if not self.script_injector.telemetry_enabled:
+            return
+        source = self.script_injector.get_timing_take_source()
+        for index in range(self.tabs.count()):
+            web_view = self.tabs.widget(index)
+            if web_view is None or id(web_view) in self.new_tab_pages:
+                continue
+            page = web_view.page()
+            page.runJavaScript(source, QWebEngineScript.MainWorld,
+                               lambda result, page=page: self.handle_script_timings(result, page.url()))
+    
+    def handle_script_timings(self, payload, url):
+        """处理页面中读取到的用户脚本耗时"""
+        if not payload:
+            return
+        disabled = self.script_injector.record_timings(payload, url)
+        if disabled:
+            self.status_bar.showMessage(f"脚本超出耗时预算，已自动禁用: {', '.join(disabled)}", 5000)
+    
     def inject_video_detection_script(self, page):
         """注入视频检测脚本"""
         script = """
@@ -676,12 +1051,23 @@ class Browser(QMainWindow):
         
         # 创建并注入脚本
         web_script = QWebEngineScript()
+        web_script.setName("rick:new-tab")
         web_script.setSourceCode(script)
         web_script.setInjectionPoint(QWebEngineScript.DocumentCreation)
         web_script.setWorldId(QWebEngineScript.MainWorld)
         web_script.setRunsOnSubFrames(True)
         page.scripts().insert(web_script)
     
+    def leave_new_tab(self, web_view):
+        """标签页离开新标签页：移除新标签页的链接处理脚本，恢复用户脚本使用的WebChannel"""
+        del self.new_tab_pages[id(web_view)]
+        
+        page = web_view.page()
+        new_tab_script = page.scripts().findScript("rick:new-tab")
+        if not new_tab_script.isNull():
+            page.scripts().remove(new_tab_script)
+        self.setup_script_channel(page)
+    
     def handle_navigation_request(self, url):
         """处理JavaScript的导航请求"""
         print(f"处理导航请求: {url}")
@@ -690,7 +1076,7 @@ class Browser(QMainWindow):
             # 检查是否是新标签页
             if id(current_web_view) in self.new_tab_pages:
                 # 从新标签页中移除，因为现在要导航到实际网站
-                del self.new_tab_pages[id(current_web_view)]
+                self.leave_new_tab(current_web_view)
             
             # 更新标签页标题
             index = self.tabs.indexOf(current_web_view)
@@ -716,20 +1102,44 @@ class Browser(QMainWindow):
         # 检查是否是新标签页
         if id(web_view) in self.new_tab_pages:
             # 从新标签页中移除，因为现在要导航到实际网站
-            del self.new_tab_pages[id(web_view)]
+            self.leave_new_tab(web_view)
             
             # 更新标签页标题
             index = self.tabs.indexOf(web_view)
             if index >= 0:
                 self.tabs.setTabText(index, "加载中...")
     
-    def inject_scripts_to_page(self, page):
+    def inject_scripts_to_page(self, page, url=None):
         """注入脚本到页面"""
         try:
-            self.script_injector.inject_to_page(page)
+            self.script_injector.inject_to_page(page, url)
         except Exception as e:
             print(f"注入脚本时出错: {e}")
     
+    def handle_scripts_changed(self):
+        """脚本变化后同步所有标签页，下次加载时生效"""
+        for index in range(self.tabs.count()):
+            web_view = self.tabs.widget(index)
+            if web_view:
+                self.inject_scripts_to_page(web_view.page(), web_view.page().script_url)
+    
+    def handle_storage_changed(self, origin, changes):
+        """GM 存储变化后重新同步各标签页的授权脚本包（之后创建的文档得到新值，
+        包括写入后立即重新加载的页面），并把变化发给其他已打开的页面"""
+        for index in range(self.tabs.count()):
+            web_view = self.tabs.widget(index)
+            if not web_view:
+                continue
+            page = web_view.page()
+            self.inject_scripts_to_page(page, page.script_url)
+            
+            bridge = getattr(page, 'script_bridge', None)
+            if bridge is None or bridge.key == origin:
+                continue
+            page_changes = self.script_injector.filter_storage_changes(changes, page.url())
+            if page_changes:
+                bridge.storageChanged.emit(json.dumps(page_changes, ensure_ascii=False))
+    
     def open_home_page(self):
         """打开主页（新标签页）"""
         self.open_new_tab()
@@ -745,6 +1155,7 @@ class Browser(QMainWindow):
             web_view_id = id(web_view)
             if web_view_id in self.new_tab_pages:
                 del self.new_tab_pages[web_view_id]
+            self.history_urls.pop(web_view_id, None)
             self.tabs.removeTab(index)
         else:
             self.close()
@@ -757,6 +1168,7 @@ class Browser(QMainWindow):
                 self.update_url_bar(web_view.url())
                 # 检查是否有视频
                 self.check_for_video(web_view)
+        self.update_focus()
     
     def check_for_video(self, web_view):
         """检查页面是否有视频元素"""
@@ -789,15 +1201,55 @@ class Browser(QMainWindow):
         if current_web_view:
             current_web_view.reload()
     
+    def setup_omnibox(self):
+        """为地址栏设置补全弹出列表（只用 setWidget，由补全结果信号控制弹出）"""
+        self.omnibox_model = OmniboxModel(self)
+        self.url_completer = QCompleter(self.omnibox_model, self)
+        self.url_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.url_completer.setCompletionRole(Qt.EditRole)
+        self.url_completer.setMaxVisibleItems(OmniboxCompleter.RESULT_LIMIT)
+        self.url_completer.setWidget(self.url_bar)
+        self.url_completer.activated[str].connect(self.handle_omnibox_activated)
+        
+        # 回车由 eventFilter 处理：有选中项时打开选中的网址，否则打开输入的内容
+        self.url_completer.popup().installEventFilter(self)
+        
+        self.url_bar.textEdited.connect(self.omnibox.complete)
+        self.omnibox.resultsReady.connect(self.show_omnibox_results)
+    
+    def show_omnibox_results(self, query, results):
+        """显示补全结果（输入已变化时丢弃过期的结果）"""
+        if query != self.url_bar.text() or not self.url_bar.hasFocus():
+            return
+        self.omnibox_model.set_results(results)
+        if results:
+            self.url_completer.complete()
+        else:
+            self.url_completer.popup().hide()
+    
+    def handle_omnibox_activated(self, url):
+        """点击补全结果"""
+        self.url_bar.setText(url)
+        self.navigate_to_url()
+    
+    def eventFilter(self, obj, event):
+        """补全列表显示时的回车"""
+        if (obj is self.url_completer.popup() and event.type() == QEvent.KeyPress
+                and event.key() in (Qt.Key_Return, Qt.Key_Enter)):
+            selected = obj.selectionModel().selectedIndexes()
+            obj.hide()
+            if selected:
+                self.url_bar.setText(selected[0].data(Qt.EditRole))
+            self.navigate_to_url()
+            return True
+        return super().eventFilter(obj, event)
+    
     def navigate_to_url(self):
         """导航到地址栏中的URL"""
         url_text = self.url_bar.text()
         
         if not url_text:
             return
-            
-        # 添加到历史记录
-        self.add_to_history(url_text)
         
         # 如果不是以http/https开头，添加https://
         if not url_text.startswith(("http://", "https://", "file://")):
@@ -811,9 +1263,6 @@ class Browser(QMainWindow):
         """使用Bing搜索"""
         search_text = self.url_bar.text()
         if search_text:
-            # 添加到历史记录
-            self.add_to_history(f"搜索: {search_text}")
-            
             # 如果是URL，直接导航
             if search_text.startswith(("http://", "https://", "file://")):
                 self.navigate_to_url()
@@ -829,6 +1278,13 @@ class Browser(QMainWindow):
         current_web_view = self.tabs.currentWidget()
         if current_web_view and current_web_view.url() == url:
             self.url_bar.setText(url.toString())
+            self.update_bookmark_button(url.toString())
+    
+    def update_bookmark_button(self, url):
+        """按当前网址是否已收藏更新书签按钮（哈希索引查找）"""
+        bookmarked = self.bookmark_store.contains(url)
+        self.bookmark_btn.setChecked(bookmarked)
+        self.bookmark_btn.setToolTip("从书签移除" if bookmarked else "添加到书签")
     
     def update_tab_title(self, title):
         """更新标签页标题"""
@@ -858,12 +1314,10 @@ class Browser(QMainWindow):
             self.status_bar.showMessage("完成")
             self.progress_bar.setVisible(False)
             
-            # 注入脚本到当前页面（除了新标签页）
+            # 检查当前页面是否有视频（除了新标签页）
+            # 用户脚本已在导航开始时由 BrowserPage 注入
             current_web_view = self.tabs.currentWidget()
             if current_web_view and id(current_web_view) not in self.new_tab_pages:
-                self.inject_scripts_to_page(current_web_view.page())
-                
-                # 检查是否有视频
                 self.check_for_video(current_web_view)
         else:
             self.status_bar.showMessage("加载失败")
@@ -1016,13 +1470,13 @@ class Browser(QMainWindow):
             url = current_web_view.url().toString()
             title = current_web_view.page().title()
             
-            # 检查是否已收藏
-            for bookmark in self.bookmarks:
-                if bookmark['url'] == url:
-                    self.bookmarks.remove(bookmark)
-                    self.save_bookmarks()
-                    self.status_bar.showMessage("已从书签移除", 3000)
-                    return
+            # 已收藏则移除
+            if self.bookmark_store.remove(url):
+                self.save_bookmarks()
+                self.omnibox.set_bookmarked(url, False)
+                self.update_bookmark_button(url)
+                self.status_bar.showMessage("已从书签移除", 3000)
+                return
             
             # 添加书签
             bookmark = {
@@ -1030,62 +1484,123 @@ class Browser(QMainWindow):
                 'title': title,
                 'time': time.time()
             }
-            self.bookmarks.append(bookmark)
+            self.bookmark_store.add(bookmark)
             self.save_bookmarks()
+            self.omnibox.set_bookmarked(url, True, title)
+            self.update_bookmark_button(url)
             self.status_bar.showMessage("已添加到书签", 3000)
     
     def load_bookmarks(self):
         """加载书签"""
+        bookmarks = []
         bookmark_file = Path("bookmarks.json")
         if bookmark_file.exists():
             try:
                 with open(bookmark_file, 'r', encoding='utf-8') as f:
-                    self.bookmarks = json.load(f)
+                    bookmarks = json.load(f)
             except:
-                self.bookmarks = []
+                bookmarks = []
+        self.bookmark_store = BookmarkStore(bookmarks if isinstance(bookmarks, list) else [],
+                                            self.canonicalizer)
     
     def save_bookmarks(self):
-        """保存书签"""
-        bookmark_file = Path("bookmarks.json")
-        try:
-            with open(bookmark_file, 'w', encoding='utf-8') as f:
-                json.dump(self.bookmarks, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+        """保存书签（提交快照给后台线程，短时间内的多次修改只写入一次）"""
+        self.persistence.write_json(Path("bookmarks.json"), self.bookmark_store.snapshot())
     
     def load_history(self):
-        """加载历史记录"""
-        history_file = Path("history.json")
-        if history_file.exists():
-            try:
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    self.history = json.load(f)
-            except:
-                self.history = []
+        """打开历史记录数据库（首次运行时导入旧的 history.json）"""
+        self.history_store = HistoryStore(Path("history.sqlite3"), self.canonicalizer)
+        self.history_store.migrate_json(Path("history.json"))
+        self.page_index = PageIndex(self.history_store)
     
-    def save_history(self):
-        """保存历史记录"""
-        history_file = Path("history.json")
-        try:
-            with open(history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, ensure_ascii=False, indent=2)
-        except:
-            pass
-    
-    def add_to_history(self, url):
-        """添加到历史记录"""
-        history_item = {
-            'url': url,
-            'time': time.time(),
-            'title': url
-        }
-        self.history.insert(0, history_item)
-        
-        # 限制历史记录数量
-        if len(self.history) > 100:
-            self.history = self.history[:100]
-        
-        self.save_history()
+    def record_navigation(self, web_view, url):
+        """记录网页视图中已提交的导航（链接、新标签页快捷链接、书签和地址栏输入）"""
+        url_str = url.toString()
+        if url.scheme() not in ("http", "https", "file"):
+            return
+        key = self.canonicalizer.canonicalize(url_str)
+        if self.history_urls.get(id(web_view)) == key:
+            return
+        self.history_urls[id(web_view)] = key
+        self.retention.notify_activity()
+        self.add_to_history(url_str)
+        if web_view is self.tabs.currentWidget():
+            self.update_focus()
+    
+    def record_title(self, web_view, title):
+        """页面标题变化时更新对应历史记录的标题"""
+        # 标题可能先于 urlChanged 到达，先记录当前网址的访问
+        url = web_view.url()
+        self.record_navigation(web_view, url)
+        url_str = url.toString()
+        if self.history_urls.get(id(web_view)) != self.canonicalizer.canonicalize(url_str):
+            return
+        # 标题未加载时 QtWebEngine 会以网址作为标题
+        if not title or title == url_str or url_str.endswith("://" + title):
+            return
+        self.persistence.append("history", ('title', url_str, title),
+                                self.history_store.apply_changes)
+        self.omnibox.set_title(url_str, title)
+    
+    def update_focus(self):
+        """结束当前的停留时间段，按当前标签页开始新的时间段（窗口不活动时不计时）"""
+        self.end_focus()
+        web_view = self.tabs.currentWidget() if self.isActiveWindow() else None
+        if web_view is None or id(web_view) in self.new_tab_pages:
+            return
+        url = web_view.url()
+        if url.scheme() in ("http", "https", "file"):
+            self.focus_interval = (url.toString(), time.time())
+    
+    def end_focus(self):
+        """将当前的停留时间段交给后台线程，随历史记录批量计入汇总表"""
+        if self.focus_interval is None:
+            return
+        url, start = self.focus_interval
+        self.focus_interval = None
+        end = time.time()
+        if end - start >= 1:
+            self.persistence.append("history", ('focus', url, start, end),
+                                    self.history_store.apply_changes)
+    
+    def changeEvent(self, event):
+        """窗口激活状态变化时开始或结束计时"""
+        if event.type() == QEvent.ActivationChange and hasattr(self, 'tabs'):
+            self.update_focus()
+        super().changeEvent(event)
+    
+    def index_page_text(self, web_view, ok):
+        """页面加载完成后提取文本，交给后台线程写入全文索引"""
+        url = web_view.url()
+        if not ok or not self.page_index.available or id(web_view) in self.new_tab_pages:
+            return
+        if url.scheme() not in ("http", "https", "file"):
+            return
+        url_str, title = url.toString(), web_view.title()
+        web_view.page().toPlainText(lambda text: self.handle_page_text(url_str, title, text))
+    
+    def handle_page_text(self, url, title, text):
+        """收到页面文本（截断到上限，分词和写入在后台线程中进行）"""
+        text = text.strip()[:PageIndex.TEXT_LIMIT]
+        if text:
+            self.persistence.append("page-text", (url, title, text), self.page_index.add_pages)
+    
+    def add_to_history(self, url, title=None):
+        """添加到历史记录（访问和标题修改由后台线程合并后批量写入）"""
+        visit_time = time.time()
+        self.persistence.append("history", ('visit', url, title, visit_time),
+                                self.history_store.apply_changes)
+        self.omnibox.add_visit(url, title, visit_time)
+    
+    def handle_history_pruned(self, report, removed_urls, counts):
+        """历史记录整理完成后更新地址栏补全"""
+        if removed_urls:
+            self.omnibox.remove_history(removed_urls)
+        if counts:
+            self.omnibox.update_history_counts(counts)
+        if report['visits'] or report['bytes']:
+            self.status_bar.showMessage(
+                f"已整理历史记录：删除 {report['visits']} 条访问，回收 {report['bytes'] / 1024:.0f} KB", 5000)
     
     def show_bookmarks(self):
         """显示书签对话框"""
@@ -1095,12 +1610,20 @@ class Browser(QMainWindow):
         
         layout = QVBoxLayout(dialog)
         
-        # 书签列表
-        bookmark_list = QListWidget()
-        for bookmark in self.bookmarks:
-            item = QListWidgetItem(bookmark['title'])
-            item.setData(Qt.UserRole, bookmark['url'])
-            bookmark_list.addItem(item)
+        # 搜索框：按标题和网址中的词即时过滤
+        search_box = QLineEdit()
+        search_box.setPlaceholderText("搜索书签...")
+        search_box.setClearButtonEnabled(True)
+        layout.addWidget(search_box)
+        
+        # 书签列表（模型/视图，只绘制可见行）
+        bookmark_model = BookmarkListModel(self.bookmark_store, dialog)
+        bookmark_list = QListView()
+        bookmark_list.setModel(bookmark_model)
+        bookmark_list.setUniformItemSizes(True)
+        bookmark_list.doubleClicked.connect(lambda: self.open_bookmark(bookmark_list, dialog))
+        search_box.textChanged.connect(
+            lambda text: bookmark_model.set_bookmarks(self.bookmark_store.search(text)))
         
         layout.addWidget(bookmark_list)
         
@@ -1127,25 +1650,26 @@ class Browser(QMainWindow):
     
     def open_bookmark(self, bookmark_list, dialog):
         """打开选中的书签"""
-        current_item = bookmark_list.currentItem()
-        if current_item:
-            url = current_item.data(Qt.UserRole)
+        current_index = bookmark_list.currentIndex()
+        if current_index.isValid():
+            url = current_index.data(Qt.UserRole)
             self.add_tab(url=url)
             dialog.close()
     
     def delete_bookmark(self, bookmark_list):
         """删除选中的书签"""
-        current_item = bookmark_list.currentItem()
-        if current_item:
-            url = current_item.data(Qt.UserRole)
-            for bookmark in self.bookmarks:
-                if bookmark['url'] == url:
-                    self.bookmarks.remove(bookmark)
-                    break
-            
+        current_index = bookmark_list.currentIndex()
+        if current_index.isValid():
+            url = current_index.data(Qt.UserRole)
+            self.bookmark_store.remove(url)
             self.save_bookmarks()
-            row = bookmark_list.row(current_item)
-            bookmark_list.takeItem(row)
+            self.omnibox.set_bookmarked(url, False)
+            bookmark_list.model().remove_row(current_index.row())
+            
+            # 删除的可能是当前页面的书签
+            current_web_view = self.tabs.currentWidget()
+            if current_web_view:
+                self.update_bookmark_button(current_web_view.url().toString())
     
     def show_history(self):
         """显示历史记录对话框"""
@@ -1155,24 +1679,36 @@ class Browser(QMainWindow):
         
         layout = QVBoxLayout(dialog)
         
-        # 历史记录表格
-        history_table = QTableWidget()
-        history_table.setColumnCount(3)
-        history_table.setHorizontalHeaderLabels(["标题", "网址", "访问时间"])
-        history_table.setRowCount(len(self.history))
-        
-        for i, item in enumerate(self.history):
-            title = item.get('title', '未知')
-            url = item.get('url', '')
-            visit_time = datetime.fromtimestamp(item.get('time', time.time())).strftime("%Y-%m-%d %H:%M:%S")
-            
-            history_table.setItem(i, 0, QTableWidgetItem(title))
-            history_table.setItem(i, 1, QTableWidgetItem(url))
-            history_table.setItem(i, 2, QTableWidgetItem(visit_time))
-        
-        history_table.resizeColumnsToContents()
+        # 过滤框：停止输入后才查询，按主机名/网址前缀走数据库索引
+        filter_box = QLineEdit()
+        filter_box.setPlaceholderText("按网站过滤（如 bing.com，或输入完整网址前缀）...")
+        filter_box.setClearButtonEnabled(True)
+        layout.addWidget(filter_box)
+        
+        # 历史记录表格（模型/视图，按需分页读取）
+        history_model = HistoryTableModel(self.history_store, dialog)
+        history_model.fetchMore()
+        history_table = QTableView()
+        history_table.setModel(history_model)
+        history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        history_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        history_table.setWordWrap(False)
+        history_table.verticalHeader().hide()
+        history_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        
+        # 固定列宽，不按内容计算
+        history_table.setColumnWidth(0, 240)
+        history_table.setColumnWidth(1, 280)
+        history_table.horizontalHeader().setStretchLastSection(True)
+        history_table.doubleClicked.connect(lambda: self.open_history_item(history_table, dialog))
         layout.addWidget(history_table)
         
+        filter_timer = QTimer(dialog)
+        filter_timer.setSingleShot(True)
+        filter_timer.setInterval(self.HISTORY_FILTER_DELAY)
+        filter_timer.timeout.connect(lambda: history_model.set_filter(filter_box.text()))
+        filter_box.textChanged.connect(lambda: filter_timer.start())
+        
         # 按钮
         btn_layout = QHBoxLayout()
         
@@ -1184,6 +1720,89 @@ class Browser(QMainWindow):
         clear_btn.clicked.connect(lambda: self.clear_history(history_table))
         btn_layout.addWidget(clear_btn)
         
+        prune_btn = QPushButton("立即整理")
+        prune_btn.setToolTip("按保留策略删除旧的访问并回收数据库空间")
+        prune_btn.clicked.connect(lambda: self.prune_history_now())
+        btn_layout.addWidget(prune_btn)
+        
+        btn_layout.addStretch()
+        
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(dialog.close)
+        btn_layout.addWidget(close_btn)
+        
+        layout.addLayout(btn_layout)
+        
+        dialog.exec_()
+    
+    def show_page_search(self):
+        """显示网页内容搜索对话框：按访问过的页面中的文字搜索"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("搜索历史内容")
+        dialog.setGeometry(200, 200, 900, 500)
+        
+        layout = QVBoxLayout(dialog)
+        
+        search_box = QLineEdit()
+        search_box.setPlaceholderText("搜索访问过的页面中的文字...")
+        search_box.setClearButtonEnabled(True)
+        layout.addWidget(search_box)
+        
+        status_label = QLabel()
+        layout.addWidget(status_label)
+        
+        result_model = PageSearchModel(dialog)
+        result_table = QTableView()
+        result_table.setModel(result_model)
+        result_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        result_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        result_table.setWordWrap(False)
+        result_table.verticalHeader().hide()
+        result_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        result_table.setColumnWidth(0, 200)
+        result_table.setColumnWidth(1, 450)
+        result_table.horizontalHeader().setStretchLastSection(True)
+        result_table.doubleClicked.connect(lambda: self.open_history_item(result_table, dialog))
+        layout.addWidget(result_table)
+        
+        def show_index_size():
+            try:
+                status_label.setText(f"已索引 {self.page_index.count_pages()} 个页面")
+            except Exception as e:
+                print(f"读取网页内容索引时出错: {e}")
+                status_label.clear()
+        
+        if not self.page_index.available:
+            search_box.setEnabled(False)
+            status_label.setText("当前的 SQLite 不支持全文索引（FTS5）")
+        else:
+            show_index_size()
+        
+        def run_search():
+            start = time.perf_counter()
+            try:
+                results = self.page_index.search(search_box.text())
+            except Exception as e:
+                print(f"搜索网页内容时出错: {e}")
+                results = []
+            result_model.set_results(results)
+            if search_box.text().strip():
+                status_label.setText(f"找到 {len(results)} 个页面（{(time.perf_counter() - start) * 1000:.0f} ms）")
+            else:
+                show_index_size()
+        
+        search_timer = QTimer(dialog)
+        search_timer.setSingleShot(True)
+        search_timer.setInterval(self.HISTORY_FILTER_DELAY)
+        search_timer.timeout.connect(run_search)
+        search_box.textChanged.connect(lambda: search_timer.start())
+        
+        btn_layout = QHBoxLayout()
+        
+        open_btn = QPushButton("打开")
+        open_btn.clicked.connect(lambda: self.open_history_item(result_table, dialog))
+        btn_layout.addWidget(open_btn)
+        
         btn_layout.addStretch()
         
         close_btn = QPushButton("关闭")
@@ -1194,22 +1813,123 @@ class Browser(QMainWindow):
         
         dialog.exec_()
     
+    @staticmethod
+    def format_duration(seconds):
+        """将秒数格式化为 x小时y分 / y分z秒"""
+        seconds = int(seconds)
+        if seconds >= 3600:
+            return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+        if seconds >= 60:
+            return f"{seconds // 60}分{seconds % 60}秒"
+        return f"{seconds}秒"
+    
+    def show_statistics(self):
+        """显示浏览统计：访问最多、停留最久的网站和每天的汇总（读取预先汇总的表）
+
+        对话框立即显示已写入的数据，当前的停留时间和待写入的访问写入后再刷新一次
+        """
+        self.update_focus()
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("浏览统计")
+        dialog.setGeometry(200, 200, 700, 550)
+        
+        layout = QVBoxLayout(dialog)
+        
+        # 时间范围和排序方式
+        controls = QHBoxLayout()
+        range_box = QComboBox()
+        for label, days in (("今天", 0), ("最近 7 天", 6), ("最近 30 天", 29), ("全部", None)):
+            range_box.addItem(label, days)
+        range_box.setCurrentIndex(1)
+        controls.addWidget(range_box)
+        order_box = QComboBox()
+        order_box.addItem("按停留时间", 'seconds')
+        order_box.addItem("按访问次数", 'visits')
+        controls.addWidget(order_box)
+        controls.addStretch()
+        layout.addLayout(controls)
+        
+        host_table = QTableWidget()
+        host_table.setColumnCount(3)
+        host_table.setHorizontalHeaderLabels(["网站", "访问次数", "停留时间"])
+        host_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        host_table.verticalHeader().hide()
+        host_table.setColumnWidth(0, 360)
+        host_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(host_table, 2)
+        
+        layout.addWidget(QLabel("每天"))
+        day_table = QTableWidget()
+        day_table.setColumnCount(3)
+        day_table.setHorizontalHeaderLabels(["日期", "访问次数", "停留时间"])
+        day_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        day_table.verticalHeader().hide()
+        day_table.setColumnWidth(0, 360)
+        day_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(day_table, 1)
+        
+        def fill(table, rows, first_column):
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                table.setItem(i, 0, QTableWidgetItem(row[first_column] or "（本地文件）"))
+                table.setItem(i, 1, QTableWidgetItem(str(row['visits'])))
+                table.setItem(i, 2, QTableWidgetItem(self.format_duration(row['seconds'])))
+        
+        def refresh():
+            days = range_box.currentData()
+            since = None if days is None else self.history_store.get_day(time.time() - days * 86400)
+            try:
+                hosts = self.history_store.get_top_hosts(order_box.currentData(), 50, since)
+                daily = self.history_store.get_daily_stats(
+                    since or self.history_store.get_day(time.time() - 29 * 86400))
+            except Exception as e:
+                print(f"读取浏览统计时出错: {e}")
+                hosts, daily = [], []
+            fill(host_table, hosts, 'host')
+            fill(day_table, daily, 'day')
+        
+        range_box.currentIndexChanged.connect(lambda: refresh())
+        order_box.currentIndexChanged.connect(lambda: refresh())
+        refresh()
+        
+        # 后台写入完成后刷新（不在GUI线程中等待写入）
+        self.statisticsFlushed.connect(refresh)
+        self.persistence.flush_async(self.statisticsFlushed.emit)
+        
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(dialog.close)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        
+        dialog.exec_()
+        self.statisticsFlushed.disconnect(refresh)
+    
     def open_history_item(self, history_table, dialog):
         """打开选中的历史记录"""
-        current_row = history_table.currentRow()
-        if current_row >= 0:
-            url = history_table.item(current_row, 1).text()
+        current_index = history_table.currentIndex()
+        if current_index.isValid():
+            url = current_index.data(Qt.UserRole)
             self.add_tab(url=url)
             dialog.close()
     
+    def prune_history_now(self):
+        """不等定时，立即开始一轮历史记录整理（在后台线程中进行，有删除时在状态栏报告）"""
+        self.retention.run_now()
+        self.status_bar.showMessage("正在后台整理历史记录（浏览器空闲时进行）", 5000)
+    
     def clear_history(self, history_table):
         """清空历史记录"""
         reply = QMessageBox.question(self, "确认", "确定要清空所有历史记录吗？",
                                    QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            self.history.clear()
-            self.save_history()
-            history_table.setRowCount(0)
+            self.persistence.replace("history-clear", self.history_store.clear)
+            self.omnibox.clear()
+            history_table.model().clear()
+            # 清空后各标签页的下一次导航（包括重新加载）都算新的访问
+            self.history_urls.clear()
     
     def handle_download_request(self, download):
         """处理下载请求"""
@@ -1687,6 +2407,14 @@ class Browser(QMainWindow):
         history_action.triggered.connect(self.show_history)
         menu.addAction(history_action)
         
+        page_search_action = QAction("搜索历史内容", self)
+        page_search_action.triggered.connect(self.show_page_search)
+        menu.addAction(page_search_action)
+        
+        statistics_action = QAction("浏览统计", self)
+        statistics_action.triggered.connect(self.show_statistics)
+        menu.addAction(statistics_action)
+        
         # 下载
         download_action = QAction("下载", self)
         download_action.triggered.connect(self.show_downloads)
@@ -1749,7 +2477,7 @@ class Browser(QMainWindow):
         """管理脚本对话框"""
         dialog = QDialog(self)
         dialog.setWindowTitle("脚本管理")
-        dialog.setGeometry(200, 200, 600, 400)
+        dialog.setGeometry(200, 200, 760, 480)
         dialog.setStyleSheet("""
             QDialog {
                 background-color: white;
@@ -1758,20 +2486,19 @@ class Browser(QMainWindow):
                 color: #333;
                 font-weight: bold;
             }
-            QListWidget {
+            QTreeWidget {
                 border: 1px solid #ccc;
                 border-radius: 4px;
                 background-color: white;
                 alternate-background-color: #f9f9f9;
             }
-            QListWidget::item {
-                padding: 8px;
+            QTreeWidget::item {
+                padding: 6px;
                 border-bottom: 1px solid #f0f0f0;
             }
-            QListWidget::item:selected {
+            QTreeWidget::item:selected {
                 background-color: #2196F3;
                 color: white;
-                border-radius: 3px;
             }
             QPushButton {
                 background-color: #f0f0f0;
@@ -1791,18 +2518,46 @@ class Browser(QMainWindow):
         
         layout = QVBoxLayout(dialog)
         
-        # 脚本列表
-        script_list = QListWidget()
-        scripts = self.script_injector.get_script_list()
-        for script in scripts:
-            script_list.addItem(script)
+        # 脚本列表（展开可查看按主机的耗时统计）
+        script_list = QTreeWidget()
+        script_list.setColumnCount(5)
+        script_list.setHeaderLabels(["脚本 / 主机", "状态", "页面数", "p50 (ms)", "p95 (ms)"])
+        script_list.setAlternatingRowColors(True)
+        self.fill_script_list(script_list)
         
         layout.addWidget(QLabel("当前脚本文件夹中的脚本:"))
         layout.addWidget(script_list)
         
+        # 耗时预算设置
+        budget_layout = QHBoxLayout()
+        
+        auto_disable_check = QCheckBox("超出每页耗时预算时自动禁用脚本")
+        auto_disable_check.setChecked(self.script_injector.auto_disable)
+        auto_disable_check.toggled.connect(
+            lambda checked: setattr(self.script_injector, 'auto_disable', checked)
+        )
+        budget_layout.addWidget(auto_disable_check)
+        
+        budget_spin = QSpinBox()
+        budget_spin.setRange(10, 10000)
+        budget_spin.setSingleStep(50)
+        budget_spin.setSuffix(" ms")
+        budget_spin.setValue(self.script_injector.cpu_budget_ms)
+        budget_spin.valueChanged.connect(
+            lambda value: setattr(self.script_injector, 'cpu_budget_ms', value)
+        )
+        budget_layout.addWidget(budget_spin)
+        budget_layout.addStretch()
+        
+        layout.addLayout(budget_layout)
+        
         # 按钮
         btn_layout = QHBoxLayout()
         
+        toggle_btn = QPushButton("⏯ 启用/禁用")
+        toggle_btn.clicked.connect(lambda: self.toggle_selected_script(script_list))
+        btn_layout.addWidget(toggle_btn)
+        
         open_folder_btn = QPushButton("📂 打开脚本文件夹")
         open_folder_btn.clicked.connect(self.open_scripts_folder)
         btn_layout.addWidget(open_folder_btn)
@@ -1811,6 +2566,10 @@ class Browser(QMainWindow):
         refresh_btn.clicked.connect(lambda: self.refresh_script_list(script_list))
         btn_layout.addWidget(refresh_btn)
         
+        update_btn = QPushButton("⬆ 检查更新")
+        update_btn.clicked.connect(self.check_script_updates)
+        btn_layout.addWidget(update_btn)
+        
         btn_layout.addStretch()
         
         close_btn = QPushButton("❌ 关闭")
@@ -1827,12 +2586,56 @@ class Browser(QMainWindow):
         if os.path.exists(scripts_path):
             QDesktopServices.openUrl(QUrl.fromLocalFile(scripts_path))
     
+    def check_script_updates(self):
+        """立即在后台检查全部脚本的更新"""
+        count = self.script_injector.check_updates(force=True)
+        if count:
+            self.status_bar.showMessage(f"正在检查 {count} 个脚本的更新", 3000)
+        else:
+            self.status_bar.showMessage("没有可检查更新的脚本", 3000)
+    
     def refresh_script_list(self, script_list):
         """刷新脚本列表"""
+        self.script_injector.reload_scripts()
+        self.fill_script_list(script_list)
+    
+    def fill_script_list(self, script_list):
+        """填充脚本列表及耗时统计"""
         script_list.clear()
-        scripts = self.script_injector.get_script_list()
-        for script in scripts:
-            script_list.addItem(script)
+        
+        def stat_columns(stats):
+            if stats is None:
+                return ["-", "-", "-"]
+            count, p50, p95 = stats
+            return [str(count), f"{p50:.1f}", f"{p95:.1f}"]
+        
+        for script, stats, host_rows in self.script_injector.get_script_stats():
+            status = "已启用" if script['enabled'] else "已禁用"
+            item = QTreeWidgetItem([script['name'], status] + stat_columns(stats))
+            item.setData(0, Qt.UserRole, script['id'])
+            
+            for host, host_stats in host_rows:
+                item.addChild(QTreeWidgetItem([host or "(本地)", ""] + stat_columns(host_stats)))
+            
+            script_list.addTopLevelItem(item)
+        
+        script_list.resizeColumnToContents(0)
+    
+    def toggle_selected_script(self, script_list):
+        """启用或禁用选中的脚本"""
+        item = script_list.currentItem()
+        if item is None:
+            return
+        
+        # 选中主机行时操作其所属脚本
+        if item.parent() is not None:
+            item = item.parent()
+        
+        script_id = item.data(0, Qt.UserRole)
+        script = self.script_injector.scripts_by_id.get(script_id)
+        if script is not None:
+            self.script_injector.set_script_enabled(script_id, not script['enabled'])
+            self.fill_script_list(script_list)
     
     def show_about_dialog(self):
         """显示关于对话框"""
@@ -2041,9 +2844,16 @@ class Browser(QMainWindow):
     
     def closeEvent(self, event):
         """关闭事件"""
-        # 保存书签和历史记录
-        self.save_bookmarks()
-        self.save_history()
+        # 写入剩余的书签、历史记录修改和停留时间，关闭历史记录数据库
+        self.focus_timer.stop()
+        self.end_focus()
+        self.retention.close()
+        self.omnibox.close()
+        self.persistence.close()
+        self.history_store.close()
+        
+        # 提交用户脚本存储
+        self.script_injector.close()
         event.accept()
 
 def main():
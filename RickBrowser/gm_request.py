@@ -0,0 +1,212 @@
+"""
+GM_xmlhttpRequest 后端
+用户脚本的跨域请求由共享的 requests.Session 发出（按主机复用连接池并保持长连接），
+在有上限的线程池中执行；响应正文按块回传，大文件不会拼接成一个巨大的字符串
+"""
+
+import base64
+import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_session(pool_hosts=16, pool_size=8):
+    """创建共享的HTTP会话：每个主机最多保留 pool_size 个长连接
+
+    会话只共享连接池，不保存Cookie：各脚本、依赖下载和更新检查共用一个会话，
+    一个请求收到的Cookie不能随其他请求发出（同一请求的重定向之间仍然保留）
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=()))
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def connect_allowed(host, rules, page_host=None):
+    """按 @connect 规则检查目标主机，没有规则时允许"""
+    if not rules:
+        return True
+
+    host = host.lower()
+    for rule in rules:
+        rule = rule.strip().lower()
+        if rule == '*':
+            return True
+        if rule == 'self':
+            rule = (page_host or '').lower()
+        if rule and (host == rule or host.endswith('.' + rule)):
+            return True
+    return False
+
+
+class GMRequestService:
+    """在线程池中执行用户脚本的HTTP请求
+
+    事件通过 on_event(请求键, 事件类型, 数据) 回调报告（在工作线程中调用）：
+        start   {status, statusText, responseHeaders, finalUrl, total}
+        chunk   {data, loaded}（二进制响应的 data 为 base64）
+        load    {loaded}
+        error   {error}
+        timeout {}
+    被中止的请求不再报告事件。
+    """
+
+    ALLOWED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS')
+
+    # 每块响应的字节数
+    CHUNK_SIZE = 64 * 1024
+
+    # 单个响应的大小上限
+    MAX_RESPONSE_BYTES = 32 * 1024 * 1024
+
+    # 未指定超时时使用的连接/读取超时（秒）
+    DEFAULT_TIMEOUT = 30
+
+    def __init__(self, session=None, max_workers=6, on_event=None):
+        self.session = session or create_session(pool_size=max_workers)
+        self.on_event = on_event
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="gm-request")
+        self.lock = threading.Lock()
+
+        # 进行中的请求键 -> 中止标记
+        self.active = {}
+
+    def open(self, key, request):
+        """提交请求
+
+        request 为 {method, url, headers, cookie, data, timeout(毫秒), binary}，
+        只发送 headers 和 cookie 中明确指定的Cookie；参数无效时抛出 ValueError
+        """
+        method = str(request.get('method') or 'GET').upper()
+        if method not in self.ALLOWED_METHODS:
+            raise ValueError(f"不支持的请求方法: {method}")
+
+        url = str(request.get('url') or '')
+        if not url.lower().startswith(('http://', 'https://')):
+            raise ValueError(f"只支持 http/https 请求: {url}")
+
+        headers = request.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise ValueError("headers 必须是对象")
+        headers = {str(name): str(value) for name, value in headers.items()}
+        if request.get('cookie'):
+            headers['Cookie'] = str(request['cookie'])
+
+        cancelled = threading.Event()
+        with self.lock:
+            if key in self.active:
+                raise ValueError(f"请求 {key} 已存在")
+            self.active[key] = cancelled
+
+        self.executor.submit(self._run, key, cancelled, method, url, headers,
+                             request.get('data'),
+                             request.get('timeout') or 0,
+                             bool(request.get('binary')))
+
+    def abort(self, key):
+        """中止请求（下一块数据到达时关闭连接）"""
+        with self.lock:
+            cancelled = self.active.pop(key, None)
+        if cancelled is not None:
+            cancelled.set()
+
+    def _emit(self, key, cancelled, event, data):
+        """报告事件（已中止的请求不报告）"""
+        if not cancelled.is_set() and self.on_event:
+            self.on_event(key, event, data)
+
+    def _run(self, key, cancelled, method, url, headers, data, timeout_ms, binary):
+        """工作线程：发送请求并按块回传响应"""
+        if cancelled.is_set():
+            return
+
+        timeout = timeout_ms / 1000 if timeout_ms > 0 else self.DEFAULT_TIMEOUT
+        try:
+            try:
+                response = self.session.request(
+                    method, url, headers=headers,
+                    data=data.encode('utf-8') if isinstance(data, str) else None,
+                    timeout=timeout, stream=True)
+            except requests.Timeout:
+                self._emit(key, cancelled, 'timeout', {})
+                return
+            except requests.RequestException as e:
+                self._emit(key, cancelled, 'error', {'error': str(e)})
+                return
+
+            try:
+                self._stream(key, cancelled, response, binary)
+            except requests.Timeout:
+                self._emit(key, cancelled, 'timeout', {})
+            except (requests.RequestException, ValueError) as e:
+                self._emit(key, cancelled, 'error', {'error': str(e)})
+            finally:
+                response.close()
+        finally:
+            with self.lock:
+                self.active.pop(key, None)
+
+    def _stream(self, key, cancelled, response, binary):
+        """回传响应头和响应正文"""
+        total = response.headers.get('Content-Length')
+        self._emit(key, cancelled, 'start', {
+            'status': response.status_code,
+            'statusText': response.reason or '',
+            'responseHeaders': ''.join(f"{name}: {value}\r\n"
+                                       for name, value in response.headers.items()),
+            'finalUrl': response.url,
+            'total': int(total) if total and total.isdigit() else 0
+        })
+
+        decoder = None
+        if not binary:
+            decoder = codecs.getincrementaldecoder(self.get_encoding(response))(errors='replace')
+
+        loaded = 0
+        for chunk in response.iter_content(self.CHUNK_SIZE):
+            if cancelled.is_set():
+                return
+            loaded += len(chunk)
+            if loaded > self.MAX_RESPONSE_BYTES:
+                raise ValueError(f"响应超过 {self.MAX_RESPONSE_BYTES} 字节")
+
+            if binary:
+                text = base64.b64encode(chunk).decode('ascii')
+            else:
+                text = decoder.decode(chunk)
+            self._emit(key, cancelled, 'chunk', {'data': text, 'loaded': loaded})
+
+        if decoder is not None:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                self._emit(key, cancelled, 'chunk', {'data': tail, 'loaded': loaded})
+
+        self._emit(key, cancelled, 'load', {'loaded': loaded})
+
+    @staticmethod
+    def get_encoding(response):
+        """响应文本的编码：与XHR一样，未声明 charset 时使用 UTF-8"""
+        content_type = response.headers.get('Content-Type', '')
+        encoding = 'utf-8'
+        if 'charset=' in content_type.lower():
+            encoding = response.encoding or 'utf-8'
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'utf-8'
+        return encoding
+
+    def shutdown(self):
+        """中止全部请求并停止线程池"""
+        with self.lock:
+            for cancelled in self.active.values():
+                cancelled.set()
+            self.active.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,207 @@
+"""
+历史记录保留策略
+按最长保留时间、最多访问条数删除旧的访问记录，对较旧的访问按网站降采样，
+然后删除没有访问记录的网址并回收数据库空间；
+在后台线程中空闲时分小步执行，每步一个短事务，GUI线程不等待
+"""
+
+import json
+import math
+import threading
+import time
+from pathlib import Path
+
+
+class RetentionPolicy:
+    """保留策略设置，值为 0 表示不启用该项"""
+
+    DEFAULTS = {
+        'max_age_days': 365,                # 删除超过这么多天的访问
+        'max_visits': 500000,               # 访问记录最多保留的条数
+        'downsample_after_days': 90,        # 超过这么多天的访问进行降采样
+        'downsample_interval_hours': 24     # 降采样后每个网站每个时间段只保留一次访问
+    }
+
+    def __init__(self, **settings):
+        for name, default in self.DEFAULTS.items():
+            value = settings.get(name, default)
+            setattr(self, name, value if isinstance(value, (int, float)) and value > 0 else 0)
+
+    @classmethod
+    def load(cls, path):
+        """从 JSON 文件读取设置，文件不存在或无效时使用默认值"""
+        path = Path(path)
+        settings = {}
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    settings = json.load(f)
+            except Exception as e:
+                print(f"读取 {path} 时出错: {e}")
+            if not isinstance(settings, dict):
+                settings = {}
+        return cls(**settings)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.DEFAULTS}
+
+
+class RetentionWorker:
+    """在空闲时执行保留策略的后台线程
+
+    浏览器有活动（notify_activity）时暂停，空闲 IDLE_DELAY 秒后从暂停处继续；
+    每轮结束后调用 on_finished(报告, 被删除的网址列表, 访问次数有变化的网址 {网址: (访问次数, 最后访问时间)})
+    （在后台线程中调用）
+    """
+
+    # 启动后第一次执行前等待的时间（秒）
+    STARTUP_DELAY = 60
+
+    # 两轮之间的间隔（秒）
+    RUN_INTERVAL = 6 * 3600
+
+    # 最后一次活动后这么久才算空闲（秒）
+    IDLE_DELAY = 30
+
+    # 每步删除的访问数、检查的网址数和回收的页数
+    CHUNK_SIZE = 2000
+    VACUUM_PAGES = 256
+
+    # 每步之后让出的时间（秒），让写入历史记录的线程及时拿到锁
+    STEP_PAUSE = 0.05
+
+    # 降采样时每次处理的时间段个数
+    DOWNSAMPLE_SLICE = 7
+
+    def __init__(self, history_store, policy=None, on_finished=None):
+        self.history_store = history_store
+        self.policy = policy or RetentionPolicy()
+        self.on_finished = on_finished
+        self.condition = threading.Condition()
+
+        self.last_activity = time.monotonic()
+        self.next_run = time.monotonic() + self.STARTUP_DELAY
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+        self.thread.start()
+
+    def notify_activity(self):
+        """浏览器有活动，暂停正在执行的整理"""
+        with self.condition:
+            self.last_activity = time.monotonic()
+
+    def run_now(self):
+        """空闲时立即开始一轮整理"""
+        with self.condition:
+            self.next_run = time.monotonic()
+            self.condition.notify_all()
+
+    def close(self, timeout=5):
+        """停止后台线程（正在执行的整理在当前一步结束后停止）"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def _wait_idle(self, due=None):
+        """等待到 due 之后且浏览器空闲，返回 False 表示已关闭"""
+        with self.condition:
+            while not self.closed:
+                now = time.monotonic()
+                wake = max(due or now, self.last_activity + self.IDLE_DELAY)
+                if wake <= now:
+                    return True
+                self.condition.wait(wake - now)
+            return False
+
+    def _run(self):
+        """后台线程：到时间且空闲时执行一轮，每步之前检查是否仍然空闲"""
+        while self._wait_idle(self.next_run):
+            report = {'visits': 0, 'urls': 0, 'bytes': 0, 'seconds': 0.0}
+            removed_urls = []
+            counts = {}
+            try:
+                start = time.perf_counter()
+                size_before = self.history_store.get_file_size()
+                for _ in self.steps(report, removed_urls, counts):
+                    time.sleep(self.STEP_PAUSE)
+                    if not self._wait_idle():
+                        return
+                self.history_store.checkpoint()
+                report['bytes'] = max(0, size_before - self.history_store.get_file_size())
+                report['seconds'] = time.perf_counter() - start
+            except Exception as e:
+                print(f"整理历史记录时出错: {e}")
+
+            print(f"历史记录整理: 删除 {report['visits']} 条访问、{report['urls']} 个网址，"
+                  f"回收 {report['bytes'] / 1024:.0f} KB，耗时 {report['seconds']:.1f} 秒")
+            for url in removed_urls:
+                counts.pop(url, None)
+            if self.on_finished is not None:
+                self.on_finished(report, removed_urls, counts)
+
+            with self.condition:
+                self.next_run = time.monotonic() + self.RUN_INTERVAL
+
+    def steps(self, report, removed_urls, counts):
+        """按保留策略依次执行的各步（生成器，每步是一个短事务）
+
+        删除访问的同时更新网址的访问次数，有变化的网址记入 counts
+        """
+        store, policy = self.history_store, self.policy
+        now = time.time()
+
+        if policy.max_age_days:
+            cutoff = now - policy.max_age_days * 86400
+            while True:
+                deleted, changed = store.delete_visits_before(cutoff, self.CHUNK_SIZE)
+                report['visits'] += deleted
+                counts.update(changed)
+                yield
+                if deleted < self.CHUNK_SIZE:
+                    break
+            store.delete_daily_stats_before(store.get_day(cutoff))
+            yield
+
+        if policy.max_visits:
+            while True:
+                deleted, changed = store.delete_excess_visits(policy.max_visits, self.CHUNK_SIZE)
+                report['visits'] += deleted
+                counts.update(changed)
+                yield
+                if deleted < self.CHUNK_SIZE:
+                    break
+
+        if policy.downsample_after_days and policy.downsample_interval_hours:
+            interval = policy.downsample_interval_hours * 3600
+            cutoff = now - policy.downsample_after_days * 86400
+            # 时间段按 interval 对齐，同一时间段不会被拆到两次处理中
+            end_limit = math.floor(cutoff / interval) * interval
+            # 上一轮已处理到的时间之前不再扫描，每轮只处理新变旧的访问
+            oldest = store.get_oldest_visit_time(store.get_downsample_mark(interval))
+            while oldest is not None and oldest < end_limit:
+                start = math.floor(oldest / interval) * interval
+                end = min(start + interval * self.DOWNSAMPLE_SLICE, end_limit)
+                while start < end:
+                    deleted, changed, start = store.downsample_visits(start, end, interval,
+                                                                      self.CHUNK_SIZE)
+                    report['visits'] += deleted
+                    counts.update(changed)
+                    yield
+                store.set_downsample_mark(interval, end)
+                # 跳过没有访问记录的时间段
+                oldest = store.get_oldest_visit_time(end)
+
+        # 删除访问后检查没有访问记录的网址
+        if report['visits']:
+            after_id = 0
+            while after_id is not None:
+                after_id, urls = store.delete_orphan_urls(after_id, self.CHUNK_SIZE)
+                report['urls'] += len(urls)
+                removed_urls.extend(urls)
+                yield
+
+        # 回收空闲页
+        while store.compact(self.VACUUM_PAGES):
+            yield
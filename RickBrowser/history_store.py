@@ -0,0 +1,667 @@
+"""
+浏览历史存储
+历史记录保存在 SQLite 中：urls 表每个网址一行（按规范键去重，同一页面的不同写法合并为一行），
+visits 表每次访问一行（只追加）；
+按时间范围和网址前缀的查询都走索引，不限制条数；按网站和按天的访问次数、停留时间汇总表
+随访问和标签页停留时间增量更新，统计页面不扫描历史记录；
+每个线程使用自己的连接（WAL 模式下后台线程写入时GUI线程仍可读取）
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from url_canonical import UrlCanonicalizer
+
+
+class HistoryStore:
+    """基于 SQLite 的浏览历史
+
+    查询返回的记录为 {id, url, title, time, visit_count}，按访问时间从新到旧排列
+    """
+
+    # 数据库结构版本（PRAGMA user_version）
+    SCHEMA_VERSION = 4
+
+    # 前缀过滤匹配的网址超过全部网址的 1/50（且至少这么多个）时按时间顺序扫描
+    BROAD_FILTER_RATIO = 50
+    BROAD_FILTER_MIN = 1000
+
+    def __init__(self, db_path="history.sqlite3", canonicalizer=None):
+        self.db_path = Path(db_path)
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.create_tables()
+
+    @property
+    def conn(self):
+        """当前线程的数据库连接"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # 连接只在创建它的线程中使用，关闭时由 close() 统一关闭；
+            # 整理历史记录时写入可能稍等片刻，加长等待锁的时间
+            conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # 新数据库使用增量回收空间（须在建表前设置，旧数据库在第一次压缩时转换）
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+
+    def create_tables(self):
+        """创建表和索引，并升级旧版本的数据库"""
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE,
+                    title TEXT NOT NULL DEFAULT '',
+                    visit_count INTEGER NOT NULL DEFAULT 0,
+                    last_visit REAL NOT NULL DEFAULT 0,
+                    host TEXT NOT NULL DEFAULT '',
+                    key TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+            self.upgrade_schema()
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS visits (
+                    id INTEGER PRIMARY KEY,
+                    url_id INTEGER NOT NULL REFERENCES urls(id) ON DELETE CASCADE,
+                    time REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS visits_time ON visits (time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS visits_url ON visits (url_id, time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS urls_last_visit ON urls (last_visit)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS urls_host ON urls (host)")
+
+            # 新数据库、旧版本数据库或规范化规则变化时重新计算规范键
+            fingerprint = self.canonicalizer.fingerprint()
+            row = self.conn.execute("SELECT value FROM meta WHERE name = 'canonical_rules'").fetchone()
+            if row is None or row[0] != fingerprint:
+                self.rekey()
+                self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('canonical_rules', ?)",
+                                  (fingerprint,))
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS urls_key ON urls (key)")
+            self.create_stats_tables()
+            self.conn.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+
+    def create_stats_tables(self):
+        """创建汇总表（版本 4），旧数据库按已有的访问记录补算访问次数（需在事务中调用）"""
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'host_stats'").fetchone()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS host_stats (
+                host TEXT PRIMARY KEY,
+                visits INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0,
+                last_visit REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS day_stats (
+                day TEXT PRIMARY KEY,
+                visits INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS day_host_stats (
+                day TEXT NOT NULL,
+                host TEXT NOT NULL,
+                visits INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, host)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS host_stats_visits ON host_stats (visits)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS host_stats_seconds ON host_stats (seconds)")
+        if not exists:
+            self.rebuild_stats()
+
+    def rebuild_stats(self):
+        """由访问记录重新计算访问次数汇总（停留时间无法补算）（需在事务中调用）"""
+        self.conn.execute("DELETE FROM day_host_stats")
+        self.conn.execute("DELETE FROM day_stats")
+        self.conn.execute("DELETE FROM host_stats")
+        self.conn.execute("""
+            INSERT INTO day_host_stats (day, host, visits)
+            SELECT date(visits.time, 'unixepoch', 'localtime'), urls.host, COUNT(*)
+            FROM visits JOIN urls ON urls.id = visits.url_id
+            GROUP BY 1, 2
+        """)
+        self.conn.execute("""
+            INSERT INTO day_stats (day, visits)
+            SELECT day, SUM(visits) FROM day_host_stats GROUP BY day
+        """)
+        self.conn.execute("""
+            INSERT INTO host_stats (host, visits, last_visit)
+            SELECT urls.host, COUNT(*), MAX(visits.time)
+            FROM visits JOIN urls ON urls.id = visits.url_id
+            GROUP BY urls.host
+        """)
+
+    def upgrade_schema(self):
+        """升级旧版本的表结构（需在事务中调用）"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(urls)")}
+
+        # 版本 2：增加主机名列，用于按网站过滤
+        if 'host' not in columns:
+            self.conn.execute("ALTER TABLE urls ADD COLUMN host TEXT NOT NULL DEFAULT ''")
+            self.conn.create_function("url_host", 1, self.get_host, deterministic=True)
+            self.conn.execute("UPDATE urls SET host = url_host(url)")
+
+        # 版本 3：增加规范键列（由 rekey() 填写）
+        if 'key' not in columns:
+            self.conn.execute("ALTER TABLE urls ADD COLUMN key TEXT NOT NULL DEFAULT ''")
+
+    def rekey(self):
+        """重新计算全部网址的规范键，合并键相同的网址（需在事务中调用）
+
+        保留最后访问的一行，其他行的访问记录和访问次数并入这一行
+        """
+        start = time.perf_counter()
+        self.conn.execute("DROP INDEX IF EXISTS urls_key")
+        self.conn.create_function("url_key", 1, self.canonicalizer.canonicalize, deterministic=True)
+        self.conn.execute("UPDATE urls SET key = url_key(url)")
+
+        self.conn.execute("""
+            CREATE TEMP TABLE merged_urls (
+                id INTEGER PRIMARY KEY,
+                survivor INTEGER NOT NULL
+            )
+        """)
+        try:
+            self.conn.execute("""
+                INSERT INTO merged_urls (id, survivor)
+                SELECT id, survivor FROM (
+                    SELECT id, FIRST_VALUE(id) OVER (
+                        PARTITION BY key ORDER BY last_visit DESC, id DESC) AS survivor
+                    FROM urls
+                ) WHERE id != survivor
+            """)
+            merged = self.conn.execute("SELECT COUNT(*) FROM merged_urls").fetchone()[0]
+            if merged:
+                self.conn.execute("""
+                    UPDATE visits SET url_id =
+                        (SELECT survivor FROM merged_urls WHERE merged_urls.id = visits.url_id)
+                    WHERE url_id IN (SELECT id FROM merged_urls)
+                """)
+                self.conn.execute("""
+                    UPDATE urls SET visit_count = visit_count + (
+                        SELECT SUM(old.visit_count) FROM merged_urls
+                        JOIN urls AS old ON old.id = merged_urls.id
+                        WHERE merged_urls.survivor = urls.id)
+                    WHERE id IN (SELECT survivor FROM merged_urls)
+                """)
+                self.conn.execute("DELETE FROM urls WHERE id IN (SELECT id FROM merged_urls)")
+        finally:
+            self.conn.execute("DROP TABLE merged_urls")
+
+        if merged:
+            print(f"历史记录网址规范化: 合并 {merged} 个重复网址，"
+                  f"耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    @staticmethod
+    def get_host(url):
+        """网址的主机名（小写，去掉 www. 前缀），不是网址时为空"""
+        try:
+            host = urlsplit(url).hostname or ''
+        except ValueError:
+            return ''
+        return host[4:] if host.startswith('www.') else host
+
+    def add_visit(self, url, title=None, visit_time=None):
+        """记录一次访问，返回访问ID"""
+        return self.add_visits([(url, title, visit_time)])[-1]
+
+    def add_visits(self, visits):
+        """在一个事务中记录多次访问
+
+        visits 为 [(url, title, time)]，title/time 为 None 时分别沿用已有标题、使用当前时间；
+        返回各次访问的ID
+        """
+        visit_ids = []
+        stats = {}
+        with self.conn:
+            for url, title, visit_time in visits:
+                visit_ids.append(self.insert_visit(url, title, visit_time, stats))
+            self.write_stats(stats)
+        return visit_ids
+
+    def insert_visit(self, url, title, visit_time, stats):
+        """记录一次访问并计入本批的汇总，返回访问ID（需在事务中调用）"""
+        if visit_time is None:
+            visit_time = time.time()
+        url_id = self.upsert_url(url, title, visit_time)
+        cursor = self.conn.execute(
+            "INSERT INTO visits (url_id, time) VALUES (?, ?)", (url_id, visit_time))
+        entry = self.get_stats_entry(stats, self.get_day(visit_time), self.get_host(url))
+        entry[0] += 1
+        entry[2] = max(entry[2], visit_time)
+        return cursor.lastrowid
+
+    @staticmethod
+    def get_day(timestamp):
+        """时间戳对应的本地日期 YYYY-MM-DD"""
+        return date.fromtimestamp(timestamp).isoformat()
+
+    @staticmethod
+    def get_stats_entry(stats, day, host):
+        """本批汇总中 (日期, 网站) 的 [访问次数, 停留秒数, 最后访问时间]"""
+        entry = stats.get((day, host))
+        if entry is None:
+            entry = stats[(day, host)] = [0, 0.0, 0.0]
+        return entry
+
+    def add_focus_time(self, url, start, end, stats):
+        """将标签页停留的时间段计入本批的汇总，跨过零点时分到各天"""
+        host = self.get_host(url)
+        while start < end:
+            next_day = datetime.combine(date.fromtimestamp(start) + timedelta(days=1),
+                                        datetime.min.time()).timestamp()
+            part_end = min(end, next_day)
+            self.get_stats_entry(stats, self.get_day(start), host)[1] += part_end - start
+            start = part_end
+
+    def write_stats(self, stats):
+        """把本批的汇总累加到按网站、按天的汇总表（需在事务中调用）"""
+        if not stats:
+            return
+        hosts, days = {}, {}
+        for (day, host), (visits, seconds, last_visit) in stats.items():
+            host_entry = hosts.setdefault(host, [0, 0.0, 0.0])
+            host_entry[0] += visits
+            host_entry[1] += seconds
+            host_entry[2] = max(host_entry[2], last_visit)
+            day_entry = days.setdefault(day, [0, 0.0])
+            day_entry[0] += visits
+            day_entry[1] += seconds
+
+        self.conn.executemany("""
+            INSERT INTO day_host_stats (day, host, visits, seconds) VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, host) DO UPDATE SET
+                visits = visits + excluded.visits,
+                seconds = seconds + excluded.seconds
+        """, [(day, host, visits, seconds) for (day, host), (visits, seconds, _) in stats.items()])
+        self.conn.executemany("""
+            INSERT INTO day_stats (day, visits, seconds) VALUES (?, ?, ?)
+            ON CONFLICT (day) DO UPDATE SET
+                visits = visits + excluded.visits,
+                seconds = seconds + excluded.seconds
+        """, [(day, visits, seconds) for day, (visits, seconds) in days.items()])
+        self.conn.executemany("""
+            INSERT INTO host_stats (host, visits, seconds, last_visit) VALUES (?, ?, ?, ?)
+            ON CONFLICT (host) DO UPDATE SET
+                visits = visits + excluded.visits,
+                seconds = seconds + excluded.seconds,
+                last_visit = MAX(last_visit, excluded.last_visit)
+        """, [(host, *entry) for host, entry in hosts.items()])
+
+    def upsert_url(self, url, title, visit_time):
+        """更新网址的访问次数、最后访问时间和标题，返回网址ID（需在事务中调用）
+
+        规范键相同的网址只有一行，url 列保存最后访问时的写法
+        """
+        key = self.canonicalizer.canonicalize(url)
+        self.conn.execute("""
+            INSERT INTO urls (url, title, visit_count, last_visit, host, key) VALUES (?, ?, 1, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                url = CASE WHEN excluded.last_visit >= last_visit THEN excluded.url ELSE url END,
+                visit_count = visit_count + 1,
+                last_visit = MAX(last_visit, excluded.last_visit),
+                title = CASE WHEN ? IS NULL THEN title ELSE excluded.title END
+        """, (url, title or url, visit_time, self.get_host(url), key, title))
+        return self.conn.execute("SELECT id FROM urls WHERE key = ?", (key,)).fetchone()[0]
+
+    def apply_changes(self, changes):
+        """在一个事务中写入一批访问、标题修改和停留时间
+
+        changes 为 ('visit', url, title, time)、('title', url, title) 或
+        ('focus', url, 开始时间, 结束时间)；同一网址的多次标题修改只写入最后一次，
+        汇总表在本批内先合并再更新
+        """
+        titles = {}
+        stats = {}
+        with self.conn:
+            for change in changes:
+                if change[0] == 'visit':
+                    _, url, title, visit_time = change
+                    self.insert_visit(url, title, visit_time, stats)
+                    if title is not None:
+                        titles.pop(url, None)
+                elif change[0] == 'focus':
+                    self.add_focus_time(*change[1:], stats)
+                else:
+                    _, url, title = change
+                    titles[url] = title
+            self.write_stats(stats)
+            if titles:
+                canonicalize = self.canonicalizer.canonicalize
+                self.conn.executemany("UPDATE urls SET title = ? WHERE key = ?",
+                                      [(title, canonicalize(url)) for url, title in titles.items()])
+
+    def get_visits(self, start=None, end=None, limit=100, offset=0,
+                   before=None, host_prefix=None, url_prefix=None):
+        """按时间范围查询访问记录（start <= time < end）
+
+        before 为上一页最后一条记录的 (time, id)，用于按索引翻页；
+        host_prefix/url_prefix 按主机名或网址前缀过滤
+        """
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("visits.time >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("visits.time < ?")
+            params.append(end)
+        if before is not None:
+            conditions.append("(visits.time, visits.id) < (?, ?)")
+            params.extend(before)
+        # 匹配的网址较少时按网址查访问记录再排序；较多时按时间顺序扫描访问记录
+        # 并逐条检查（CROSS JOIN 固定连接顺序），找够一页即可停止
+        join = "JOIN"
+        for column, prefix in (('host', host_prefix), ('url', url_prefix)):
+            if prefix is None:
+                continue
+            prefix_params = [prefix, prefix + '\U0010ffff']
+            if self.is_broad_filter(column, prefix_params):
+                conditions.append(f"urls.{column} >= ? AND urls.{column} < ?")
+                join = "CROSS JOIN"
+            else:
+                conditions.append(f"visits.url_id IN "
+                                  f"(SELECT id FROM urls WHERE {column} >= ? AND {column} < ?)")
+            params.extend(prefix_params)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = self.conn.execute(f"""
+            SELECT visits.id, urls.url, urls.title, visits.time, urls.visit_count
+            FROM visits {join} urls ON urls.id = visits.url_id
+            {where}
+            ORDER BY visits.time DESC, visits.id DESC
+            LIMIT ? OFFSET ?
+        """, params + [limit, offset])
+        return [dict(row) for row in rows]
+
+    def is_broad_filter(self, column, params):
+        """按 column 前缀匹配的网址是否超过全部网址的 1/BROAD_FILTER_RATIO"""
+        total = self.conn.execute("SELECT MAX(id) FROM urls").fetchone()[0] or 0
+        limit = total // self.BROAD_FILTER_RATIO
+        if limit < self.BROAD_FILTER_MIN:
+            return False
+        count = self.conn.execute(f"""
+            SELECT COUNT(*) FROM (SELECT 1 FROM urls WHERE {column} >= ? AND {column} < ? LIMIT ?)
+        """, params + [limit + 1]).fetchone()[0]
+        return count > limit
+
+    def get_recent_urls(self, limit=1000):
+        """最近访问的网址 [{url, title, visit_count, last_visit}]，按最后访问时间从新到旧排列"""
+        rows = self.conn.execute("""
+            SELECT url, title, visit_count, last_visit FROM urls
+            ORDER BY last_visit DESC
+            LIMIT ?
+        """, (limit,))
+        return [dict(row) for row in rows]
+
+    def count_visits(self):
+        """访问记录总数"""
+        return self.conn.execute("SELECT COUNT(*) FROM visits").fetchone()[0]
+
+    def get_oldest_visit_time(self, start=None):
+        """最早的（start 之后的）访问时间，没有访问记录时为 None"""
+        if start is None:
+            return self.conn.execute("SELECT MIN(time) FROM visits").fetchone()[0]
+        return self.conn.execute("SELECT MIN(time) FROM visits WHERE time >= ?",
+                                 (start,)).fetchone()[0]
+
+    def delete_visit_rows(self, rows):
+        """删除访问 [(访问ID, 网址ID)]，并重新计算相关网址的访问次数和最后访问时间（需在事务中调用）
+
+        返回仍有访问记录的网址的新值 {网址: (访问次数, 最后访问时间)}
+        """
+        self.conn.executemany("DELETE FROM visits WHERE id = ?", [(row[0],) for row in rows])
+        url_ids = [(url_id,) for url_id in {row[1] for row in rows}]
+        self.conn.executemany("""
+            UPDATE urls SET
+                visit_count = (SELECT COUNT(*) FROM visits WHERE url_id = urls.id),
+                last_visit = COALESCE((SELECT MAX(time) FROM visits WHERE url_id = urls.id), last_visit)
+            WHERE id = ?
+        """, url_ids)
+
+        counts = {}
+        for url_id in url_ids:
+            row = self.conn.execute("SELECT url, visit_count, last_visit FROM urls WHERE id = ?",
+                                    url_id).fetchone()
+            if row is not None and row['visit_count']:
+                counts[row['url']] = (row['visit_count'], row['last_visit'])
+        return counts
+
+    def delete_visits_before(self, cutoff, limit):
+        """删除 cutoff 之前最旧的至多 limit 条访问
+
+        返回 (删除的条数, 访问次数有变化的网址 {网址: (访问次数, 最后访问时间)})
+        """
+        with self.conn:
+            rows = self.conn.execute("""
+                SELECT id, url_id FROM visits WHERE time < ? ORDER BY time LIMIT ?
+            """, (cutoff, limit)).fetchall()
+            return len(rows), self.delete_visit_rows(rows)
+
+    def delete_excess_visits(self, max_visits, limit):
+        """访问记录超过 max_visits 条时删除最旧的至多 limit 条
+
+        返回值与 delete_visits_before() 相同
+        """
+        excess = self.count_visits() - max_visits
+        if excess <= 0:
+            return 0, {}
+        with self.conn:
+            rows = self.conn.execute("""
+                SELECT id, url_id FROM visits ORDER BY time LIMIT ?
+            """, (min(excess, limit),)).fetchall()
+            return len(rows), self.delete_visit_rows(rows)
+
+    def downsample_visits(self, start, end, interval, limit):
+        """对 start <= time < end 的访问降采样：每个网站每 interval 秒只保留最早的一次
+
+        按时间顺序至多删除 limit 条，返回 (删除的条数, 访问次数有变化的网址, 下一次的起点)；
+        起点之前的时间段已处理完，下一次不必重新扫描
+        """
+        with self.conn:
+            rows = self.conn.execute("""
+                SELECT id, url_id, time FROM (
+                    SELECT visits.id, visits.url_id, visits.time, ROW_NUMBER() OVER (
+                        PARTITION BY urls.host, CAST(visits.time / ? AS INTEGER)
+                        ORDER BY visits.time, visits.id) AS position
+                    FROM visits JOIN urls ON urls.id = visits.url_id
+                    WHERE visits.time >= ? AND visits.time < ?
+                ) WHERE position > 1 ORDER BY time LIMIT ?
+            """, (interval, start, end, limit)).fetchall()
+            counts = self.delete_visit_rows(rows)
+
+        # 没删满时整个范围已处理完；否则最后一条所在的时间段可能还有重复的访问
+        if len(rows) < limit:
+            next_start = end
+        else:
+            next_start = max(start, math.floor(rows[-1]['time'] / interval) * interval)
+        return len(rows), counts, next_start
+
+    def get_downsample_mark(self, interval):
+        """按 interval 降采样已处理到的时间（之前的访问不再检查），没有记录时为 None"""
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'downsample_mark'").fetchone()
+        if row is None:
+            return None
+        try:
+            mark = json.loads(row[0])
+            if mark['interval'] == interval:
+                return float(mark['until'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def set_downsample_mark(self, interval, until):
+        """记录按 interval 降采样已处理到的时间"""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('downsample_mark', ?)",
+                              (json.dumps({'interval': interval, 'until': until}),))
+
+    def delete_orphan_urls(self, after_id, limit):
+        """检查 ID 大于 after_id 的至多 limit 个网址，删除已没有访问记录的
+
+        返回 (最后检查的网址ID，检查完时为 None；被删除的网址列表)
+        """
+        rows = self.conn.execute("""
+            SELECT id, url, EXISTS (SELECT 1 FROM visits WHERE url_id = urls.id) AS visited
+            FROM urls WHERE id > ? ORDER BY id LIMIT ?
+        """, (after_id, limit)).fetchall()
+        if not rows:
+            return None, []
+
+        orphans = [row for row in rows if not row['visited']]
+        if orphans:
+            with self.conn:
+                self.conn.executemany("""
+                    DELETE FROM urls WHERE id = ? AND NOT EXISTS
+                        (SELECT 1 FROM visits WHERE url_id = urls.id)
+                """, [(row['id'],) for row in orphans])
+        return rows[-1]['id'], [row['url'] for row in orphans]
+
+    def get_size(self):
+        """数据库占用的字节数（不含未使用的页）和可回收的字节数"""
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_pages) * page_size, free_pages * page_size
+
+    def get_file_size(self):
+        """数据库文件（含 WAL 文件）的字节数"""
+        size = 0
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + "-wal")):
+            try:
+                size += path.stat().st_size
+            except OSError:
+                pass
+        return size
+
+    def compact(self, pages):
+        """回收至多 pages 个空闲页，返回是否还有空闲页
+
+        旧数据库尚未使用增量回收时执行一次完整的 VACUUM 进行转换
+        """
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.conn.execute("VACUUM")
+            return False
+        # execute() 只执行一步（只回收一页），executescript() 会执行完整个语句
+        self.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return self.conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+    def checkpoint(self):
+        """将 WAL 中的内容写回数据库并截断 WAL 文件"""
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get_top_hosts(self, order='visits', limit=10, since=None):
+        """访问次数或停留时间最多的网站 [{host, visits, seconds}]
+
+        since 为 None 时读取全部时间的汇总（走索引），否则汇总 since 这天（YYYY-MM-DD）以来的按天汇总
+        """
+        if order not in ('visits', 'seconds'):
+            raise ValueError(f"不支持的排序: {order}")
+        if since is None:
+            rows = self.conn.execute(f"""
+                SELECT host, visits, seconds FROM host_stats
+                ORDER BY {order} DESC
+                LIMIT ?
+            """, (limit,))
+        else:
+            rows = self.conn.execute(f"""
+                SELECT host, SUM(visits) AS visits, SUM(seconds) AS seconds FROM day_host_stats
+                WHERE day >= ?
+                GROUP BY host
+                ORDER BY {order} DESC
+                LIMIT ?
+            """, (since, limit))
+        return [dict(row) for row in rows]
+
+    def get_daily_stats(self, since):
+        """since 这天（YYYY-MM-DD）以来每天的汇总 [{day, visits, seconds}]，从新到旧排列"""
+        rows = self.conn.execute("""
+            SELECT day, visits, seconds FROM day_stats
+            WHERE day >= ?
+            ORDER BY day DESC
+        """, (since,))
+        return [dict(row) for row in rows]
+
+    def delete_daily_stats_before(self, day):
+        """删除 day 之前的按天汇总（全部时间的按网站汇总保留）"""
+        with self.conn:
+            self.conn.execute("DELETE FROM day_host_stats WHERE day < ?", (day,))
+            self.conn.execute("DELETE FROM day_stats WHERE day < ?", (day,))
+
+    def clear(self):
+        """清空全部历史记录和汇总"""
+        with self.conn:
+            self.conn.execute("DELETE FROM visits")
+            self.conn.execute("DELETE FROM urls")
+            self.conn.execute("DELETE FROM day_host_stats")
+            self.conn.execute("DELETE FROM day_stats")
+            self.conn.execute("DELETE FROM host_stats")
+            self.conn.execute("DELETE FROM meta WHERE name = 'downsample_mark'")
+
+    def migrate_json(self, json_path="history.json"):
+        """从旧的 history.json 一次性导入历史记录，导入后将文件重命名为 .migrated
+
+        返回导入的条数
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception as e:
+            print(f"读取 {json_path} 时出错: {e}")
+            return 0
+
+        # history.json 中新记录在前，按时间从旧到新导入
+        visits = []
+        for item in reversed(items if isinstance(items, list) else []):
+            if isinstance(item, dict) and item.get('url'):
+                visits.append((str(item['url']), item.get('title'), item.get('time') or 0))
+
+        try:
+            self.add_visits(visits)
+            os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        except (sqlite3.Error, OSError) as e:
+            print(f"迁移 {json_path} 时出错: {e}")
+            return 0
+
+        print(f"已从 {json_path} 导入 {len(visits)} 条历史记录")
+        return len(visits)
+
+    def close(self):
+        """关闭所有线程的数据库连接（后台写入应已停止）"""
+        with self.connections_lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
@@ -0,0 +1,410 @@
+"""
+地址栏补全
+历史记录和书签按 frecency（访问次数 × 最近访问时间权重）排序，
+内存中的词前缀索引随访问增量更新；索引和匹配都在后台线程中进行，输入不会卡顿
+"""
+
+import bisect
+import heapq
+import queue
+import re
+import threading
+import time
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QObject, Qt, pyqtSignal
+
+from token_index import TokenIndex, tokenize
+from url_canonical import UrlCanonicalizer
+
+# 网址开头的协议和 www.，匹配和显示时忽略
+SCHEME_PATTERN = re.compile(r'^[a-z][a-z0-9+.-]*://(www\.)?')
+
+
+def strip_scheme(url):
+    """去掉网址的协议和 www. 前缀（并转为小写）"""
+    return SCHEME_PATTERN.sub('', url.lower(), count=1)
+
+
+class FrecencyIndex:
+    """补全条目的内存索引（非线程安全，只在一个线程中使用）
+
+    条目为 {url, key, title, visit_count, last_visit, bookmarked, display_url, rank_key}，
+    按网址的规范键索引（url 为最后访问时的写法），ranked 按 rank_key（分数从高到低）排列
+    """
+
+    # 距最后访问的天数 -> 权重
+    RECENCY_WEIGHTS = ((4, 100), (14, 70), (31, 50), (90, 30))
+    OLD_WEIGHT = 10
+
+    # 书签相当于多访问的次数
+    BOOKMARK_BONUS = 5
+
+    # 候选条目不超过这个数时取全部候选再排序，否则按分数顺序扫描
+    MAX_CANDIDATES = 1000
+
+    # 以查询词开头的词超过这个数时不合并这些词的候选集合，逐条检查
+    MAX_RANGE_TOKENS = 1000
+
+    # 按分数顺序扫描的最大条目数（分数很低的条目不再检查）
+    MAX_SCAN = 20000
+
+    SCHEMES = ('http://', 'https://', 'file://')
+
+    def __init__(self, canonicalizer=None):
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.entries = {}
+        self.ranked = []
+        self.token_index = TokenIndex()
+
+        # 计算分数使用的当前时间，rescore() 时更新
+        self.now = time.time()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self, urls, bookmarks):
+        """批量加载历史网址 [{url, title, visit_count, last_visit}] 和书签 [{url, title, time}]"""
+        self.token_index.begin_bulk()
+        for item in urls:
+            entry = self.get_entry(item['url'], create=True)
+            if entry is not None:
+                entry['title'] = item.get('title') or entry['title']
+                entry['visit_count'] = item.get('visit_count') or 0
+                entry['last_visit'] = item.get('last_visit') or 0
+        for bookmark in bookmarks:
+            entry = self.get_entry(bookmark['url'], create=True)
+            if entry is not None:
+                entry['bookmarked'] = True
+                if not entry['visit_count']:
+                    entry['title'] = bookmark.get('title') or entry['title']
+                    entry['last_visit'] = max(entry['last_visit'], bookmark.get('time') or 0)
+
+        for key, entry in self.entries.items():
+            self.token_index.add(key, self.get_tokens(entry))
+        self.token_index.end_bulk()
+        self.rescore()
+
+    def get_entry(self, url, create=False):
+        """获取网址的条目；create 为 True 时不存在则创建（不加入索引），非网页网址返回 None"""
+        key = self.canonicalizer.canonicalize(url)
+        entry = self.entries.get(key)
+        if entry is None and create and url.startswith(self.SCHEMES):
+            entry = self.entries[key] = {
+                'url': url,
+                'key': key,
+                'title': '',
+                'visit_count': 0,
+                'last_visit': 0,
+                'bookmarked': False,
+                'display_url': strip_scheme(url),
+                'rank_key': None
+            }
+        return entry
+
+    @staticmethod
+    def get_tokens(entry):
+        """条目标题和网址中的词"""
+        return tokenize(entry['title']) + tokenize(entry['display_url'])
+
+    def get_score(self, entry):
+        """frecency 分数"""
+        age_days = (self.now - entry['last_visit']) / 86400
+        weight = self.OLD_WEIGHT
+        for days, recency_weight in self.RECENCY_WEIGHTS:
+            if age_days <= days:
+                weight = recency_weight
+                break
+        count = entry['visit_count'] + (self.BOOKMARK_BONUS if entry['bookmarked'] else 0)
+        return count * weight
+
+    def rank(self, entry):
+        """重新计算条目的分数并更新在 ranked 中的位置"""
+        if entry['rank_key'] is not None:
+            position = bisect.bisect_left(self.ranked, entry['rank_key'])
+            del self.ranked[position]
+        entry['rank_key'] = (-self.get_score(entry), -entry['last_visit'], entry['key'])
+        bisect.insort(self.ranked, entry['rank_key'])
+
+    def rescore(self, now=None):
+        """按当前时间重新计算全部分数（最近访问时间的权重随时间变化）"""
+        self.now = now or time.time()
+        for entry in self.entries.values():
+            entry['rank_key'] = (-self.get_score(entry), -entry['last_visit'], entry['key'])
+        self.ranked = sorted(entry['rank_key'] for entry in self.entries.values())
+
+    def add_visit(self, url, title=None, visit_time=None):
+        """记录一次访问"""
+        entry = self.get_entry(url, create=True)
+        if entry is None:
+            return
+        is_new = entry['rank_key'] is None
+        visit_time = visit_time or time.time()
+        # 同一页面的另一种写法：显示最后访问时的网址
+        url_changed = url != entry['url'] and visit_time >= entry['last_visit']
+        if url_changed:
+            entry['url'] = url
+            entry['display_url'] = strip_scheme(url)
+        entry['visit_count'] += 1
+        entry['last_visit'] = max(entry['last_visit'], visit_time)
+        if title:
+            entry['title'] = title
+        if is_new or title or url_changed:
+            self.token_index.add(entry['key'], self.get_tokens(entry))
+        self.rank(entry)
+
+    def set_title(self, url, title):
+        """更新条目的标题"""
+        entry = self.get_entry(url)
+        if entry is not None and title and entry['title'] != title:
+            entry['title'] = title
+            self.token_index.add(entry['key'], self.get_tokens(entry))
+
+    def set_bookmarked(self, url, bookmarked, title=None):
+        """更新条目的书签状态"""
+        entry = self.get_entry(url, create=bookmarked)
+        if entry is None:
+            return
+        entry['bookmarked'] = bookmarked
+        if not bookmarked and not entry['visit_count']:
+            # 只因书签而存在的条目
+            self.remove(url)
+            return
+        if entry['rank_key'] is None:
+            entry['title'] = title or entry['title']
+            entry['last_visit'] = time.time()
+            self.token_index.add(entry['key'], self.get_tokens(entry))
+        self.rank(entry)
+
+    def set_visit_count(self, url, visit_count, last_visit):
+        """更新条目的访问次数和最后访问时间（旧的访问被删除后）"""
+        entry = self.get_entry(url)
+        if entry is None or entry['rank_key'] is None:
+            return
+        entry['visit_count'] = visit_count
+        entry['last_visit'] = last_visit
+        self.rank(entry)
+
+    def remove(self, url):
+        """删除条目"""
+        key = self.canonicalizer.canonicalize(url)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.token_index.remove(key)
+        if entry['rank_key'] is not None:
+            position = bisect.bisect_left(self.ranked, entry['rank_key'])
+            del self.ranked[position]
+
+    def clear(self):
+        """清空全部条目"""
+        self.entries = {}
+        self.ranked = []
+        self.token_index = TokenIndex()
+
+    def search(self, text, limit=8):
+        """返回分数最高的匹配条目；网址（去掉协议和 www.）以输入开头的排在前面"""
+        query = strip_scheme(text.strip())
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        # 各查询词的候选集合（以该词开头的词太多时为 None，逐条检查）
+        sets, unchecked = [], []
+        for term in terms:
+            keys = self.token_index.prefix_set(term, self.MAX_RANGE_TOKENS)
+            if keys is None:
+                unchecked.append(term)
+            elif not keys:
+                return []
+            else:
+                sets.append(keys)
+        sets.sort(key=len)
+
+        key_matches = self.token_index.key_matches
+
+        def accept(key, other_sets):
+            return (all(key in keys for keys in other_sets)
+                    and all(key_matches(key, term) for term in unchecked))
+
+        wanted = limit * 2
+        matches = None
+        if not sets or len(sets[0]) > self.MAX_CANDIDATES:
+            # 候选较多：按分数顺序扫描，找够即停止
+            matches = []
+            for rank_key in self.ranked[:self.MAX_SCAN]:
+                if accept(rank_key[2], sets):
+                    matches.append(rank_key)
+                    if len(matches) >= wanted:
+                        break
+            if len(matches) < wanted and len(self.ranked) > self.MAX_SCAN and sets:
+                # 分数靠前的条目中匹配太少，改为求交集
+                matches = None
+
+        if matches is None:
+            # 候选较少：取全部候选中分数最高的
+            candidates = sets[0]
+            for keys in sets[1:]:
+                if len(candidates) <= self.MAX_CANDIDATES:
+                    break
+                candidates = candidates & keys
+            keys = [key for key in candidates if accept(key, sets[1:])]
+            matches = heapq.nsmallest(wanted, (self.entries[key]['rank_key'] for key in keys))
+
+        results = [self.entries[rank_key[2]] for rank_key in matches]
+        results.sort(key=lambda entry: not entry['display_url'].startswith(query))
+        return [{'url': entry['url'], 'title': entry['title'], 'bookmarked': entry['bookmarked']}
+                for entry in results[:limit]]
+
+
+class OmniboxCompleter(QObject):
+    """在后台线程中维护 FrecencyIndex 并回答补全查询
+
+    complete() 只保留最新的查询，输入过快时跳过过期的查询；
+    结果通过 resultsReady(查询文本, 结果列表) 信号在GUI线程中报告
+    """
+
+    resultsReady = pyqtSignal(str, object)
+
+    # 启动时加载的最近访问网址数
+    LOAD_LIMIT = 100000
+
+    # 重新计算分数的间隔（秒）
+    RESCORE_INTERVAL = 3600
+
+    # 每次查询返回的结果数
+    RESULT_LIMIT = 8
+
+    def __init__(self, history_store, bookmarks, parent=None):
+        super().__init__(parent)
+        self.index = FrecencyIndex(history_store.canonicalizer)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+
+        # 最新的待回答查询，None 表示已回答
+        self.query = None
+
+        self.thread = threading.Thread(target=self._run, args=(history_store, list(bookmarks)),
+                                       name="omnibox", daemon=True)
+        self.thread.start()
+
+    def complete(self, text):
+        """请求补全 text"""
+        with self.lock:
+            self.query = text
+        self.queue.put(('query',))
+
+    def add_visit(self, url, title=None, visit_time=None):
+        """记录一次访问"""
+        self.queue.put(('visit', url, title, visit_time or time.time()))
+
+    def set_title(self, url, title):
+        """更新网址的标题"""
+        self.queue.put(('title', url, title))
+
+    def set_bookmarked(self, url, bookmarked, title=None):
+        """更新网址的书签状态"""
+        self.queue.put(('bookmark', url, bookmarked, title))
+
+    def remove_history(self, urls):
+        """删除已从历史记录中删除的网址（书签仍保留）"""
+        self.queue.put(('remove', list(urls)))
+
+    def update_history_counts(self, counts):
+        """更新旧访问被删除的网址的访问次数 {网址: (访问次数, 最后访问时间)}"""
+        self.queue.put(('counts', dict(counts)))
+
+    def clear(self):
+        """清空补全条目（清空历史记录后书签仍保留）"""
+        self.queue.put(('clear',))
+
+    def close(self):
+        """停止后台线程"""
+        self.queue.put(None)
+        self.thread.join(5)
+
+    def _run(self, history_store, bookmarks):
+        """后台线程：加载索引，然后依次处理更新和查询"""
+        try:
+            urls = history_store.get_recent_urls(self.LOAD_LIMIT)
+        except Exception as e:
+            print(f"加载地址栏补全数据时出错: {e}")
+            urls = []
+        start = time.perf_counter()
+        self.index.load(urls, bookmarks)
+        print(f"地址栏补全索引: {len(self.index)} 个条目，耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        last_rescore = time.monotonic()
+        while True:
+            try:
+                operation = self.queue.get(timeout=self.RESCORE_INTERVAL)
+            except queue.Empty:
+                operation = ('rescore',)
+            if operation is None:
+                return
+
+            try:
+                self._handle(operation, bookmarks)
+            except Exception as e:
+                print(f"地址栏补全处理 {operation[0]} 时出错: {e}")
+
+            if time.monotonic() - last_rescore >= self.RESCORE_INTERVAL:
+                self.index.rescore()
+                last_rescore = time.monotonic()
+
+    def _handle(self, operation, bookmarks):
+        """处理一个操作"""
+        kind = operation[0]
+        if kind == 'query':
+            with self.lock:
+                text, self.query = self.query, None
+            if text is not None:
+                self.resultsReady.emit(text, self.index.search(text, self.RESULT_LIMIT))
+        elif kind == 'visit':
+            self.index.add_visit(*operation[1:])
+        elif kind == 'title':
+            self.index.set_title(*operation[1:])
+        elif kind == 'bookmark':
+            self.index.set_bookmarked(*operation[1:])
+        elif kind == 'remove':
+            for url in operation[1]:
+                entry = self.index.get_entry(url)
+                if entry is not None and not entry['bookmarked']:
+                    self.index.remove(url)
+        elif kind == 'counts':
+            for url, (visit_count, last_visit) in operation[1].items():
+                self.index.set_visit_count(url, visit_count, last_visit)
+        elif kind == 'clear':
+            bookmarked = [entry for entry in self.index.entries.values() if entry['bookmarked']]
+            self.index.clear()
+            self.index.load([], [{'url': entry['url'], 'title': entry['title'], 'time': time.time()}
+                                 for entry in bookmarked])
+
+
+class OmniboxModel(QAbstractListModel):
+    """补全弹出列表的模型：显示标题和网址，选中后填入网址"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.results)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        result = self.results[index.row()]
+        if role == Qt.DisplayRole:
+            prefix = "★ " if result['bookmarked'] else ""
+            if result['title'] and result['title'] != result['url']:
+                return f"{prefix}{result['title']}  —  {result['url']}"
+            return f"{prefix}{result['url']}"
+        if role in (Qt.EditRole, Qt.ToolTipRole):
+            return result['url']
+        return None
+
+    def set_results(self, results):
+        """替换显示的结果"""
+        self.beginResetModel()
+        self.results = list(results)
+        self.endResetModel()
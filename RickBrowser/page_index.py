@@ -0,0 +1,173 @@
+"""
+网页内容全文索引
+页面加载完成后提取的文本在后台线程中分词，写入历史记录数据库中的 FTS5 表（按网址关联，
+每个网址保留最后一次加载的内容）；搜索时按 bm25 排序，摘要从匹配处附近截取
+"""
+
+import re
+import sqlite3
+
+# 中日韩文字（与 token_index 相同的范围）；FTS5 的 unicode61 分词器把连续的汉字当作一个词，
+# 写入前在每个字两侧加空格，逐字成词
+CJK_PATTERN = re.compile(r'([぀-ヿ㐀-鿿가-힯])')
+SEGMENTED_PATTERN = re.compile(r' ([぀-ヿ㐀-鿿가-힯]) ')
+WORD_PATTERN = re.compile(r'\w+')
+SPACE_PATTERN = re.compile(r'\s+')
+
+
+def segment(text):
+    """中日韩文字逐字分开"""
+    return CJK_PATTERN.sub(r' \1 ', text)
+
+
+def desegment(text):
+    """去掉 segment() 加入的空格"""
+    return SEGMENTED_PATTERN.sub(r'\1', text)
+
+
+class PageIndex:
+    """历史记录网页内容的全文索引
+
+    搜索结果为 {url, title, snippet, last_visit, visit_count}，按相关度排列
+    """
+
+    # 每个页面最多索引的字符数
+    TEXT_LIMIT = 20000
+
+    # 标题中的匹配相对正文的权重
+    TITLE_WEIGHT = 10.0
+
+    # 查询词不少于这么多个字符时按前缀匹配（太短的前缀对应的词太多）
+    PREFIX_MIN_LENGTH = 3
+
+    # 摘要在匹配处之前和之后保留的字符数
+    SNIPPET_BEFORE = 30
+    SNIPPET_AFTER = 90
+
+    # 摘要中标记匹配的符号
+    HIGHLIGHT = ('【', '】')
+
+    def __init__(self, history_store):
+        self.history_store = history_store
+        self.available = self.create_tables()
+
+    @property
+    def conn(self):
+        return self.history_store.conn
+
+    def create_tables(self):
+        """创建全文索引表；网址被删除（清空、整理历史记录）时由触发器删除对应的内容
+
+        SQLite 不支持 FTS5 时返回 False
+        """
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS page_text
+                    USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')
+                """)
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS urls_delete_page_text AFTER DELETE ON urls
+                    BEGIN
+                        DELETE FROM page_text WHERE rowid = old.id;
+                    END
+                """)
+        except sqlite3.OperationalError as e:
+            print(f"SQLite 不支持 FTS5，网页内容搜索不可用: {e}")
+            return False
+        return True
+
+    def add_pages(self, pages):
+        """在一个事务中索引一批页面 [(url, title, text)]（在后台线程中调用）
+
+        同一网址只保留最后一次的内容；不在历史记录中的网址跳过
+        """
+        latest = {}
+        canonicalize = self.history_store.canonicalizer.canonicalize
+        for url, title, text in pages:
+            latest[canonicalize(url)] = (title, text[:self.TEXT_LIMIT])
+
+        with self.conn:
+            for key, (title, text) in latest.items():
+                row = self.conn.execute("SELECT id FROM urls WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                self.conn.execute("DELETE FROM page_text WHERE rowid = ?", (row[0],))
+                self.conn.execute("INSERT INTO page_text (rowid, title, body) VALUES (?, ?, ?)",
+                                  (row[0], segment(title or ''), segment(text)))
+
+    def count_pages(self):
+        """已索引的页面数"""
+        return self.conn.execute("SELECT COUNT(*) FROM page_text").fetchone()[0]
+
+    def build_query(self, text):
+        """将输入转为 FTS5 查询：每个词一个短语（汉字按相邻的字匹配），各短语都要匹配"""
+        phrases = []
+        for word in text.split():
+            tokens = WORD_PATTERN.findall(segment(word))
+            if not tokens:
+                continue
+            phrase = '"' + ' '.join(tokens) + '"'
+            if len(tokens[-1]) >= self.PREFIX_MIN_LENGTH:
+                phrase += '*'
+            phrases.append(phrase)
+        return ' '.join(phrases)
+
+    def search(self, text, limit=50):
+        """按相关度返回至多 limit 个匹配的页面"""
+        query = self.build_query(text)
+        if not self.available or not query:
+            return []
+
+        # 先在索引中排序取出前 limit 个，再读取这些页面的正文生成摘要
+        # （排序时带上正文会读出全部匹配页面的正文）
+        rows = self.conn.execute("""
+            SELECT hits.rowid AS id, urls.url, urls.title, urls.last_visit, urls.visit_count
+            FROM (
+                SELECT rowid, bm25(page_text, ?, 1.0) AS score FROM page_text
+                WHERE page_text MATCH ?
+                ORDER BY score
+                LIMIT ?
+            ) AS hits JOIN urls ON urls.id = hits.rowid
+            ORDER BY hits.score
+        """, (self.TITLE_WEIGHT, query, limit)).fetchall()
+
+        words = [word for word in text.split() if WORD_PATTERN.search(word)]
+        results = []
+        for row in rows:
+            body = self.conn.execute("SELECT body FROM page_text WHERE rowid = ?",
+                                     (row['id'],)).fetchone()[0]
+            results.append({
+                'url': row['url'],
+                'title': row['title'],
+                'snippet': self.make_snippet(body, words),
+                'last_visit': row['last_visit'],
+                'visit_count': row['visit_count']
+            })
+        return results
+
+    def make_snippet(self, body, words):
+        """截取第一个匹配处附近的文字并标记其中的查询词
+
+        body 为分词后的正文；先在分词后的正文中定位，只还原匹配处附近的一段
+        """
+        words = sorted(words, key=len, reverse=True)
+        locate = re.compile('|'.join(r'\s*'.join(map(re.escape, segment(word).split())) for word in words),
+                            re.IGNORECASE)
+        match = locate.search(body)
+        # 分词后汉字占三个字符，按三倍的长度截取
+        window_start = max(0, match.start() - self.SNIPPET_BEFORE * 3) if match else 0
+        window_end = (match.end() if match else 0) + self.SNIPPET_AFTER * 3
+        text = desegment(body[window_start:window_end])
+
+        pattern = re.compile('|'.join(map(re.escape, words)), re.IGNORECASE)
+        match = pattern.search(text)
+        start = max(0, match.start() - self.SNIPPET_BEFORE) if match else 0
+        end = (match.end() if match else 0) + self.SNIPPET_AFTER
+        snippet = SPACE_PATTERN.sub(' ', text[start:end]).strip()
+
+        left, right = self.HIGHLIGHT
+        snippet = pattern.sub(lambda m: f"{left}{m.group(0)}{right}", snippet)
+        truncated_start = window_start > 0 or start > 0
+        truncated_end = window_end < len(body) or end < len(text)
+        return ('…' if truncated_start else '') + snippet + ('…' if truncated_end else '')
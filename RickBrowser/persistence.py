@@ -0,0 +1,207 @@
+"""
+后台写入服务
+书签、历史记录等数据的修改先交给后台线程，在短时间窗口内合并后再写入磁盘，
+GUI线程不再等待文件写入；JSON 文件先写临时文件再重命名，写入中断不会损坏原文件
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class PersistenceWorker:
+    """合并写入的后台线程
+
+    两种修改：
+        replace(key, task)        同一个键只保留最新的任务（如整个文件的快照）
+        append(key, item, writer) 同一个键的连续条目合并为一批，调用 writer(条目列表)
+    任务按提交顺序执行，在后台线程中调用；flush_async(callback) 在之前的修改写入后调用 callback
+    """
+
+    # 合并窗口（秒）：第一个修改到达后等待这么久再写入
+    COALESCE_DELAY = 0.5
+
+    def __init__(self, delay=None):
+        self.delay = self.COALESCE_DELAY if delay is None else delay
+        self.condition = threading.Condition()
+
+        # 待执行的操作：[键, 类型, 任务、写入函数或通知回调, 条目列表]
+        self.pending = []
+
+        # 当前窗口的截止时间，None 表示没有待执行的操作
+        self.deadline = None
+
+        # 是否正在执行一批操作，flush() 等待它结束
+        self.busy = False
+        self.closed = False
+
+        self.stats = {
+            'queued': 0,        # 收到的修改数
+            'coalesced': 0,     # 被合并掉的修改数
+            'written': 0,       # 写入的修改数
+            'batches': 0,       # 执行的批次数
+            'failed': 0,        # 失败的任务数
+            'latency_total': 0.0,
+            'latency_max': 0.0
+        }
+
+        self.thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self.thread.start()
+
+    def replace(self, key, task):
+        """提交整体替换的任务，同一个键只执行最新的一个"""
+        with self.condition:
+            self._check_open()
+            self.stats['queued'] += 1
+            for index, operation in enumerate(self.pending):
+                if operation[0] == key and operation[1] == 'replace':
+                    del self.pending[index]
+                    self.stats['coalesced'] += 1
+                    break
+            # 最新的快照排在最后，保证它在之前提交的其他操作之后执行
+            self.pending.append([key, 'replace', task, None])
+            self._schedule()
+
+    def append(self, key, item, writer):
+        """提交追加的条目，与紧邻的同键条目合并为一批"""
+        with self.condition:
+            self._check_open()
+            self.stats['queued'] += 1
+            if self.pending and self.pending[-1][0] == key and self.pending[-1][1] == 'append':
+                self.pending[-1][3].append(item)
+            else:
+                self.pending.append([key, 'append', writer, [item]])
+            self._schedule()
+
+    def write_json(self, path, data):
+        """原子地写入 JSON 文件；data 应是调用方数据的快照"""
+        self.replace(('json', str(path)), lambda: write_json_atomic(path, data))
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError("后台写入服务已关闭")
+
+    def _schedule(self):
+        """第一个修改到达时开始计时"""
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.delay
+            self.condition.notify_all()
+
+    def _run(self):
+        """后台线程：等待窗口结束后执行一批操作"""
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if self.deadline is not None:
+                        remaining = self.deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+                if self.closed and not self.pending:
+                    self.condition.notify_all()
+                    return
+                batch, self.pending = self.pending, []
+                self.deadline = None
+                self.busy = True
+
+            self._execute(batch)
+
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def _execute(self, batch):
+        """执行一批操作并更新统计（写入延迟按批次计算）"""
+        start = time.perf_counter()
+        written = failed = 0
+        for key, kind, task, items in batch:
+            if kind == 'notify':
+                # 不是修改，不计入统计
+                try:
+                    task()
+                except Exception as e:
+                    print(f"后台写入完成通知出错: {e}")
+                continue
+            count = len(items) if kind == 'append' else 1
+            try:
+                if kind == 'append':
+                    task(items)
+                else:
+                    task()
+                written += count
+            except Exception as e:
+                print(f"后台写入 {key} 时出错: {e}")
+                failed += count
+        elapsed = time.perf_counter() - start
+
+        with self.condition:
+            self.stats['written'] += written
+            self.stats['failed'] += failed
+            self.stats['batches'] += 1
+            self.stats['latency_total'] += elapsed
+            self.stats['latency_max'] = max(self.stats['latency_max'], elapsed)
+
+    def flush(self, timeout=None):
+        """立即执行待执行的操作并等待完成，返回是否在超时前完成"""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            if self.pending:
+                self.deadline = time.monotonic()
+                self.condition.notify_all()
+            while self.pending or self.busy:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def flush_async(self, callback):
+        """立即执行待执行的操作，不等待；之前提交的修改都写入后在后台线程中调用 callback()"""
+        with self.condition:
+            if not self.closed:
+                self.pending.append([None, 'notify', callback, None])
+                self.deadline = time.monotonic()
+                self.condition.notify_all()
+                return
+        # 已关闭：剩余的修改已写入
+        callback()
+
+    def get_stats(self):
+        """统计信息：修改数、写入数、批次数、待写入数和每批写入延迟（毫秒）"""
+        with self.condition:
+            stats = dict(self.stats)
+            stats['pending'] = sum(len(items) if kind == 'append' else 1
+                                   for _, kind, _, items in self.pending if kind != 'notify')
+        latency_total = stats.pop('latency_total')
+        stats['latency_avg_ms'] = latency_total / stats['batches'] * 1000 if stats['batches'] else 0.0
+        stats['latency_max_ms'] = stats.pop('latency_max') * 1000
+        return stats
+
+    def close(self, timeout=10):
+        """写入剩余的修改并停止线程"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+        stats = self.get_stats()
+        print(f"后台写入: 收到 {stats['queued']} 个修改，合并 {stats['coalesced']} 个，"
+              f"写入 {stats['written']} 个（{stats['batches']} 批，"
+              f"平均 {stats['latency_avg_ms']:.1f} ms，最长 {stats['latency_max_ms']:.1f} ms）")
+
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，写入中断时保留原文件"""
+    path = Path(path)
+    temp_file = path.with_name(path.name + ".tmp")
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
@@ -0,0 +1,286 @@
+"""
+@require/@resource 本地缓存
+依赖按内容寻址保存在磁盘上，多个脚本共享同一份副本；注入时无需访问网络
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+
+class IntegrityError(ValueError):
+    """下载内容与SRI哈希不一致"""
+
+
+def split_integrity(url):
+    """拆分URL中的SRI哈希：url#sha256=<hex> 或 url#sha256-<base64>
+
+    返回 (去掉SRI片段的URL, [(算法, 摘要字节)])，没有SRI时列表为空
+    """
+    base, sep, fragment = url.partition('#')
+    if not sep:
+        return url, []
+
+    hashes = []
+    for item in fragment.replace(';', ',').split(','):
+        item = item.strip()
+        for algorithm in ('sha256', 'sha384', 'sha512'):
+            try:
+                if item.startswith(algorithm + '='):
+                    hashes.append((algorithm, bytes.fromhex(item[len(algorithm) + 1:])))
+                elif item.startswith(algorithm + '-'):
+                    hashes.append((algorithm, base64.b64decode(item[len(algorithm) + 1:])))
+            except ValueError:
+                continue
+
+    # 片段不是SRI时保留原URL
+    if not hashes:
+        return url, []
+    return base, hashes
+
+
+class ResourceCache:
+    """按内容寻址的依赖缓存
+
+    索引键为 URL（含SRI片段），内容以 sha256 命名保存在 blobs 目录下。
+    后台刷新使用 ETag/Last-Modified 条件请求；刷新替换内容后、以及 retain() 清理不再使用的
+    条目后删除不再被引用的内容文件。
+    """
+
+    INDEX_FILE = "index.json"
+
+    # 单个依赖的大小上限
+    MAX_BYTES = 10 * 1024 * 1024
+
+    # 缓存超过该时间（秒）后在后台刷新
+    REFRESH_AFTER = 24 * 60 * 60
+
+    REQUEST_TIMEOUT = 15
+
+    def __init__(self, cache_dir, session=None, max_workers=4, on_update=None):
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+        self.session = session or requests.Session()
+
+        # 依赖下载或更新后调用（在工作线程中）
+        self.on_update = on_update
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="resource-cache")
+        self.lock = threading.Lock()
+
+        # 正在下载的键，避免重复请求
+        self.pending = set()
+
+        # 正在写入、尚未记入索引的内容文件（sha256），清理时保留
+        self.writing = set()
+
+        # 键 -> {url, sha256, etag, last_modified, content_type, fetched}
+        self.index = {}
+        self.load_index()
+
+    def load_index(self):
+        """加载缓存索引"""
+        index_file = self.cache_dir / self.INDEX_FILE
+        if not index_file.exists():
+            return
+
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except Exception as e:
+            print(f"读取依赖缓存索引时出错: {e}")
+            self.index = {}
+
+    def save_index(self):
+        """保存缓存索引，先写临时文件再替换"""
+        index_file = self.cache_dir / self.INDEX_FILE
+        temp_file = index_file.with_name(index_file.name + ".tmp")
+
+        with self.lock:
+            data = json.dumps(self.index, ensure_ascii=False)
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_file, index_file)
+        except Exception as e:
+            print(f"保存依赖缓存索引时出错: {e}")
+
+    def get_entry(self, key):
+        """获取缓存条目，内容文件缺失时视为未缓存"""
+        with self.lock:
+            entry = self.index.get(key)
+        if entry is None or not (self.blob_dir / entry['sha256']).exists():
+            return None
+        return entry
+
+    def get_bytes(self, key):
+        """读取缓存的内容（不访问网络），未缓存时返回 None"""
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        try:
+            return (self.blob_dir / entry['sha256']).read_bytes()
+        except OSError:
+            return None
+
+    def get_text(self, key):
+        """以文本形式读取缓存的内容"""
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        return data.decode('utf-8', errors='replace')
+
+    def ensure(self, keys):
+        """在后台下载缺失的依赖，并刷新过期的依赖
+
+        返回当前已全部缓存时为 True
+        """
+        ready = True
+        now = time.time()
+
+        for key in keys:
+            entry = self.get_entry(key)
+            if entry is None:
+                ready = False
+                self.schedule(key)
+            elif now - entry.get('fetched', 0) > self.REFRESH_AFTER:
+                self.schedule(key)
+
+        return ready
+
+    def schedule(self, key):
+        """提交后台下载任务"""
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        self.executor.submit(self._fetch_task, key)
+
+    def _fetch_task(self, key):
+        """后台任务：下载并在内容变化后通知；替换了已缓存的内容时删除旧的内容文件"""
+        try:
+            replaced = self.get_entry(key) is not None
+            changed = self.fetch(key)
+            self.save_index()
+            if changed and replaced:
+                self.collect_garbage()
+            if changed and self.on_update:
+                self.on_update(key)
+        except Exception as e:
+            print(f"下载依赖 {key} 时出错: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def fetch(self, key):
+        """下载单个依赖（已缓存时使用条件请求）
+
+        返回内容是否发生变化
+        """
+        url, hashes = split_integrity(key)
+        entry = self.get_entry(key)
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT,
+                                    stream=True)
+        try:
+            if response.status_code == 304 and entry is not None:
+                with self.lock:
+                    entry['fetched'] = time.time()
+                return False
+
+            response.raise_for_status()
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > self.MAX_BYTES:
+                    raise ValueError(f"依赖超过 {self.MAX_BYTES} 字节")
+                chunks.append(chunk)
+            data = b''.join(chunks)
+        finally:
+            response.close()
+
+        # 校验SRI哈希
+        for algorithm, digest in hashes:
+            if hashlib.new(algorithm, data).digest() != digest:
+                raise IntegrityError(f"{url} 的 {algorithm} 校验失败")
+
+        sha256 = hashlib.sha256(data).hexdigest()
+        blob_file = self.blob_dir / sha256
+        with self.lock:
+            self.writing.add(sha256)
+        try:
+            if not blob_file.exists():
+                temp_file = blob_file.with_name(sha256 + ".tmp")
+                temp_file.write_bytes(data)
+                os.replace(temp_file, blob_file)
+
+            changed = entry is None or entry['sha256'] != sha256
+            with self.lock:
+                self.index[key] = {
+                    'url': url,
+                    'sha256': sha256,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_type': response.headers.get('Content-Type', '').split(';')[0].strip(),
+                    'fetched': time.time()
+                }
+        finally:
+            with self.lock:
+                self.writing.discard(sha256)
+        return changed
+
+    def retain(self, keys):
+        """在后台删除 keys 以外的索引条目（脚本已删除或依赖的URL、SRI已变化），
+        然后删除不再被引用的内容文件"""
+        self.executor.submit(self._retain_task, set(keys))
+
+    def _retain_task(self, keys):
+        """后台任务：清理索引和内容文件"""
+        try:
+            with self.lock:
+                removed = [key for key in self.index if key not in keys and key not in self.pending]
+                for key in removed:
+                    del self.index[key]
+            if removed:
+                self.save_index()
+            self.collect_garbage()
+        except Exception as e:
+            print(f"清理依赖缓存时出错: {e}")
+
+    def collect_garbage(self):
+        """删除不再被索引引用的内容文件（包括中断的下载留下的临时文件）"""
+        with self.lock:
+            referenced = {entry['sha256'] for entry in self.index.values()} | self.writing
+        removed = 0
+        for blob_file in self.blob_dir.iterdir():
+            if blob_file.name.partition('.')[0] not in referenced:
+                try:
+                    blob_file.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            print(f"依赖缓存: 删除 {removed} 个不再使用的文件")
+
+    def shutdown(self):
+        """停止后台下载"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
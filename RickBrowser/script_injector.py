@@ -3,65 +3,1432 @@
 增强HTML5支持
 """
 
+import base64
+import hashlib
+import json
 import os
 import re
+import secrets
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from PyQt5.QtCore import *
+from PyQt5.QtQml import QJSEngine
 from PyQt5.QtWebEngineWidgets import QWebEngineScript
+from resource_cache import ResourceCache
+from gm_request import GMRequestService, connect_allowed, create_session
+from script_storage import ScriptStorage
+from script_updater import ScriptUpdater
+from script_telemetry import ScriptTelemetry
+from url_matcher import MatchIndex, PatternError, compile_pattern
 
-class ScriptInjector:
+class ScriptBodyCache:
+    """脚本内容（及脚本包）的LRU缓存，按占用内存限制大小"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        
+        # 脚本ID -> (内容哈希, 内容, 占用字节数)
+        self.entries = OrderedDict()
+    
+    def get(self, script_id, content_hash):
+        """获取缓存的内容，哈希不一致时视为未命中"""
+        entry = self.entries.get(script_id)
+        if entry is None or entry[0] != content_hash:
+            return None
+        self.entries.move_to_end(script_id)
+        return entry[1]
+    
+    def put(self, script_id, content_hash, content):
+        """缓存内容，超过上限时淘汰最久未使用的条目"""
+        self.discard(script_id)
+        
+        size = sys.getsizeof(content)
+        if size > self.max_bytes:
+            return
+        
+        self.entries[script_id] = (content_hash, content, size)
+        self.total_bytes += size
+        
+        while self.total_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+    
+    def discard(self, script_id):
+        """移除单个条目"""
+        entry = self.entries.pop(script_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+    
+    def clear(self):
+        """清空缓存"""
+        self.entries.clear()
+        self.total_bytes = 0
+
+class ScriptInjector(QObject):
     """脚本注入器，从scripts文件夹加载用户脚本"""
     
-    def __init__(self):
+    # 脚本增加、修改或删除后发出
+    scriptsChanged = pyqtSignal()
+    
+    # 页面脚本集合中脚本包的名称前缀：userscript-bundle:<分组>#<脚本包哈希>
+    # 同一注入时机、同一框架范围的匹配脚本合并为一个脚本包
+    BUNDLE_NAME_PREFIX = "userscript-bundle:"
+    
+    # 脚本包中每个脚本的隔离包装，一个脚本抛出异常不影响其他脚本；
+    # 语法错误会使整个脚本包无法解析，包装后的脚本先通过语法检查才放入脚本包
+    BUNDLE_ENTRY_WRAPPER = """try {
+%(source)s
+} catch (e) {
+    console.error('用户脚本 ' + %(name)s + ' 出错:', e);
+}
+"""
+    
+    # 脚本包按顶层页面的地址选出，也在子框架中运行（@noframes 除外）；顶层页面匹配不代表其中的
+    # 跨域 iframe 也匹配，所以子框架中每个脚本运行前按它自己的规则（CompiledPattern.js_rule）
+    # 检查框架的地址。检查函数只在脚本包的块内可见，页面访问不到
+    FRAME_MATCH = """(function() {
+    var href = location.href;
+    var scheme = location.protocol.slice(0, -1).toLowerCase();
+    var host = location.hostname.toLowerCase();
+    var path = location.pathname + location.search;
+    function regex(source, flags) {
+        try {
+            return new RegExp(source, flags);
+        } catch (e) {
+            return null;
+        }
+    }
+    function test(rule) {
+        var re;
+        if (rule.type === 'match') {
+            if (rule.schemes.indexOf(scheme) < 0) return false;
+            if (rule.host_kind === 'exact' && host !== rule.host) return false;
+            if (rule.host_kind === 'suffix' && host !== rule.host &&
+                host.slice(-rule.host.length - 1) !== '.' + rule.host) return false;
+            if (rule.path === null) return true;
+            re = regex('^(?:' + rule.path + ')$', 's');
+            return re !== null && re.test(path);
+        }
+        if (rule.type === 'glob') re = regex('^(?:' + rule.regex + ')$', 'is');
+        else re = regex(rule.regex, rule.flags);
+        return re !== null && re.test(href);
+    }
+    return function(rules) {
+        if (window.top === window) return true;
+        if (rules.excludes.some(test)) return false;
+        return rules.all || rules.matches.some(test);
+    };
+})()"""
+    FRAME_BUNDLE_WRAPPER = """{
+const __rickFrameMatch = %(frame_match)s;
+%(entries)s
+}
+"""
+    FRAME_ENTRY_WRAPPER = """if (__rickFrameMatch(%(rules)s)) {
+%(entry)s}
+"""
+    
+    # 只在这些协议的页面中注入用户脚本（新标签页等 data:/about: 页面除外）
+    INJECTABLE_SCHEMES = ('http', 'https', 'file', 'ftp')
+    
+    # 文件变化后等待的时间（毫秒），合并编辑器的连续写入
+    RELOAD_DELAY = 300
+    
+    # 元数据缓存文件（位于脚本文件夹内）及其格式版本
+    METADATA_CACHE_FILE = ".metadata_cache.json"
+    METADATA_CACHE_VERSION = 5
+    
+    # @run-at 对应的注入时机，未指定时与篡改猴一样使用 document-idle
+    RUN_AT_INJECTION_POINTS = {
+        'document-start': QWebEngineScript.DocumentCreation,
+        'document-body': QWebEngineScript.DocumentReady,
+        'document-end': QWebEngineScript.DocumentReady,
+        'document-idle': QWebEngineScript.Deferred,
+    }
+    DEFAULT_RUN_AT = 'document-idle'
+    
+    # 内存中保留的脚本内容上限（字节），超出后按LRU淘汰，需要时再从磁盘读取
+    BODY_CACHE_BYTES = 8 * 1024 * 1024
+    
+    # 按匹配集合缓存的脚本包内容上限（字节），热门网站可直接复用
+    BUNDLE_CACHE_BYTES = 16 * 1024 * 1024
+    
+    # @require/@resource 缓存目录（位于脚本文件夹内）
+    RESOURCE_CACHE_DIR = ".require_cache"
+    
+    # 有依赖的脚本的包装模板：提供 GM_getResourceText/GM_getResourceURL，
+    # 依次放入 @require 的内容，最后是脚本本身
+    DEPENDENCY_WRAPPER = """(function() {
+var GM_resources = %(resources)s;
+function GM_getResourceURL(name) {
+    var resource = GM_resources[name];
+    return resource ? 'data:' + resource.type + ';base64,' + resource.data : null;
+}
+function GM_getResourceText(name) {
+    var resource = GM_resources[name];
+    if (!resource) return null;
+    var bytes = Uint8Array.from(atob(resource.data), function(c) { return c.charCodeAt(0); });
+    return new TextDecoder().decode(bytes);
+}
+%(body)s
+})();
+"""
+    
+    # 耗时统计包装：测量脚本同步执行时间和 MutationObserver 回调时间，累加到所在环境的耗时记录中。
+    # 记录只接受带密钥的写入，计时使用记录在页面脚本运行前保存的 performance.now；
+    # 页面上找不到记录（例如未注入记录的框架）时只运行脚本，不计时
+    TELEMETRY_WRAPPER = """(function() {
+var __rickTimings = window.__rickTimings || {now: function() { return 0; }, add: function() {}};
+var __rickTimingKey = %(key)s;
+var __rickScriptId = %(script_id)s;
+var MutationObserver = (function(NativeObserver) {
+    function MutationObserver(callback) {
+        return new NativeObserver(function(mutations, observer) {
+            var start = __rickTimings.now();
+            try {
+                return callback.call(this, mutations, observer);
+            } finally {
+                __rickTimings.add(__rickTimingKey, __rickScriptId, __rickTimings.now() - start);
+            }
+        });
+    }
+    MutationObserver.prototype = NativeObserver.prototype;
+    return MutationObserver;
+})(window.MutationObserver);
+var __rickStart = __rickTimings.now();
+try {
+    (function() {
+%(body)s
+    }).call(this);
+} finally {
+    __rickTimings.add(__rickTimingKey, __rickScriptId, __rickTimings.now() - __rickStart);
+}
+})();
+"""
+    
+    # 每个文档（每个运行环境）的耗时记录，在文档创建时、页面脚本运行之前定义为 window 上
+    # 不可修改的属性；用到的内置函数在定义时保存，页面之后替换它们也不影响记录和读取。
+    # 读取时返回 JSON {page, timings: {脚本ID: 耗时ms}} 并清空，没有新记录时返回 null
+    TELEMETRY_STORE = """(function() {
+    if (Object.getOwnPropertyDescriptor(window, '__rickTimings')) return;
+    var key = %(key)s;
+    var stringify = JSON.stringify;
+    var create = Object.create;
+    var pageId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    var totals = create(null);
+    var empty = true;
+    Object.defineProperty(window, '__rickTimings', {value: Object.freeze({
+        now: performance.now.bind(performance),
+        add: function(k, id, ms) {
+            if (k !== key || typeof id !== 'string' || !(ms >= 0)) return;
+            totals[id] = (totals[id] || 0) + ms;
+            empty = false;
+        },
+        take: function(k) {
+            if (k !== key || empty) return null;
+            var report = create(null);
+            report.page = pageId;
+            report.timings = totals;
+            totals = create(null);
+            empty = true;
+            return stringify(report);
+        }
+    })});
+})();
+"""
+    
+    # 单个脚本在一个页面上的默认耗时预算（毫秒）
+    DEFAULT_CPU_BUDGET_MS = 200
+    
+    # GM 存储数据库（位于脚本文件夹内），以及合并写入后提交的延迟（毫秒）
+    STORAGE_FILE = ".storage.sqlite3"
+    STORAGE_FLUSH_DELAY = 1000
+    
+    # 支持的 @grant API；授权了其中任一API的脚本在独立的 ApplicationWorld 中运行，
+    # 页面脚本无法访问其存储和跨域请求，也无法伪造写入
+    GM_STORAGE_APIS = ('GM_getValue', 'GM_setValue', 'GM_deleteValue', 'GM_listValues')
+    GM4_STORAGE_APIS = ('GM.getValue', 'GM.setValue', 'GM.deleteValue', 'GM.listValues')
+    GM_XHR_APIS = ('GM_xmlhttpRequest', 'GM.xmlHttpRequest')
+    GM_APIS = GM_STORAGE_APIS + GM4_STORAGE_APIS + GM_XHR_APIS
+    
+    # GM_xmlhttpRequest 的工作线程数（也是每个主机保留的长连接数）
+    GM_REQUEST_WORKERS = 6
+    
+    # ApplicationWorld 中共享的 GM 运行时（每个文档只定义一次）：
+    # 值以 JSON 文本缓存在页面中，读取同步完成；写入合并后每个任务周期最多通过WebChannel发送一次。
+    # GM_xmlhttpRequest 经页面独立的 gm 通道发出，响应按块到达后再组装。
+    # 每个脚本的API只能用该脚本的密钥取得一次（密钥只出现在该脚本自己的包装中），
+    # 写入和请求也带着密钥，由Python一侧确定发出的脚本；运行时对象不可替换，
+    # 用到的 JSON 函数在定义时保存（运行时总在同一环境的用户脚本之前定义）。
+    # 离开页面前（beforeunload）立即发送写入，重新加载的文档能得到新值；
+    # 其他页面的写入经 storageChanged 按存储ID到达，本页尚未发送的写入优先
+    GM_RUNTIME = """if (!window.__rickGM) Object.defineProperty(window, '__rickGM', {value: (function() {
+    var stringify = JSON.stringify;
+    var parse = JSON.parse;
+    var hasOwn = Function.prototype.call.bind(Object.prototype.hasOwnProperty);
+    var stores = Object.create(null);
+    var tags = Object.create(null);
+    var issued = Object.create(null);
+    var pending = {};
+    var objects = null;
+    var timer = null;
+    var requests = {};
+    var queuedRequests = [];
+    var requestSeq = 0;
+    function flush() {
+        timer = null;
+        if (!objects) return;
+        var batch = [];
+        for (var key in pending) batch.push({key: key, set: pending[key].set, del: Object.keys(pending[key].del)});
+        if (batch.length === 0) return;
+        pending = {};
+        objects.gm.storageWrite(stringify(batch));
+    }
+    function schedule() {
+        if (!timer) timer = setTimeout(flush, 0);
+    }
+    function ops(gmKey) {
+        return pending[gmKey] || (pending[gmKey] = {set: {}, del: {}});
+    }
+    function sendRequest(payload) {
+        if (objects) objects.gm.xhrOpen(payload);
+        else queuedRequests.push(payload);
+    }
+    function callHandler(details, name, response) {
+        if (typeof details[name] !== 'function') return;
+        try {
+            details[name].call(details, response);
+        } catch (e) {
+            console.error('GM_xmlhttpRequest ' + name + ' 出错:', e);
+        }
+    }
+    function decodeBase64(chunks, loaded) {
+        var bytes = new Uint8Array(loaded);
+        var offset = 0;
+        chunks.forEach(function(chunk) {
+            var binary = atob(chunk);
+            for (var i = 0; i < binary.length; i++) bytes[offset++] = binary.charCodeAt(i);
+        });
+        return bytes.subarray(0, offset);
+    }
+    function makeResponse(state, readyState) {
+        var meta = state.meta || {status: 0, statusText: '', responseHeaders: '', finalUrl: state.url, total: 0};
+        var response = {
+            readyState: readyState,
+            status: meta.status,
+            statusText: meta.statusText,
+            responseHeaders: meta.responseHeaders,
+            finalUrl: meta.finalUrl,
+            loaded: state.loaded,
+            total: meta.total,
+            lengthComputable: meta.total > 0,
+            context: state.details.context
+        };
+        if (readyState === 4) {
+            var type = state.details.responseType || '';
+            if (state.binary) {
+                var bytes = decodeBase64(state.chunks, state.loaded);
+                response.response = type === 'blob' ? new Blob([bytes]) : bytes.buffer;
+            } else {
+                response.responseText = state.chunks.join('');
+                response.response = response.responseText;
+                if (type === 'json') {
+                    try {
+                        response.response = parse(response.responseText);
+                    } catch (e) {
+                        response.response = null;
+                    }
+                }
+            }
+        }
+        return response;
+    }
+    function handleEvent(payload) {
+        var event = parse(payload);
+        var state = requests[event.id];
+        if (!state) return;
+        var details = state.details;
+        var data = event.data;
+        if (event.type === 'start') {
+            state.meta = data;
+            callHandler(details, 'onreadystatechange', makeResponse(state, 2));
+        } else if (event.type === 'chunk') {
+            state.chunks.push(data.data);
+            state.loaded = data.loaded;
+            var progress = makeResponse(state, 3);
+            callHandler(details, 'onreadystatechange', progress);
+            callHandler(details, 'onprogress', progress);
+        } else {
+            delete requests[event.id];
+            var response = makeResponse(state, 4);
+            if (event.type === 'load') {
+                callHandler(details, 'onreadystatechange', response);
+                callHandler(details, 'onload', response);
+            } else {
+                response.error = data.error;
+                callHandler(details, event.type === 'timeout' ? 'ontimeout' : 'onerror', response);
+            }
+            callHandler(details, 'onloadend', response);
+        }
+    }
+    function handleStorageChange(payload) {
+        parse(payload).forEach(function(change) {
+            var gmKey = tags[change.tag];
+            var store = gmKey && stores[gmKey];
+            if (!store) return;
+            var own = pending[gmKey] || {set: {}, del: {}};
+            function local(key) {
+                return hasOwn(own.set, key) || hasOwn(own.del, key);
+            }
+            for (var key in change.set) {
+                if (hasOwn(change.set, key) && !local(key)) store[key] = change.set[key];
+            }
+            change.del.forEach(function(key) {
+                if (!local(key)) delete store[key];
+            });
+        });
+    }
+    window.addEventListener('beforeunload', flush);
+    window.addEventListener('pagehide', flush);
+    return Object.freeze({
+        seed: function(gmKey, tag, values) {
+            if (stores[gmKey]) return;
+            stores[gmKey] = values;
+            tags[tag] = gmKey;
+        },
+        attach: function(channelObjects) {
+            objects = channelObjects;
+            objects.gm.xhrEvent.connect(handleEvent);
+            objects.gm.storageChanged.connect(handleStorageChange);
+            queuedRequests.forEach(sendRequest);
+            queuedRequests = [];
+            schedule();
+        },
+        api: function(gmKey) {
+            if (issued[gmKey]) return null;
+            issued[gmKey] = true;
+            var store = stores[gmKey] || (stores[gmKey] = {});
+            var api = {
+                GM_getValue: function(key, defaultValue) {
+                    return hasOwn(store, key) ? parse(store[key]) : defaultValue;
+                },
+                GM_setValue: function(key, value) {
+                    var text = stringify(value);
+                    if (text === undefined) return api.GM_deleteValue(key);
+                    key = String(key);
+                    store[key] = text;
+                    var o = ops(gmKey);
+                    o.set[key] = text;
+                    delete o.del[key];
+                    schedule();
+                },
+                GM_deleteValue: function(key) {
+                    key = String(key);
+                    delete store[key];
+                    var o = ops(gmKey);
+                    delete o.set[key];
+                    o.del[key] = true;
+                    schedule();
+                },
+                GM_listValues: function() {
+                    return Object.keys(store);
+                },
+                GM_xmlhttpRequest: function(details) {
+                    var requestId = String(++requestSeq);
+                    var url = new URL(details.url, location.href).href;
+                    var binary = details.responseType === 'arraybuffer' || details.responseType === 'blob';
+                    requests[requestId] = {details: details, url: url, binary: binary, chunks: [], loaded: 0, meta: null};
+                    sendRequest(stringify({
+                        id: requestId,
+                        key: gmKey,
+                        method: details.method || 'GET',
+                        url: url,
+                        headers: details.headers || {},
+                        cookie: details.cookie == null ? null : String(details.cookie),
+                        data: details.data == null ? null : String(details.data),
+                        timeout: details.timeout || 0,
+                        binary: binary
+                    }));
+                    return {
+                        abort: function() {
+                            var state = requests[requestId];
+                            if (!state) return;
+                            delete requests[requestId];
+                            if (objects) objects.gm.xhrAbort(requestId);
+                            var response = makeResponse(state, 4);
+                            callHandler(details, 'onabort', response);
+                            callHandler(details, 'onloadend', response);
+                        }
+                    };
+                }
+            };
+            api.GM = {
+                getValue: function(key, defaultValue) { return Promise.resolve(api.GM_getValue(key, defaultValue)); },
+                setValue: function(key, value) { return Promise.resolve(api.GM_setValue(key, value)); },
+                deleteValue: function(key) { return Promise.resolve(api.GM_deleteValue(key)); },
+                listValues: function() { return Promise.resolve(api.GM_listValues()); },
+                xmlHttpRequest: function(details) {
+                    return new Promise(function(resolve, reject) {
+                        var wrapped = Object.assign({}, details, {
+                            onload: function(response) {
+                                callHandler(details, 'onload', response);
+                                resolve(response);
+                            },
+                            onerror: function(response) {
+                                callHandler(details, 'onerror', response);
+                                reject(response);
+                            },
+                            ontimeout: function(response) {
+                                callHandler(details, 'ontimeout', response);
+                                reject(response);
+                            },
+                            onabort: function(response) {
+                                callHandler(details, 'onabort', response);
+                                reject(response);
+                            }
+                        });
+                        api.GM_xmlhttpRequest(wrapped);
+                    });
+                }
+            };
+            return api;
+        }
+    });
+})()});
+if (window.__rickChannel) window.__rickGM.attach(window.__rickChannel);
+"""
+    
+    # 每个授权脚本的包装：只暴露 @grant 声明的API
+    GM_WRAPPER = """(function() {
+var __rickApi = window.__rickGM.api(%(key)s);
+%(declarations)s
+%(body)s
+})();
+"""
+    
+    # 依赖下载完成后发出（可能来自后台线程，连接到主线程时自动排队）
+    resourceFetched = pyqtSignal(str)
+    
+    # GM 存储有变化后发出：写入来自的页面通道, [{tag: 存储ID, set: {键: JSON文本}, del: [键]}]
+    storageChanged = pyqtSignal(str, object)
+    
+    # GM_xmlhttpRequest 事件（来自工作线程）：请求键, 事件类型, 数据
+    requestEvent = pyqtSignal(str, str, object)
+    
+    # 更新检查结果（来自工作线程，排队到主线程处理）
+    updateChecked = pyqtSignal(object)
+    
+    # 脚本自动更新后发出：脚本名称, 新版本
+    scriptUpdated = pyqtSignal(str, str)
+    
+    # 自动更新：同时检查的脚本数、每个脚本的检查间隔（秒）、
+    # 定时器周期与启动后首次检查的延迟（毫秒）
+    UPDATE_WORKERS = 4
+    UPDATE_INTERVAL = 24 * 60 * 60
+    UPDATE_TIMER_PERIOD = 60 * 60 * 1000
+    UPDATE_START_DELAY = 30 * 1000
+    
+    # 后台加载任务完成时发出（来自工作线程，排队到主线程处理结果）
+    loadProgress = pyqtSignal()
+    
+    # 全部脚本加载完成后发出
+    scriptsLoaded = pyqtSignal()
+    
+    # 后台加载脚本的工作线程数，以及每个解析任务处理的脚本数
+    LOAD_WORKERS = 4
+    LOAD_BATCH_SIZE = 32
+    
+    def __init__(self, scripts_dir="scripts"):
+        super().__init__()
+        
         # 脚本目录
-        self.scripts_dir = Path("scripts")
+        self.scripts_dir = Path(scripts_dir)
         self.scripts_dir.mkdir(exist_ok=True)
         
-        # 脚本缓存
+        # 脚本缓存（只保存元数据，内容按需读取）
         self.scripts = []
+        self.scripts_by_id = {}
+        self.body_cache = ScriptBodyCache(self.BODY_CACHE_BYTES)
+        self.bundle_cache = ScriptBodyCache(self.BUNDLE_CACHE_BYTES)
+        
+        # 语法检查结果：(脚本ID, 源码哈希) -> 是否可以放入脚本包
+        self.syntax_cache = {}
+        
+        # 每个脚本文件的状态：脚本ID -> (修改时间, 大小, 内容哈希)
+        self.file_states = {}
+        
+        # 持久化的元数据缓存：脚本ID -> {size, mtime, hash, metadata}（在后台加载时读取）
+        self.metadata_cache = {}
+        self.metadata_cache_dirty = False
+        
+        # 预编译的URL匹配索引
+        self.match_index = MatchIndex()
+        
+        # 执行耗时统计；可选在脚本超出每页耗时预算时自动禁用
+        self.telemetry = ScriptTelemetry()
+        self.telemetry_enabled = True
+        self.telemetry_key = secrets.token_hex(16)
+        
+        # 授权脚本的密钥（每次启动重新生成）：脚本ID -> 密钥，以及反向的 密钥 -> 脚本ID
+        self.gm_keys = {}
+        self.gm_key_scripts = {}
+        self.auto_disable = False
+        self.cpu_budget_ms = self.DEFAULT_CPU_BUDGET_MS
+        
+        # 共享的HTTP会话：依赖下载和 GM_xmlhttpRequest 复用同一组长连接
+        self.http_session = create_session(pool_size=self.GM_REQUEST_WORKERS)
+        
+        # @require/@resource 本地缓存，下载完成后通知页面重新同步
+        self.resource_cache = ResourceCache(self.scripts_dir / self.RESOURCE_CACHE_DIR,
+                                            session=self.http_session,
+                                            on_update=self.resourceFetched.emit)
+        self.resourceFetched.connect(self.handle_resource_fetched)
         
-        # 加载脚本
+        # GM_xmlhttpRequest：请求键 -> (页面中的请求ID, 事件回调)
+        self.gm_requests = GMRequestService(self.http_session,
+                                            max_workers=self.GM_REQUEST_WORKERS,
+                                            on_event=self.requestEvent.emit)
+        self.request_callbacks = {}
+        self.requestEvent.connect(self.dispatch_request_event)
+        
+        # @updateURL/@downloadURL 自动更新，结果在主线程中热替换
+        self.updater = ScriptUpdater(self.scripts_dir, self.parse_metadata,
+                                     session=self.http_session,
+                                     max_workers=self.UPDATE_WORKERS,
+                                     on_result=self.updateChecked.emit)
+        self.updateChecked.connect(self.apply_update)
+        self.update_timer = QTimer(self)
+        self.update_timer.setInterval(self.UPDATE_TIMER_PERIOD)
+        self.update_timer.timeout.connect(self.check_updates)
+        
+        # GM_setValue/GM_getValue 存储，页面批量上报的写入合并后定时提交
+        self.storage = ScriptStorage(self.scripts_dir / self.STORAGE_FILE)
+        self.storage_timer = QTimer(self)
+        self.storage_timer.setSingleShot(True)
+        self.storage_timer.setInterval(self.STORAGE_FLUSH_DELAY)
+        self.storage_timer.timeout.connect(self.storage.flush)
+        
+        # 监视脚本文件夹，增量重新加载
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_reload)
+        self.watcher.fileChanged.connect(self.schedule_reload)
+        
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(self.RELOAD_DELAY)
+        self.reload_timer.timeout.connect(self.reload_scripts)
+        
+        # 后台加载：扫描任务和逐个脚本的解析任务在线程池中运行，结果在主线程中应用
+        self.load_executor = ThreadPoolExecutor(max_workers=self.LOAD_WORKERS,
+                                                thread_name_prefix="script-loader")
+        self.loading = False
+        self.scan_future = None
+        self.scan_applied = False
+        
+        # 尚未应用的解析任务：[(每个脚本缓存的元数据或 None, future)]
+        self.pending_loads = []
+        # 总是排队处理：任务可能在提交线程中同步完成，不能在提交过程中重入
+        self.loadProgress.connect(self.drain_loads, Qt.QueuedConnection)
+        
+        # 加载脚本（不阻塞界面）
         self.load_scripts()
     
     def load_scripts(self):
-        """从scripts文件夹加载所有用户脚本"""
+        """在后台加载scripts文件夹中的所有用户脚本
+        
+        立即返回：目录扫描和脚本解析在线程池中进行，完成后发出 scriptsLoaded。
+        加载期间的导航通过 wait_for_scripts 只等待可能匹配的脚本。
+        """
         self.scripts.clear()
+        self.scripts_by_id.clear()
+        self.body_cache.clear()
+        self.file_states.clear()
+        self.match_index.clear()
+        
+        # 丢弃上一次尚未完成的加载
+        for _, future in self.pending_loads:
+            future.cancel()
+        self.pending_loads.clear()
         
         if not self.scripts_dir.exists():
             return
         
-        for script_file in self.scripts_dir.glob("*.user.js"):
+        self.loading = True
+        self.scan_applied = False
+        self.scan_future = self.load_executor.submit(self.scan_scripts_dir)
+        self.scan_future.add_done_callback(self.notify_load_progress)
+    
+    def notify_load_progress(self, future):
+        """后台任务完成（在工作线程中调用）"""
+        self.loadProgress.emit()
+    
+    def scan_scripts_dir(self):
+        """后台任务：读取元数据缓存并列出脚本文件
+        
+        返回 (元数据缓存, [(脚本文件, 文件状态)])，按文件名排序
+        """
+        metadata_cache = self.read_metadata_cache()
+        
+        files = []
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.scripts_dir)
+                 if entry.name.endswith(".user.js") and entry.is_file()),
+                key=lambda entry: entry.name
+            )
+        except OSError as e:
+            print(f"读取脚本文件夹时出错: {e}")
+            return metadata_cache, files
+        
+        for entry in entries:
             try:
-                with open(script_file, 'r', encoding='utf-8') as f:
-                    script_content = f.read()
-                    
-                    # 解析脚本元数据（类似篡改猴格式）
-                    metadata = self.parse_metadata(script_content)
-                    
-                    # 获取脚本名称
-                    script_name = metadata.get('name', script_file.name)
-                    
-                    # 获取匹配规则
-                    matches = metadata.get('match', [])
-                    excludes = metadata.get('exclude', [])
-                    
-                    self.scripts.append({
-                        'name': script_name,
-                        'path': script_file,
-                        'content': script_content,
-                        'matches': matches,
-                        'excludes': excludes,
-                        'enabled': True
-                    })
-                    
-                    print(f"加载脚本: {script_name}")
-                    
-            except Exception as e:
-                print(f"加载脚本 {script_file} 时出错: {e}")
+                files.append((self.scripts_dir / entry.name, entry.stat()))
+            except OSError:
+                continue
+        return metadata_cache, files
+    
+    def apply_scan(self):
+        """目录扫描完成：按批提交解析任务"""
+        self.scan_applied = True
+        self.metadata_cache, files = self.scan_future.result()
+        
+        # 按文件名固定注入顺序，与解析任务完成的先后无关
+        self.match_index.reserve([str(script_file) for script_file, _ in files])
+        
+        for start in range(0, len(files), self.LOAD_BATCH_SIZE):
+            batch = []
+            for script_file, stat in files[start:start + self.LOAD_BATCH_SIZE]:
+                cached = self.metadata_cache.get(str(script_file))
+                batch.append((script_file, stat, cached if self.cache_entry_matches(cached, stat) else None))
+            
+            future = self.load_executor.submit(self.prepare_script_batch, batch)
+            future.add_done_callback(self.notify_load_progress)
+            self.pending_loads.append(([cached for _, _, cached in batch], future))
+        
+        print(f"正在后台加载 {len(files)} 个脚本")
+    
+    def prepare_script_batch(self, batch):
+        """后台任务：解析一批脚本"""
+        return [self.prepare_script_file(script_file, stat, cached) for script_file, stat, cached in batch]
+    
+    def drain_loads(self):
+        """在主线程中应用已完成的后台任务，全部完成后结束加载"""
+        if not self.loading:
+            return
+        
+        if not self.scan_applied:
+            if not self.scan_future.done():
+                return
+            self.apply_scan()
+        
+        pending = []
+        for entry in self.pending_loads:
+            if entry[1].done():
+                for prepared in entry[1].result():
+                    self.apply_prepared_script(prepared)
+            else:
+                pending.append(entry)
+        self.pending_loads = pending
+        
+        if not self.pending_loads:
+            self.finish_loading()
+    
+    def wait_for_scripts(self, url=None):
+        """阻塞直到可能注入到URL的脚本都已加载（url 为 None 时等待全部脚本）
+        
+        元数据缓存有效的脚本无需等待解析即可判断是否匹配，
+        只有包含匹配的脚本或元数据未知（新增或已修改）的脚本的批次需要等待。
+        """
+        while self.loading:
+            scan_future = self.scan_future
+            if not self.scan_applied:
+                scan_future.result()
+                self.apply_scan()
+            
+            url_str = url.toString() if url is not None else None
+            for cached_list, future in self.pending_loads:
+                if future.done():
+                    continue
+                if url_str is not None and all(
+                        cached is not None and not self.metadata_matches(cached['metadata'], url_str)
+                        for cached in cached_list):
+                    continue
+                future.result()
+            
+            self.drain_loads()
+            
+            # 加载完成时可能重新开始（如创建示例脚本），此时需要再等待一轮
+            if url is not None and self.scan_future is scan_future:
+                return
+    
+    def metadata_matches(self, metadata, url):
+        """根据元数据判断脚本是否可能注入到URL（不需要编译后的规则）"""
+        for pattern in metadata.get('exclude', []):
+            if self.pattern_matches(pattern, url):
+                return False
+        
+        if not metadata.get('match') and not metadata.get('include'):
+            return True
+        
+        return any(self.pattern_matches(pattern, url, 'match') for pattern in metadata.get('match', [])) \
+            or any(self.pattern_matches(pattern, url) for pattern in metadata.get('include', []))
+    
+    def finish_loading(self):
+        """全部脚本加载完成"""
+        self.loading = False
+        self.scripts.sort(key=lambda script: script['id'])
+        self.save_metadata_cache()
+        self.update_watched_paths()
+        
+        # 清理已不被任何脚本使用的依赖缓存
+        self.resource_cache.retain(key for script in self.scripts
+                                   for key in self.get_dependency_keys(script))
         
         # 如果没有脚本，创建示例脚本
         if len(self.scripts) == 0:
             self.create_example_script()
+            return
+        
+        print(f"已加载 {len(self.scripts)} 个脚本")
+        
+        # 启动定时更新检查
+        if not self.update_timer.isActive():
+            self.update_timer.start()
+            QTimer.singleShot(self.UPDATE_START_DELAY, self.check_updates)
+        
+        self.scriptsLoaded.emit()
+        self.scriptsChanged.emit()
+    
+    def sync_scripts(self):
+        """增量同步脚本文件夹：只解析新增或修改的文件，移除已删除的文件
+        
+        返回是否有脚本发生变化
+        """
+        changed = False
+        seen = set()
+        
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.scripts_dir)
+                 if entry.name.endswith(".user.js") and entry.is_file()),
+                key=lambda entry: entry.name
+            )
+        except OSError as e:
+            print(f"读取脚本文件夹时出错: {e}")
+            return False
+        
+        for entry in entries:
+            script_file = self.scripts_dir / entry.name
+            script_id = str(script_file)
+            seen.add(script_id)
+            
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            
+            state = self.file_states.get(script_id)
+            if state is not None and state[:2] == (stat.st_mtime, stat.st_size):
+                continue
+            
+            if self.load_script_file(script_file, stat, state):
+                changed = True
+        
+        # 移除已删除的脚本
+        for script_id in list(self.file_states):
+            if script_id not in seen:
+                self.remove_script(script_id)
+                changed = True
+        
+        self.update_watched_paths()
+        return changed
+    
+    def cache_entry_matches(self, cached, stat):
+        """元数据缓存条目的大小和修改时间是否与文件一致"""
+        return cached is not None and (cached['size'], cached['mtime']) == (stat.st_size, stat.st_mtime)
+    
+    def read_script_file(self, script_file):
+        """读取脚本内容，返回 (内容, 内容哈希)，出错时返回 (None, None)"""
+        try:
+            with open(script_file, 'r', encoding='utf-8') as f:
+                script_content = f.read()
+        except Exception as e:
+            print(f"加载脚本 {script_file} 时出错: {e}")
+            return None, None
+        return script_content, hashlib.sha1(script_content.encode('utf-8')).hexdigest()
+    
+    def prepare_script_file(self, script_file, stat, cached):
+        """后台任务：读取并解析脚本（不修改注入器的状态）
+        
+        cached 为有效的元数据缓存条目时不读取文件。
+        返回 (脚本文件, 文件状态, 内容哈希, 元数据, 脚本记录)；读取失败时内容哈希为 None，
+        解析失败时脚本记录为 None
+        """
+        if cached is not None:
+            content_hash, metadata = cached['hash'], cached['metadata']
+        else:
+            script_content, content_hash = self.read_script_file(script_file)
+            if script_content is None:
+                return script_file, stat, None, None, None
+            try:
+                metadata = self.parse_metadata(script_content)
+            except Exception as e:
+                print(f"加载脚本 {script_file} 时出错: {e}")
+                return script_file, stat, content_hash, None, None
+        
+        return script_file, stat, content_hash, metadata, \
+            self.build_script(script_file, content_hash, metadata)
+    
+    def apply_prepared_script(self, prepared):
+        """在主线程中登记后台解析的脚本"""
+        script_file, stat, content_hash, metadata, script = prepared
+        if content_hash is None:
+            return
+        
+        script_id = str(script_file)
+        self.file_states[script_id] = (stat.st_mtime, stat.st_size, content_hash)
+        if metadata is not None and not self.cache_entry_matches(self.metadata_cache.get(script_id), stat):
+            self.update_metadata_cache(script_id, stat, content_hash, metadata)
+        if script is not None:
+            self.add_script(script)
+    
+    def load_script_file(self, script_file, stat, state=None):
+        """解析单个脚本文件的元数据，内容未变化时只更新文件状态
+        
+        返回脚本是否发生变化
+        """
+        script_id = str(script_file)
+        
+        script_content, content_hash = self.read_script_file(script_file)
+        if script_content is None:
+            return False
+        
+        self.file_states[script_id] = (stat.st_mtime, stat.st_size, content_hash)
+        
+        # 仅修改时间变化（如 touch），内容相同则无需重新解析
+        if state is not None and state[2] == content_hash and script_id in self.scripts_by_id:
+            self.update_metadata_cache(script_id, stat, content_hash,
+                                       self.scripts_by_id[script_id]['metadata'])
+            return False
+        
+        try:
+            # 解析脚本元数据（类似篡改猴格式）
+            metadata = self.parse_metadata(script_content)
+        except Exception as e:
+            print(f"加载脚本 {script_file} 时出错: {e}")
+            return False
+        self.update_metadata_cache(script_id, stat, content_hash, metadata)
+        
+        script = self.build_script(script_file, content_hash, metadata)
+        if script is None:
+            return False
+        
+        self.add_script(script)
+        return True
+    
+    def build_script(self, script_file, content_hash, metadata):
+        """由元数据生成脚本记录（不修改注入器的状态，可在工作线程中调用）"""
+        try:
+            # 获取脚本名称
+            script_name = metadata.get('name', script_file.name)
+            
+            # 获取并编译匹配规则
+            matches = metadata.get('match', []) + metadata.get('include', [])
+            excludes = metadata.get('exclude', [])
+            compiled_matches, compiled_excludes = self.compile_rules(metadata, script_name)
+            
+            # 支持的 @grant API
+            grants = [api for api in metadata.get('grant', []) if api in self.GM_APIS]
+            
+            # 注入时机与是否在子框架中运行
+            run_at = metadata.get('run-at', self.DEFAULT_RUN_AT)
+            if run_at not in self.RUN_AT_INJECTION_POINTS:
+                print(f"脚本 '{script_name}' 的 @run-at {run_at} 无效，使用 {self.DEFAULT_RUN_AT}")
+                run_at = self.DEFAULT_RUN_AT
+            
+            return {
+                'id': str(script_file),
+                'name': script_name,
+                'path': script_file,
+                'hash': content_hash,
+                'metadata': metadata,
+                'matches': matches,
+                'excludes': excludes,
+                'compiled_matches': compiled_matches,
+                'compiled_excludes': compiled_excludes,
+                'run_at': run_at,
+                'noframes': bool(metadata.get('noframes')),
+                'requires': metadata.get('require', []),
+                'resources': self.parse_resources(metadata.get('resource', [])),
+                'grants': grants,
+                'connects': metadata.get('connect', []),
+                'sandboxed': bool(grants),
+                'storage_id': f"{metadata.get('namespace', '')}/{script_name}",
+                'enabled': True
+            }
+        except Exception as e:
+            print(f"加载脚本 {script_file} 时出错: {e}")
+            return None
+    
+    def add_script(self, script):
+        """登记脚本并更新匹配索引，替换同ID的旧脚本时保留其启用状态"""
+        script_id = script['id']
+        old_script = self.scripts_by_id.get(script_id)
+        if old_script is not None:
+            script['enabled'] = old_script['enabled']
+            self.scripts[self.scripts.index(old_script)] = script
+            self.match_index.remove(script_id)
+        else:
+            self.scripts.append(script)
+        self.scripts_by_id[script_id] = script
+        self.match_index.add(script_id,
+                             script['compiled_matches'],
+                             script['compiled_excludes'],
+                             match_all=not script['matches'])
+        
+        # 在后台预先下载依赖
+        self.resource_cache.ensure(self.get_dependency_keys(script))
+        
+        print(f"{'重新加载' if old_script else '加载'}脚本: {script['name']}")
+    
+    def parse_resources(self, values):
+        """解析 @resource 行：名称 URL"""
+        resources = []
+        for value in values:
+            parts = value.split(None, 1)
+            if len(parts) == 2:
+                resources.append((parts[0], parts[1].strip()))
+        return resources
+    
+    def get_dependency_keys(self, script):
+        """脚本的全部依赖（@require 与 @resource 的URL）"""
+        return script['requires'] + [url for _, url in script['resources']]
+    
+    def get_source_hash(self, script):
+        """脚本及其依赖的组合哈希，依赖尚未缓存时返回 None
+        
+        只读取缓存索引，不读取依赖内容
+        """
+        keys = self.get_dependency_keys(script)
+        if not keys:
+            return script['hash']
+        
+        digest = hashlib.sha1(script['hash'].encode('ascii'))
+        for key in keys:
+            entry = self.resource_cache.get_entry(key)
+            if entry is None:
+                return None
+            digest.update(entry['sha256'].encode('ascii'))
+        return digest.hexdigest()
+    
+    def build_script_source(self, script):
+        """组装注入的源码：依赖、GM API 与耗时统计包装；依赖内容缺失时返回 None"""
+        source = self.build_dependency_source(script)
+        if source is None:
+            return None
+        if script['sandboxed']:
+            source = self.build_gm_source(script, source)
+        if not self.telemetry_enabled:
+            return source
+        
+        return self.TELEMETRY_WRAPPER % {
+            'script_id': json.dumps(script['id']),
+            'key': json.dumps(self.telemetry_key),
+            'body': source
+        }
+    
+    def get_timing_store_source(self):
+        """页面中耗时记录的定义（在文档创建时注入）"""
+        return self.TELEMETRY_STORE % {'key': json.dumps(self.telemetry_key)}
+    
+    def get_timing_take_source(self):
+        """读取并清空页面中耗时记录的表达式"""
+        return "window.__rickTimings ? window.__rickTimings.take(%s) : null" % json.dumps(self.telemetry_key)
+    
+    def get_gm_key(self, script):
+        """授权脚本的密钥：页面中取得该脚本的 API、写入存储和发起请求都需要它"""
+        key = self.gm_keys.get(script['id'])
+        if key is None:
+            key = self.gm_keys[script['id']] = secrets.token_hex(16)
+            self.gm_key_scripts[key] = script['id']
+        return key
+    
+    def get_gm_script(self, key):
+        """密钥对应的授权脚本，密钥无效时返回 None"""
+        script = self.scripts_by_id.get(self.gm_key_scripts.get(key))
+        return script if script is not None and script['sandboxed'] else None
+    
+    def build_gm_source(self, script, source):
+        """为授权脚本声明 @grant 的 GM API（@require 的库也可以使用）"""
+        declarations = [f"var {api} = __rickApi.{api};"
+                        for api in script['grants'] if not api.startswith('GM.')]
+        if any(api.startswith('GM.') for api in script['grants']):
+            declarations.append("var GM = __rickApi.GM;")
+        
+        return self.GM_WRAPPER % {
+            'key': json.dumps(self.get_gm_key(script)),
+            'declarations': '\n'.join(declarations),
+            'body': source
+        }
+    
+    def build_dependency_source(self, script):
+        """有依赖时将 @require 内容放在脚本之前（不访问网络）
+        
+        检查哈希之后依赖的内容文件可能已被删除，这时与尚未缓存一样在后台下载并返回 None
+        """
+        content = self.get_script_content(script)
+        if not script['requires'] and not script['resources']:
+            return content
+        
+        parts = []
+        for key in script['requires']:
+            text = self.resource_cache.get_text(key)
+            if text is None:
+                return self.dependency_missing(script)
+            parts.append(text)
+        parts.append(content)
+        
+        resources = {}
+        for name, key in script['resources']:
+            entry = self.resource_cache.get_entry(key)
+            data = self.resource_cache.get_bytes(key)
+            if entry is None or data is None:
+                return self.dependency_missing(script)
+            resources[name] = {
+                'type': entry['content_type'] or 'application/octet-stream',
+                'data': base64.b64encode(data).decode('ascii')
+            }
+        
+        return self.DEPENDENCY_WRAPPER % {
+            'resources': json.dumps(resources),
+            'body': '\n;\n'.join(parts)
+        }
+    
+    def dependency_missing(self, script):
+        """依赖内容缺失：在后台重新下载，本次不注入该脚本"""
+        self.resource_cache.ensure(self.get_dependency_keys(script))
+        print(f"脚本 '{script['name']}' 的依赖内容缺失，暂不注入")
+        return None
+    
+    def record_timings(self, payload, url):
+        """处理页面上报的脚本耗时
+        
+        payload 为耗时记录读取的 JSON：{page, timings: {脚本ID: 耗时ms}}；url 为页面的地址，
+        只记录匹配该地址的脚本，页面无法为其他脚本伪造耗时。
+        返回因超出预算而被自动禁用的脚本名称列表
+        """
+        try:
+            report = json.loads(payload)
+            page_id = str(report['page'])
+            timings = dict(report['timings'])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"无效的脚本耗时报告: {e}")
+            return []
+        
+        host = url.host()
+        injected = set(self.match_index.lookup(url.toString()))
+        disabled = []
+        for script_id, ms in timings.items():
+            script = self.scripts_by_id.get(script_id)
+            if script is None or script_id not in injected:
+                continue
+            
+            try:
+                ms = float(ms)
+            except (TypeError, ValueError):
+                continue
+            if not 0 <= ms < float('inf'):
+                continue
+            page_total = self.telemetry.record(page_id, host, script['id'], ms)
+            
+            if self.auto_disable and script['enabled'] and page_total > self.cpu_budget_ms:
+                script['enabled'] = False
+                disabled.append(script['name'])
+                print(f"脚本 '{script['name']}' 在 {host} 耗时 {page_total:.0f}ms，"
+                      f"超出预算 {self.cpu_budget_ms}ms，已自动禁用")
+        
+        if disabled:
+            self.scriptsChanged.emit()
+        return disabled
+    
+    def handle_storage_write(self, payload, origin=""):
+        """处理页面批量上报的 GM 存储写入
+        
+        payload 为 JSON：[{key, set: {键: JSON文本}, del: [键]}]，按密钥确定写入的脚本，
+        只写入该脚本自己的存储；写入合并后定时在一个事务中提交。
+        origin 为发出写入的页面通道，值有变化时通过 storageChanged 通知各页面
+        """
+        changes = []
+        try:
+            batch = json.loads(payload)
+            for item in batch:
+                script = self.get_gm_script(item['key'])
+                if script is None:
+                    continue
+                change = self.storage.apply(script['storage_id'], item.get('set', {}), item.get('del', []))
+                if change is not None:
+                    changes.append(dict(change, tag=script['storage_id']))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"无效的脚本存储写入: {e}")
+        
+        if self.storage.has_pending() and not self.storage_timer.isActive():
+            self.storage_timer.start()
+        if changes:
+            self.storageChanged.emit(origin, changes)
+    
+    def filter_storage_changes(self, changes, url):
+        """只保留在 url 中运行的授权脚本的存储变化，其他脚本的值不发给该页面"""
+        tags = {script['storage_id'] for script in self.get_matching_scripts(url) if script['sandboxed']}
+        return [change for change in changes if change['tag'] in tags]
+    
+    def open_request(self, bridge_key, payload, page_host, callback):
+        """发起用户脚本的 GM_xmlhttpRequest
+        
+        bridge_key 区分发起请求的页面；payload 为 JSON：
+        {id, key, method, url, headers, cookie, data, timeout, binary}，key 为发起请求的脚本的密钥。
+        事件以 JSON {id, type, data} 通过 callback 在主线程中返回
+        """
+        try:
+            request = json.loads(payload)
+            request_id = str(request['id'])
+            script = self.get_gm_script(request.get('key'))
+            host = QUrl(str(request.get('url', ''))).host()
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"无效的 GM_xmlhttpRequest 请求: {e}")
+            return
+        
+        key = f"{bridge_key}:{request_id}"
+        if script is None or not any(api in self.GM_XHR_APIS for api in script['grants']):
+            error = "脚本未授权 GM_xmlhttpRequest"
+        elif not connect_allowed(host, script['connects'], page_host):
+            error = f"脚本的 @connect 不允许访问 {host}"
+        else:
+            self.request_callbacks[key] = (request_id, callback)
+            try:
+                self.gm_requests.open(key, request)
+                return
+            except ValueError as e:
+                del self.request_callbacks[key]
+                error = str(e)
+        
+        print(f"GM_xmlhttpRequest 被拒绝: {error}")
+        callback(json.dumps({'id': request_id, 'type': 'error', 'data': {'error': error}},
+                            ensure_ascii=False))
+    
+    def dispatch_request_event(self, key, event, data):
+        """将请求事件转发给发起请求的页面（在主线程中）"""
+        entry = self.request_callbacks.get(key)
+        if entry is None:
+            return
+        if event in ('load', 'error', 'timeout'):
+            del self.request_callbacks[key]
+        
+        request_id, callback = entry
+        callback(json.dumps({'id': request_id, 'type': event, 'data': data}, ensure_ascii=False))
+    
+    def abort_request(self, bridge_key, request_id):
+        """中止页面发起的请求"""
+        key = f"{bridge_key}:{request_id}"
+        self.request_callbacks.pop(key, None)
+        self.gm_requests.abort(key)
+    
+    def abort_requests(self, bridge_key):
+        """页面关闭：中止其全部请求"""
+        prefix = f"{bridge_key}:"
+        for key in [key for key in self.request_callbacks if key.startswith(prefix)]:
+            del self.request_callbacks[key]
+            self.gm_requests.abort(key)
+    
+    def get_update_urls(self, script):
+        """脚本的 (更新检查URL, 下载URL)，只接受 http/https"""
+        metadata = script['metadata']
+        urls = []
+        for key in ('updateURL', 'downloadURL'):
+            url = metadata.get(key)
+            urls.append(url if isinstance(url, str) and url.startswith(('http://', 'https://')) else None)
+        return tuple(urls)
+    
+    def check_updates(self, force=False):
+        """在后台检查有更新地址的脚本（force 为 False 时只检查到期的脚本）
+        
+        返回提交检查的脚本数
+        """
+        if self.loading:
+            return 0
+        
+        items = []
+        for script in self.scripts:
+            update_url, download_url = self.get_update_urls(script)
+            if not (update_url or download_url):
+                continue
+            if not force and not self.updater.is_due(script['id'], self.UPDATE_INTERVAL):
+                continue
+            items.append({
+                'id': script['id'],
+                'name': script['name'],
+                'version': script['metadata'].get('version'),
+                'hash': script['hash'],
+                'update_url': update_url,
+                'download_url': download_url
+            })
+        
+        self.updater.forget(set(self.scripts_by_id))
+        return self.updater.check(items)
+    
+    def apply_update(self, result):
+        """热替换更新后的脚本（在主线程中）
+        
+        检查期间本地文件被修改过时放弃更新，以免覆盖用户的编辑；
+        写入成功后才记录这次检查的 ETag/Last-Modified，放弃或写入失败时清除检查状态
+        """
+        if result['status'] == 'error':
+            print(f"检查脚本 '{result['name']}' 的更新时出错: {result['error']}")
+            return
+        if result['status'] != 'updated':
+            return
+        
+        script = self.scripts_by_id.get(result['id'])
+        if script is None or script['hash'] != result['hash']:
+            print(f"脚本 '{result['name']}' 在检查更新期间已被修改，跳过更新")
+            self.updater.discard_state(result['id'])
+            return
+        
+        script_file = Path(script['path'])
+        temp_file = script_file.with_name(script_file.name + ".update")
+        try:
+            with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+                f.write(result['content'])
+            os.replace(temp_file, script_file)
+        except Exception as e:
+            print(f"写入脚本 '{result['name']}' 的更新时出错: {e}")
+            self.updater.discard_state(result['id'])
+            return
+        
+        self.updater.commit_state(result['id'], result['state'])
+        print(f"脚本 '{result['name']}' 已更新到 {result['version']}")
+        self.reload_scripts()
+        self.scriptUpdated.emit(result['name'], result['version'])
+    
+    def close(self):
+        """提交尚未保存的存储写入并停止后台任务和进行中的请求"""
+        self.storage_timer.stop()
+        self.storage.close()
+        self.load_executor.shutdown(wait=False, cancel_futures=True)
+        self.update_timer.stop()
+        self.updater.shutdown()
+        self.gm_requests.shutdown()
+        self.resource_cache.shutdown()
+    
+    def set_script_enabled(self, script_id, enabled):
+        """启用或禁用脚本"""
+        script = self.scripts_by_id.get(script_id)
+        if script is not None and script['enabled'] != enabled:
+            script['enabled'] = enabled
+            self.scriptsChanged.emit()
+    
+    def get_script_stats(self):
+        """脚本耗时统计：[(脚本, 整体统计, [(主机, 统计)])]，统计为 (页面数, p50, p95)"""
+        return [
+            (script,
+             self.telemetry.script_stats(script['id']),
+             self.telemetry.host_stats(script['id']))
+            for script in self.scripts
+        ]
+    
+    def handle_resource_fetched(self, key):
+        """依赖下载完成：使用该依赖的脚本在下次导航时注入"""
+        print(f"已缓存依赖: {key}")
+        self.scriptsChanged.emit()
+    
+    def get_script_content(self, script):
+        """获取脚本内容：优先使用LRU缓存，未命中时从磁盘读取"""
+        content = self.body_cache.get(script['id'], script['hash'])
+        if content is None:
+            with open(script['path'], 'r', encoding='utf-8') as f:
+                content = f.read()
+            self.body_cache.put(script['id'], script['hash'], content)
+        return content
+    
+    def read_metadata_cache(self):
+        """读取持久化的元数据缓存（不修改注入器的状态，可在工作线程中调用）"""
+        cache_file = self.scripts_dir / self.METADATA_CACHE_FILE
+        if not cache_file.exists():
+            return {}
+        
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.METADATA_CACHE_VERSION:
+                return data.get('scripts', {})
+        except Exception as e:
+            print(f"读取脚本元数据缓存时出错: {e}")
+        return {}
+    
+    def update_metadata_cache(self, script_id, stat, content_hash, metadata):
+        """更新单个脚本的缓存条目"""
+        self.metadata_cache[script_id] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': content_hash,
+            'metadata': metadata
+        }
+        self.metadata_cache_dirty = True
+    
+    def save_metadata_cache(self):
+        """保存元数据缓存（只保留仍存在的脚本），先写临时文件再替换"""
+        stale = set(self.metadata_cache) - set(self.file_states)
+        for script_id in stale:
+            del self.metadata_cache[script_id]
+        
+        if not (self.metadata_cache_dirty or stale):
+            return
+        
+        cache_file = self.scripts_dir / self.METADATA_CACHE_FILE
+        temp_file = cache_file.with_name(cache_file.name + ".tmp")
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': self.METADATA_CACHE_VERSION,
+                    'scripts': self.metadata_cache
+                }, f, ensure_ascii=False)
+            os.replace(temp_file, cache_file)
+            self.metadata_cache_dirty = False
+        except Exception as e:
+            print(f"保存脚本元数据缓存时出错: {e}")
+    
+    def remove_script(self, script_id):
+        """移除已删除的脚本"""
+        self.file_states.pop(script_id, None)
+        self.body_cache.discard(script_id)
+        self.telemetry.forget(script_id)
+        script = self.scripts_by_id.pop(script_id, None)
+        if script is not None:
+            self.scripts.remove(script)
+            self.match_index.remove(script_id)
+            print(f"移除脚本: {script['name']}")
+    
+    def update_watched_paths(self):
+        """同步文件监视列表（编辑器原子保存会使文件被移出监视列表）"""
+        watched = set(self.watcher.files()) | set(self.watcher.directories())
+        
+        wanted = set(self.file_states)
+        if self.scripts_dir.exists():
+            wanted.add(str(self.scripts_dir))
+        
+        added = wanted - watched
+        removed = watched - wanted
+        if added:
+            self.watcher.addPaths(list(added))
+        if removed:
+            self.watcher.removePaths(list(removed))
+    
+    def schedule_reload(self, path=None):
+        """文件变化时延迟重新加载"""
+        self.reload_timer.start()
     
     def create_example_script(self):
         """创建示例脚本"""
@@ -178,89 +1545,286 @@ class ScriptInjector:
                     line = line[4:].strip()
                     
                     # 分割键值
-                    if ' ' in line:
-                        key, value = line.split(' ', 1)
+                    if ' ' in line or '\t' in line:
+                        key, value = line.split(None, 1)
                         key = key.strip()
                         value = value.strip()
                         
                         # 处理数组类型的元数据（如 @match）
-                        if key in ['match', 'include', 'exclude']:
+                        if key in ['match', 'include', 'exclude', 'require', 'resource', 'grant', 'connect']:
                             if key not in metadata:
                                 metadata[key] = []
                             metadata[key].append(value)
                         else:
                             metadata[key] = value
+                    elif line:
+                        # 无值的标记（如 @noframes）
+                        metadata[line] = True
         
         return metadata
     
+    def compile_rules(self, metadata, script_name):
+        """编译脚本的匹配规则，无效规则在加载时报告并跳过"""
+        compiled = {'match': [], 'exclude': []}
+        
+        for key, kind, target in (('match', 'match', 'match'),
+                                  ('include', 'include', 'match'),
+                                  ('exclude', 'include', 'exclude')):
+            for pattern in metadata.get(key, []):
+                try:
+                    compiled[target].append(compile_pattern(pattern, kind))
+                except PatternError as e:
+                    print(f"脚本 '{script_name}' 的 @{key} 规则无效，已忽略: {e}")
+        
+        return compiled['match'], compiled['exclude']
+    
     def should_inject(self, script, url):
         """检查是否应该为当前URL注入脚本"""
         url_str = url.toString()
         
         # 检查排除规则
-        for exclude_pattern in script.get('excludes', []):
-            if self.pattern_matches(exclude_pattern, url_str):
+        for exclude_pattern in script.get('compiled_excludes', []):
+            if exclude_pattern.matches(url_str):
                 return False
         
         # 检查匹配规则
-        matches = script.get('matches', [])
-        if not matches:  # 如果没有匹配规则，注入所有页面
+        if not script.get('matches'):  # 如果没有匹配规则，注入所有页面
             return True
         
-        for match_pattern in matches:
-            if self.pattern_matches(match_pattern, url_str):
+        for match_pattern in script.get('compiled_matches', []):
+            if match_pattern.matches(url_str):
                 return True
         
         return False
     
-    def pattern_matches(self, pattern, url):
-        """检查URL是否匹配模式"""
+    def pattern_matches(self, pattern, url, kind='include'):
+        """检查URL是否匹配模式（kind 为 'match' 时按 @match 语法解析）"""
         try:
-            # 将篡改猴模式转换为正则表达式
-            regex_pattern = pattern
-            
-            # 转义正则表达式特殊字符，但保留通配符(*)
-            regex_pattern = re.escape(regex_pattern)
-            
-            # 将转义后的通配符(*)恢复为正则表达式通配符(.*)
-            regex_pattern = regex_pattern.replace(r'\*', '.*')
+            return self._compile_pattern(pattern, kind).matches(url)
+        except PatternError:
+            return False
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _compile_pattern(pattern, kind):
+        """编译并缓存单个匹配模式"""
+        return compile_pattern(pattern, kind)
+    
+    def get_matching_scripts(self, url):
+        """通过匹配索引获取应注入到URL的脚本"""
+        return [self.scripts_by_id[key] for key in self.match_index.lookup(url.toString())
+                if self.scripts_by_id[key]['enabled']]
+    
+    def inject_to_page(self, page, url=None):
+        """将匹配的脚本同步到页面的脚本集合
+        
+        在导航开始、文档创建之前调用。匹配的脚本按注入时机、框架范围和运行环境分组，
+        每组合并为一个脚本包；脚本包以其包含脚本（含依赖和存储快照）的哈希命名，
+        只有哈希变化时才重新插入，不再需要的脚本包会被移除。
+        """
+        if url is None:
+            url = page.url()
+        current_url = url.toString()
+        
+        groups, wanted = self.plan_injection(url)
+        
+        collection = page.scripts()
+        
+        # 已注入的脚本包：分组 -> (脚本包哈希, 脚本对象)
+        injected = {}
+        for script_obj in collection.toList():
+            name = script_obj.name()
+            if name.startswith(self.BUNDLE_NAME_PREFIX):
+                group, _, bundle_hash = name[len(self.BUNDLE_NAME_PREFIX):].rpartition('#')
+                injected[group] = (bundle_hash, script_obj)
+        
+        # 移除不再需要或内容已变化的脚本包
+        for group, (bundle_hash, script_obj) in injected.items():
+            if wanted.get(group) != bundle_hash:
+                collection.remove(script_obj)
+        
+        # 插入新的或内容已变化的脚本包
+        for group, bundle_hash in wanted.items():
+            existing = injected.get(group)
+            if existing is not None and existing[0] == bundle_hash:
+                continue
             
-            # 匹配整个URL
-            regex_pattern = f'^{regex_pattern}$'
+            entries = groups[group]
+            names = ', '.join(script['name'] for script, _ in entries)
+            try:
+                first = entries[0][0]
+                run_at, noframes = first['run_at'], first['noframes']
+                
+                # 设置脚本包内容（同一匹配集合复用已生成的脚本包）；
+                # 依赖内容缺失的脚本被跳过时，名称中的哈希与计划不同，下载完成后同步时会重新插入
+                source, complete = self.build_page_source(group, entries)
+                
+                # 创建脚本对象
+                script_obj = QWebEngineScript()
+                script_obj.setName(f"{self.BUNDLE_NAME_PREFIX}{group}#{bundle_hash}"
+                                   f"{'' if complete else '-partial'}")
+                script_obj.setSourceCode(source)
+                
+                # 按 @run-at 设置注入时机，@noframes 的脚本只在主框架运行，
+                # 其他脚本在子框架中先检查框架的地址；
+                # 使用 GM API 的脚本在页面脚本无法访问的 ApplicationWorld 中运行
+                script_obj.setInjectionPoint(self.RUN_AT_INJECTION_POINTS[run_at])
+                script_obj.setWorldId(QWebEngineScript.ApplicationWorld if first['sandboxed']
+                                      else QWebEngineScript.MainWorld)
+                script_obj.setRunsOnSubFrames(not noframes)
+                
+                # 将脚本添加到页面
+                collection.insert(script_obj)
+                
+                print(f"注入脚本 {names} 到 {current_url}")
+            except Exception as e:
+                print(f"注入脚本 {names} 时出错: {e}")
+    
+    def plan_injection(self, url):
+        """计算URL的注入计划（不涉及页面）
+        
+        返回 (分组 -> [(脚本, 源码哈希)], 分组 -> 脚本包哈希)
+        """
+        groups = {}
+        if url.scheme() in self.INJECTABLE_SCHEMES:
+            # 启动时脚本仍在后台加载，只等待可能匹配该URL的脚本
+            self.wait_for_scripts(url)
             
-            return bool(re.match(regex_pattern, url))
-        except:
-            return False
+            for script in self.get_matching_scripts(url):
+                source_hash = self.get_source_hash(script)
+                if source_hash is None:
+                    # 依赖尚未下载，下载完成后再注入
+                    self.resource_cache.ensure(self.get_dependency_keys(script))
+                    print(f"脚本 '{script['name']}' 的依赖尚未缓存，暂不注入")
+                    continue
+                group = self.get_bundle_group(script)
+                if not self.check_bundle_syntax(script, source_hash):
+                    # 单独注入，解析失败只影响这个脚本
+                    group += f":{script['id']}"
+                groups.setdefault(group, []).append((script, source_hash))
+        
+        wanted = {}
+        for group, entries in groups.items():
+            bundle_hash = self.get_bundle_hash(group, entries)
+            if entries[0][0]['sandboxed']:
+                # 存储快照随脚本包注入，存储变化后需要重新注入
+                bundle_hash = self.get_storage_hash(bundle_hash, entries)
+            wanted[group] = bundle_hash
+        return groups, wanted
+    
+    def get_bundle_group(self, script):
+        """脚本所属的脚本包分组：注入时机、框架范围与运行环境相同的脚本可以合并"""
+        return (f"{script['run_at']}:{'main' if script['noframes'] else 'all'}"
+                f":{'app' if script['sandboxed'] else 'page'}")
+    
+    def get_bundle_hash(self, group, entries):
+        """脚本包哈希：由分组及其中每个脚本的ID和源码哈希决定"""
+        digest = hashlib.sha1(group.encode('utf-8'))
+        for script, source_hash in entries:
+            digest.update(b'\0' + script['id'].encode('utf-8') + b'#' + source_hash.encode('ascii'))
+        return digest.hexdigest()
     
-    def inject_to_page(self, page):
-        """将脚本注入到页面"""
-        current_url = page.url().toString()
+    def get_storage_hash(self, bundle_hash, entries):
+        """授权脚本包的哈希：在脚本包哈希之外加入各脚本存储的版本"""
+        digest = hashlib.sha1(bundle_hash.encode('ascii'))
+        for script, _ in entries:
+            storage_id = script['storage_id']
+            digest.update(f"\0{storage_id}#{self.storage.get_version(storage_id)}".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def build_page_source(self, group, entries):
+        """注入页面的源码：授权脚本包前加入 GM 运行时和各脚本的存储快照
         
-        for script in self.scripts:
-            if script['enabled'] and self.should_inject(script, page.url()):
-                try:
-                    # 创建脚本对象
-                    script_obj = QWebEngineScript()
-                    
-                    # 设置脚本内容
-                    script_obj.setSourceCode(script['content'])
-                    
-                    # 设置脚本在文档创建后运行
-                    script_obj.setInjectionPoint(QWebEngineScript.DocumentCreation)
-                    script_obj.setWorldId(QWebEngineScript.MainWorld)
-                    script_obj.setRunsOnSubFrames(True)
-                    
-                    # 将脚本添加到页面
-                    page.scripts().insert(script_obj)
-                    
-                    print(f"注入脚本 '{script['name']}' 到 {current_url}")
-                except Exception as e:
-                    print(f"注入脚本 '{script['name']}' 时出错: {e}")
+        返回 (源码, 是否包含了全部脚本)
+        """
+        bundle, complete = self.build_bundle(self.get_bundle_hash(group, entries), entries)
+        if not entries[0][0]['sandboxed']:
+            return bundle, complete
+        
+        seeds = []
+        for script, _ in entries:
+            seeds.append("window.__rickGM.seed(%s, %s, %s);" % (
+                json.dumps(self.get_gm_key(script)),
+                json.dumps(script['storage_id'], ensure_ascii=False),
+                json.dumps(self.storage.get_values(script['storage_id']), ensure_ascii=False)))
+        return self.GM_RUNTIME + '\n'.join(seeds) + '\n' + bundle, complete
+    
+    def build_bundle(self, bundle_hash, entries):
+        """生成脚本包源码，按脚本包哈希缓存
+        
+        返回 (源码, 是否包含了全部脚本)；跳过了依赖内容缺失的脚本时不缓存
+        """
+        bundle = self.bundle_cache.get(bundle_hash, bundle_hash)
+        if bundle is not None:
+            return bundle, True
+        
+        parts = [self.build_bundle_entry(script) for script, _ in entries]
+        complete = None not in parts
+        bundle = '\n'.join(part for part in parts if part is not None)
+        if not entries[0][0]['noframes']:
+            bundle = self.FRAME_BUNDLE_WRAPPER % {'frame_match': self.FRAME_MATCH, 'entries': bundle}
+        if complete:
+            self.bundle_cache.put(bundle_hash, bundle_hash, bundle)
+        return bundle, complete
+    
+    def build_bundle_entry(self, script):
+        """脚本包中的一项：带隔离包装的脚本源码，依赖内容缺失时返回 None
+        
+        也在子框架中运行的脚本先检查框架的地址是否匹配它的规则
+        """
+        source = self.build_script_source(script)
+        if source is None:
+            return None
+        entry = self.BUNDLE_ENTRY_WRAPPER % {
+            'source': source,
+            'name': json.dumps(script['name'], ensure_ascii=False)
+        }
+        if script['noframes']:
+            return entry
+        return self.FRAME_ENTRY_WRAPPER % {'rules': self.get_frame_rules(script), 'entry': entry}
+    
+    def get_frame_rules(self, script):
+        """子框架中检查地址用的规则（JSON）"""
+        return json.dumps({
+            'all': not script['matches'],
+            'matches': [pattern.js_rule() for pattern in script['compiled_matches']],
+            'excludes': [pattern.js_rule() for pattern in script['compiled_excludes']]
+        }, ensure_ascii=False)
+    
+    def check_bundle_syntax(self, script, source_hash):
+        """检查脚本包中的一项能否解析，结果按源码哈希缓存
+        
+        用 QJSEngine 解析放在 if (false) 之后的该项，只解析、不执行。QJSEngine 不支持部分较新的语法
+        （如 ?.、??），这样的脚本也按未通过处理：单独注入时由浏览器解析，仍能正常运行，只是不合并
+        """
+        key = (script['id'], source_hash)
+        ok = self.syntax_cache.get(key)
+        if ok is None:
+            entry = self.build_bundle_entry(script)
+            if entry is None:
+                # 依赖内容缺失，这次不会注入，下载完成后再检查
+                return True
+            engine = QJSEngine()
+            result = engine.evaluate("if (false) " + entry)
+            ok = not result.isError()
+            if not ok:
+                print(f"脚本 '{script['name']}' 未通过语法检查，单独注入"
+                      f"（也可能是 QJSEngine 不支持的新语法）: {result.toString()}")
+            self.syntax_cache[key] = ok
+        return ok
     
     def get_script_list(self):
         """获取脚本列表"""
         return [script['name'] for script in self.scripts]
     
     def reload_scripts(self):
-        """重新加载脚本"""
-        self.load_scripts()
\ No newline at end of file
+        """重新加载脚本（只处理变化的文件）"""
+        if self.loading:
+            # 初始加载尚未完成，稍后再同步
+            self.reload_timer.start()
+            return
+        
+        changed = self.sync_scripts()
+        self.save_metadata_cache()
+        if changed:
+            self.scriptsChanged.emit()
\ No newline at end of file
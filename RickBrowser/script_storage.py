@@ -0,0 +1,111 @@
+"""
+用户脚本存储（GM_setValue/GM_getValue）
+每个脚本的键值保存在 SQLite 中，内存中按脚本缓存；
+写入先在内存中合并，定时在一个事务中提交
+"""
+
+import sqlite3
+
+
+class ScriptStorage:
+    """按脚本隔离的键值存储，值为 JSON 文本"""
+
+    # 单个值的大小上限（字符数）
+    MAX_VALUE_LENGTH = 1024 * 1024
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS gm_values (
+                script TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (script, key)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+        # 脚本存储ID -> {键: JSON文本}，首次读取时从数据库加载
+        self.cache = {}
+
+        # 脚本存储ID -> 写入次数，用于判断页面中的快照是否过期
+        self.versions = {}
+
+        # 尚未提交的写入：(脚本存储ID, 键) -> JSON文本，删除时为 None
+        self.pending = {}
+
+    def get_values(self, script):
+        """获取脚本的全部值（含未提交的写入）"""
+        values = self.cache.get(script)
+        if values is None:
+            rows = self.conn.execute(
+                "SELECT key, value FROM gm_values WHERE script = ?", (script,))
+            values = self.cache[script] = dict(rows)
+        return values
+
+    def get_version(self, script):
+        """脚本存储的版本号，每次写入后递增"""
+        return self.versions.get(script, 0)
+
+    def apply(self, script, set_values, deleted):
+        """合并一批写入，返回实际发生的变化 {set: {键: JSON文本}, del: [键]}，没有变化时为 None
+
+        set_values 为 {键: JSON文本}，deleted 为要删除的键
+        """
+        values = self.get_values(script)
+        changed_values = {}
+        changed_deleted = []
+
+        for key, value in set_values.items():
+            if not isinstance(key, str) or not isinstance(value, str):
+                continue
+            if len(value) > self.MAX_VALUE_LENGTH:
+                print(f"脚本存储 {script} 的值 {key} 超过 {self.MAX_VALUE_LENGTH} 字符，已忽略")
+                continue
+            if values.get(key) != value:
+                values[key] = value
+                self.pending[(script, key)] = value
+                changed_values[key] = value
+
+        for key in deleted:
+            if isinstance(key, str) and key in values:
+                del values[key]
+                self.pending[(script, key)] = None
+                changed_deleted.append(key)
+
+        if not changed_values and not changed_deleted:
+            return None
+        self.versions[script] = self.get_version(script) + 1
+        return {'set': changed_values, 'del': changed_deleted}
+
+    def has_pending(self):
+        """是否有尚未提交的写入"""
+        return bool(self.pending)
+
+    def flush(self):
+        """在一个事务中提交全部合并后的写入"""
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, {}
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO gm_values (script, key, value) VALUES (?, ?, ?)",
+                    [(script, key, value) for (script, key), value in pending.items()
+                     if value is not None])
+                self.conn.executemany(
+                    "DELETE FROM gm_values WHERE script = ? AND key = ?",
+                    [key for key, value in pending.items() if value is None])
+        except sqlite3.Error as e:
+            print(f"保存脚本存储时出错: {e}")
+            # 保留未提交的写入，下次重试（期间的新写入优先）
+            pending.update(self.pending)
+            self.pending = pending
+
+    def close(self):
+        """提交剩余写入并关闭数据库"""
+        self.flush()
+        self.conn.close()
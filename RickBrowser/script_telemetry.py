@@ -0,0 +1,77 @@
+"""
+用户脚本执行耗时统计
+页面内测量每个脚本的同步执行时间和 MutationObserver 回调时间，
+按脚本和主机汇总为每页耗时的 p50/p95
+"""
+
+import math
+from collections import OrderedDict
+
+
+def percentile(values, fraction):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class ScriptTelemetry:
+    """按脚本、按主机汇总每页的脚本耗时"""
+
+    # 每个脚本（以及每个脚本+主机）保留最近的页面数
+    MAX_PAGES = 200
+
+    def __init__(self):
+        # 脚本ID -> OrderedDict(页面ID -> 该页累计耗时ms)
+        self.by_script = {}
+
+        # (脚本ID, 主机) -> OrderedDict(页面ID -> 该页累计耗时ms)
+        self.by_host = {}
+
+    def _add(self, table, key, page_id, ms):
+        """累加某页的耗时，返回该页累计值"""
+        pages = table.get(key)
+        if pages is None:
+            pages = table[key] = OrderedDict()
+
+        total = pages.pop(page_id, 0.0) + ms
+        pages[page_id] = total
+        if len(pages) > self.MAX_PAGES:
+            pages.popitem(last=False)
+        return total
+
+    def record(self, page_id, host, script_id, ms):
+        """记录一次上报，返回该脚本在该页面的累计耗时"""
+        self._add(self.by_host, (script_id, host), page_id, ms)
+        return self._add(self.by_script, script_id, page_id, ms)
+
+    @staticmethod
+    def summarize(pages):
+        """汇总为 (页面数, p50, p95)"""
+        values = list(pages.values())
+        return len(values), percentile(values, 0.5), percentile(values, 0.95)
+
+    def script_stats(self, script_id):
+        """脚本的整体统计，没有数据时返回 None"""
+        pages = self.by_script.get(script_id)
+        if not pages:
+            return None
+        return self.summarize(pages)
+
+    def host_stats(self, script_id):
+        """脚本按主机的统计：[(主机, (页面数, p50, p95))]，按 p95 降序"""
+        rows = [
+            (host, self.summarize(pages))
+            for (key, host), pages in self.by_host.items()
+            if key == script_id and pages
+        ]
+        rows.sort(key=lambda row: row[1][2], reverse=True)
+        return rows
+
+    def forget(self, script_id):
+        """删除脚本的全部统计"""
+        self.by_script.pop(script_id, None)
+        for key in [key for key in self.by_host if key[0] == script_id]:
+            del self.by_host[key]
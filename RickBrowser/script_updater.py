@@ -0,0 +1,278 @@
+"""
+用户脚本自动更新
+按 @updateURL/@downloadURL 检查更新：先只获取元数据块（使用 ETag/If-Modified-Since 条件请求），
+版本更高时才下载完整脚本；检查在有上限的线程池中并发进行
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+
+def compare_versions(a, b):
+    """比较版本号，返回 -1/0/1
+
+    按 '.' 分段逐段比较：数字段按数值比较，其余按字符串比较，缺少的段视为 0
+    """
+    def parts(version):
+        result = []
+        for part in str(version).strip().split('.'):
+            match = re.match(r'(\d*)(.*)', part)
+            number, rest = match.groups()
+            result.append((int(number) if number else 0, rest))
+        return result
+
+    left, right = parts(a), parts(b)
+    length = max(len(left), len(right))
+    left += [(0, '')] * (length - len(left))
+    right += [(0, '')] * (length - len(right))
+
+    for (left_number, left_rest), (right_number, right_rest) in zip(left, right):
+        if left_number != right_number:
+            return -1 if left_number < right_number else 1
+        if left_rest != right_rest:
+            # 带后缀的预发布版本（如 1.0beta）低于正式版本
+            if not left_rest or not right_rest:
+                return 1 if not left_rest else -1
+            return -1 if left_rest < right_rest else 1
+    return 0
+
+
+class ScriptUpdater:
+    """后台检查并下载用户脚本的更新
+
+    check() 接收 [{id, name, version, hash, update_url, download_url}]，
+    每个脚本的结果通过 on_result(结果) 回调报告（在工作线程中调用）：
+        {id, name, hash, status, version, content, state, error}
+    status 为 'updated'（content 为新脚本）、'current'、'not_modified' 或 'error'。
+    'updated' 时不记录这次的 ETag/Last-Modified，新脚本写入后由调用方用 commit_state(id, state)
+    记录；未能写入时调用 discard_state(id)，下次重新完整检查
+    """
+
+    STATE_FILE = ".update_state.json"
+
+    # 元数据块的读取上限，超过后放弃；范围请求首先请求的字节数
+    MAX_METADATA_BYTES = 64 * 1024
+    METADATA_RANGE_BYTES = 16 * 1024
+
+    # 完整脚本的大小上限
+    MAX_SCRIPT_BYTES = 10 * 1024 * 1024
+
+    REQUEST_TIMEOUT = 20
+
+    METADATA_END = b'==/UserScript=='
+
+    def __init__(self, state_dir, parse_metadata, session=None, max_workers=4, on_result=None):
+        self.state_file = Path(state_dir) / self.STATE_FILE
+        self.parse_metadata = parse_metadata
+        self.session = session or requests.Session()
+        self.on_result = on_result
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="script-updater")
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+
+        # 正在检查的脚本ID
+        self.pending = set()
+
+        # 脚本ID -> {checked, url, etag, last_modified}
+        self.state = {}
+        self.load_state()
+
+    def load_state(self):
+        """加载检查状态"""
+        if not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        except Exception as e:
+            print(f"读取脚本更新状态时出错: {e}")
+            self.state = {}
+
+    def save_state(self):
+        """保存检查状态，先写临时文件再替换"""
+        temp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.state, ensure_ascii=False)
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp_file, self.state_file)
+            except Exception as e:
+                print(f"保存脚本更新状态时出错: {e}")
+
+    def is_due(self, script_id, interval):
+        """距上次检查是否已超过 interval 秒"""
+        with self.lock:
+            entry = self.state.get(script_id)
+        return entry is None or time.time() - entry.get('checked', 0) >= interval
+
+    def check(self, items):
+        """提交检查任务（正在检查的脚本会被跳过），返回提交的数量"""
+        submitted = 0
+        for item in items:
+            with self.lock:
+                if item['id'] in self.pending:
+                    continue
+                self.pending.add(item['id'])
+            self.executor.submit(self._check_task, item)
+            submitted += 1
+        return submitted
+
+    def _check_task(self, item):
+        """后台任务：检查单个脚本并报告结果"""
+        result = {'id': item['id'], 'name': item['name'], 'hash': item['hash'],
+                  'status': 'error', 'version': None, 'content': None, 'state': None, 'error': None}
+        try:
+            result.update(self.check_script(item))
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            with self.lock:
+                self.pending.discard(item['id'])
+                finished = not self.pending
+
+        # 一轮检查全部完成后保存一次状态
+        if finished:
+            self.save_state()
+        if self.on_result:
+            self.on_result(result)
+
+    def check_script(self, item):
+        """检查单个脚本：条件请求元数据块，版本更高时下载完整脚本"""
+        check_url = item.get('update_url') or item.get('download_url')
+
+        with self.lock:
+            entry = dict(self.state.get(item['id'], {}))
+        headers = {}
+        if entry.get('url') == check_url:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        # 检查地址是完整脚本时先只请求开头部分；元数据块更长时再请求完整内容
+        # （不支持范围请求的服务器返回完整内容，读到元数据块结束即停止）
+        ranges = [None]
+        if not check_url.endswith('.meta.js'):
+            ranges.insert(0, f"bytes=0-{self.METADATA_RANGE_BYTES - 1}")
+
+        for byte_range in ranges:
+            request_headers = dict(headers)
+            if byte_range:
+                request_headers['Range'] = byte_range
+
+            response = self.session.get(check_url, headers=request_headers,
+                                        timeout=self.REQUEST_TIMEOUT, stream=True)
+            try:
+                if response.status_code == 304:
+                    self.update_state(item['id'], entry)
+                    return {'status': 'not_modified'}
+                response.raise_for_status()
+
+                header = self.read_metadata_block(response)
+                new_entry = {
+                    'url': check_url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+            finally:
+                response.close()
+
+            if header is not None:
+                break
+            if response.status_code != 206:
+                raise ValueError("未找到元数据块")
+        else:
+            raise ValueError("未找到元数据块")
+
+        metadata = self.parse_metadata(header)
+        version = metadata.get('version')
+        if not version:
+            raise ValueError(f"{check_url} 中没有 @version")
+
+        if compare_versions(version, item.get('version') or '0') <= 0:
+            self.update_state(item['id'], new_entry)
+            return {'status': 'current', 'version': version}
+
+        content = self.download_script(item, version)
+
+        # 新脚本写入后才记录ETag（commit_state），否则下次的条件请求会得到 304 而不再更新
+        return {'status': 'updated', 'version': version, 'content': content, 'state': new_entry}
+
+    def read_metadata_block(self, response):
+        """流式读取响应，读到元数据块结束即停止；未找到时返回 None"""
+        data = b''
+        for chunk in response.iter_content(8 * 1024):
+            data += chunk
+            end = data.find(self.METADATA_END)
+            if end >= 0:
+                return data[:end + len(self.METADATA_END)].decode('utf-8', errors='replace')
+            if len(data) > self.MAX_METADATA_BYTES:
+                break
+        return None
+
+    def download_script(self, item, version):
+        """下载完整的新版本脚本并校验"""
+        download_url = item.get('download_url') or item.get('update_url')
+        if download_url.endswith('.meta.js'):
+            raise ValueError(f"没有可下载的完整脚本: {download_url}")
+
+        response = self.session.get(download_url, timeout=self.REQUEST_TIMEOUT, stream=True)
+        try:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > self.MAX_SCRIPT_BYTES:
+                    raise ValueError(f"脚本超过 {self.MAX_SCRIPT_BYTES} 字节")
+                chunks.append(chunk)
+        finally:
+            response.close()
+
+        content = b''.join(chunks).decode('utf-8')
+        metadata = self.parse_metadata(content)
+        if not metadata.get('name'):
+            raise ValueError(f"{download_url} 不是有效的用户脚本")
+        if compare_versions(metadata.get('version') or '0', version) < 0:
+            raise ValueError(f"{download_url} 的版本 {metadata.get('version')} 低于元数据中的 {version}")
+        return content
+
+    def update_state(self, script_id, entry):
+        """记录检查时间和缓存验证信息"""
+        entry = dict(entry)
+        entry['checked'] = time.time()
+        with self.lock:
+            self.state[script_id] = entry
+
+    def commit_state(self, script_id, entry):
+        """更新已写入：记录这次检查的缓存验证信息并保存"""
+        self.update_state(script_id, entry)
+        self.save_state()
+
+    def discard_state(self, script_id):
+        """更新未能写入：删除脚本的检查状态并保存，下次不带条件重新检查"""
+        with self.lock:
+            removed = self.state.pop(script_id, None)
+        if removed is not None:
+            self.save_state()
+
+    def forget(self, script_ids):
+        """删除已不存在的脚本的状态"""
+        with self.lock:
+            for script_id in list(self.state):
+                if script_id not in script_ids:
+                    del self.state[script_id]
+
+    def shutdown(self):
+        """停止后台检查"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
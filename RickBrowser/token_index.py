@@ -0,0 +1,130 @@
+"""
+词前缀倒排索引
+书签搜索和地址栏补全共用：词 -> 键集合，配合排好序的词列表做前缀查找，
+短前缀单独维护键集合；增删时增量更新
+"""
+
+import bisect
+import re
+
+# 连续的拉丁字母、连续的数字各成一词（site123 -> site、123，避免大量只出现一次的词），
+# 中日韩文字逐字成词
+TOKEN_PATTERN = re.compile(r'[a-z]+|[0-9]+|[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]')
+
+
+def tokenize(text):
+    """将文本切分为小写的词"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class TokenIndex:
+    """键 -> 词集合的倒排索引，支持按词前缀查找键"""
+
+    # 不超过这个长度的前缀单独维护键集合（短前缀对应的词太多，临时合并太慢）
+    SHORT_PREFIX_LENGTH = 2
+
+    def __init__(self):
+        # 词 -> 键集合；以及排好序的全部词，用于前缀查找
+        self.index = {}
+        self.sorted_tokens = []
+
+        # 短前缀 -> 键集合
+        self.short_prefixes = {}
+
+        # 键 -> 词集合，删除时用于更新倒排索引
+        self.tokens = {}
+
+        # 批量加入时最后统一排序，不逐个插入
+        self.bulk_loading = False
+
+    def __contains__(self, key):
+        return key in self.tokens
+
+    def add(self, key, tokens):
+        """加入键的词（键已存在时先删除旧的词）"""
+        if key in self.tokens:
+            self.remove(key)
+
+        tokens = set(tokens)
+        self.tokens[key] = tokens
+        index = self.index
+        for token in tokens:
+            keys = index.get(token)
+            if keys is None:
+                keys = index[token] = set()
+                if not self.bulk_loading:
+                    bisect.insort(self.sorted_tokens, token)
+            keys.add(key)
+
+        short_prefixes = self.short_prefixes
+        for prefix in self.get_short_prefixes(tokens):
+            keys = short_prefixes.get(prefix)
+            if keys is None:
+                keys = short_prefixes[prefix] = set()
+            keys.add(key)
+
+    def remove(self, key):
+        """删除键的全部词"""
+        tokens = self.tokens.pop(key, None)
+        if tokens is None:
+            return
+
+        for prefix in self.get_short_prefixes(tokens):
+            keys = self.short_prefixes[prefix]
+            keys.discard(key)
+            if not keys:
+                del self.short_prefixes[prefix]
+
+        for token in tokens:
+            keys = self.index[token]
+            keys.discard(key)
+            if not keys:
+                del self.index[token]
+                position = bisect.bisect_left(self.sorted_tokens, token)
+                del self.sorted_tokens[position]
+
+    def begin_bulk(self):
+        """开始批量加入"""
+        self.bulk_loading = True
+
+    def end_bulk(self):
+        """结束批量加入，统一排序"""
+        self.bulk_loading = False
+        self.sorted_tokens = sorted(self.index)
+
+    def get_short_prefixes(self, tokens):
+        """词的全部短前缀"""
+        return {token[:length] for token in tokens
+                for length in range(1, self.SHORT_PREFIX_LENGTH + 1)}
+
+    def get_token_range(self, term):
+        """以 term 开头的词在 sorted_tokens 中的范围 (start, end)"""
+        start = bisect.bisect_left(self.sorted_tokens, term)
+        end = bisect.bisect_left(self.sorted_tokens, term + '\U0010ffff', start)
+        return start, end
+
+    def prefix_keys(self, term):
+        """含有以 term 开头的词的全部键"""
+        if len(term) <= self.SHORT_PREFIX_LENGTH:
+            return set(self.short_prefixes.get(term, ()))
+
+        start, end = self.get_token_range(term)
+        return set().union(*(self.index[token] for token in self.sorted_tokens[start:end]))
+
+    def prefix_set(self, term, max_tokens):
+        """含有以 term 开头的词的键集合，可能是索引内部的集合（调用方不能修改）；
+        以 term 开头的词超过 max_tokens 个时返回 None
+        """
+        if len(term) <= self.SHORT_PREFIX_LENGTH:
+            return self.short_prefixes.get(term, set())
+
+        start, end = self.get_token_range(term)
+        if end - start > max_tokens:
+            return None
+        if end - start == 1:
+            return self.index[self.sorted_tokens[start]]
+        return set().union(*(self.index[token] for token in self.sorted_tokens[start:end]))
+
+    def key_matches(self, key, term):
+        """键是否含有以 term 开头的词"""
+        return any(token.startswith(term) for token in self.tokens.get(key, ()))
@@ -0,0 +1,149 @@
+"""
+网址规范化
+同一页面的不同写法（末尾斜杠、http/https、跟踪参数、片段）映射为同一个键，
+历史记录和书签按这个键去重；要去掉的参数可在 url_canonical.json 中配置
+"""
+
+import json
+import re
+from pathlib import Path
+from urllib.parse import unquote_plus
+
+# 协议、//主机、路径、?参数、#片段（比 urlsplit 快，迁移旧数据库时要处理大量网址）
+URL_PATTERN = re.compile(r'([a-zA-Z][a-zA-Z0-9+.-]*):(?://([^/?#]*))?([^?#]*)(?:\?([^#]*))?(?:#(.*))?', re.S)
+
+
+class UrlCanonicalizer:
+    """计算网址的规范键
+
+    协议和主机名转小写，http 与 https 视为相同（键中不含协议），去掉默认端口、
+    路径末尾的斜杠、跟踪参数和片段（#! 和 #/ 开头的前端路由保留），其余参数按名称排序；
+    不是网址的文本原样作为键
+    """
+
+    # 任何网站都去掉的参数
+    STRIP_PARAMS = (
+        'fbclid', 'gclid', 'gclsrc', 'dclid', 'msclkid', 'yclid', 'twclid', 'ttclid',
+        'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok',
+        'ref_src', 'ref_url', 'spm', 'scm', 'share_source', 'share_medium', 'share_from'
+    )
+
+    # 以这些前缀开头的参数都去掉
+    STRIP_PREFIXES = ('utm_', 'pk_', 'hmsr', 'vero_')
+
+    # 只在指定网站（及其子域名）去掉的参数
+    HOST_PARAMS = {
+        'bilibili.com': ('spm_id_from', 'from_spmid', 'vd_source', 'share_plat', 'share_tag'),
+        'youtube.com': ('si', 'feature', 'pp'),
+        'youtu.be': ('si', 'feature'),
+        'amazon.com': ('ref', 'ref_', 'pf_rd_p', 'pf_rd_r', 'pd_rd_r', 'pd_rd_w', 'pd_rd_wg', 'psc'),
+        'taobao.com': ('spm', 'scm', 'pvid', 'ali_trackid'),
+        'zhihu.com': ('utm_psn', 'share_code'),
+        'weibo.com': ('from', 'wvr', 'mod')
+    }
+
+    DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+    def __init__(self, strip_params=(), strip_prefixes=(), host_params=None, keep_params=()):
+        """strip_params/strip_prefixes/host_params 在默认列表之外追加，keep_params 中的参数不去掉"""
+        keep = {name.lower() for name in keep_params}
+        self.strip_params = frozenset(name.lower() for name in self.STRIP_PARAMS + tuple(strip_params)
+                                      if name.lower() not in keep)
+        self.strip_prefixes = tuple(prefix.lower() for prefix in self.STRIP_PREFIXES + tuple(strip_prefixes))
+        self.keep_params = frozenset(keep)
+
+        merged = {host: set(names) for host, names in self.HOST_PARAMS.items()}
+        for host, names in (host_params or {}).items():
+            merged.setdefault(host.lower(), set()).update(names)
+        self.host_params = {host: frozenset(name.lower() for name in names if name.lower() not in keep)
+                            for host, names in merged.items()}
+
+    @classmethod
+    def load(cls, path):
+        """从 JSON 文件读取额外的参数列表，文件不存在或无效时只使用默认列表"""
+        path = Path(path)
+        settings = {}
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    settings = json.load(f)
+            except Exception as e:
+                print(f"读取 {path} 时出错: {e}")
+            if not isinstance(settings, dict):
+                settings = {}
+        try:
+            return cls(strip_params=settings.get('strip_params', ()),
+                       strip_prefixes=settings.get('strip_prefixes', ()),
+                       host_params=settings.get('host_params'),
+                       keep_params=settings.get('keep_params', ()))
+        except (AttributeError, TypeError) as e:
+            print(f"{path} 格式不正确: {e}")
+            return cls()
+
+    def fingerprint(self):
+        """规则的摘要，规则变化时已保存的键需要重新计算"""
+        return json.dumps({
+            'strip_params': sorted(self.strip_params),
+            'strip_prefixes': sorted(self.strip_prefixes),
+            'host_params': {host: sorted(names) for host, names in sorted(self.host_params.items())},
+            'keep_params': sorted(self.keep_params)
+        }, sort_keys=True)
+
+    def get_host_params(self, host):
+        """主机名及其上级域名对应的参数"""
+        names = set()
+        parts = host.split('.')
+        for i in range(len(parts) - 1):
+            site_params = self.host_params.get('.'.join(parts[i:]))
+            if site_params:
+                names |= site_params
+        return names
+
+    def is_tracking_param(self, name, host_params):
+        """参数是否应去掉"""
+        name = unquote_plus(name).lower()
+        if name in self.keep_params:
+            return False
+        return name in self.strip_params or name in host_params or name.startswith(self.strip_prefixes)
+
+    def canonicalize(self, url):
+        """网址的规范键"""
+        url = str(url).strip()
+        match = URL_PATTERN.fullmatch(url)
+        if match is None:
+            return url
+        scheme, netloc, path, query, fragment = match.groups()
+        scheme = scheme.lower()
+        if scheme in self.DEFAULT_PORTS and not netloc:
+            return url
+
+        fragment = fragment if fragment and fragment.startswith(('!', '/')) else ''
+        if scheme not in self.DEFAULT_PORTS:
+            key = f"{scheme}:{url[len(scheme) + 1:].split('#', 1)[0]}"
+            return f"{key}#{fragment}" if fragment else key
+
+        # 用户信息保持原样，主机名转小写，去掉默认端口
+        userinfo, _, host = netloc.rpartition('@')
+        if not host.startswith('['):
+            host, _, port = host.partition(':')
+        else:
+            host, _, port = host.partition(']')
+            host, port = host + ']', port[1:]
+        hostname = host.lower().rstrip('.')
+        host = hostname
+        if port and port != self.DEFAULT_PORTS[scheme]:
+            host = f"{host}:{port}"
+        if userinfo:
+            host = f"{userinfo}@{host}"
+        key = host + path.rstrip('/')
+
+        if query:
+            host_params = self.get_host_params(hostname)
+            params = [param for param in query.split('&')
+                      if param and not self.is_tracking_param(param.split('=', 1)[0], host_params)]
+            if params:
+                params.sort(key=lambda param: param.split('=', 1)[0])
+                key += '?' + '&'.join(params)
+        if fragment:
+            key += '#' + fragment
+        return key
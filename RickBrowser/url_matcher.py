@@ -0,0 +1,430 @@
+"""
+URL匹配引擎 - 预编译用户脚本的匹配规则
+脚本加载时一次性编译 @match/@include/@exclude，并按协议和主机建立索引
+
+支持的规则（与篡改猴一致）：
+    @match    <scheme>://<host><path>，如 *://*.example.com/*、<all_urls>
+    @include  通配符模式（* 匹配任意字符，.tld 匹配任意顶级域名）
+              或正则表达式 /regex/flags
+    @exclude  与 @include 相同
+"""
+
+import re
+from abc import ABC, abstractmethod
+
+
+class PatternError(ValueError):
+    """无效的匹配模式"""
+
+
+class ParsedUrl:
+    """已拆分的URL，只记录各部分在原字符串中的位置"""
+
+    __slots__ = ('url', 'scheme', 'host', 'path_start', 'path_end')
+
+    def __init__(self, url):
+        self.url = url
+
+        colon = url.find(':')
+        self.scheme = url[:colon].lower() if colon > 0 else ''
+
+        # 跳过 "//"，定位主机
+        start = colon + 1
+        if url.startswith('//', start):
+            start += 2
+            host_end = len(url)
+            for sep in '/?#':
+                pos = url.find(sep, start)
+                if 0 <= pos < host_end:
+                    host_end = pos
+            netloc = url[start:host_end]
+            if '@' in netloc:
+                netloc = netloc.rsplit('@', 1)[1]
+            if netloc.startswith('['):
+                netloc = netloc[:netloc.find(']') + 1]
+            elif ':' in netloc:
+                netloc = netloc.split(':', 1)[0]
+            self.host = netloc.lower()
+        else:
+            host_end = start
+            self.host = ''
+
+        # 路径部分包含查询字符串，不包含片段
+        fragment = url.find('#', host_end)
+        self.path_start = host_end
+        self.path_end = fragment if fragment >= 0 else len(url)
+
+
+class CompiledPattern(ABC):
+    """预编译匹配模式的基类"""
+
+    __slots__ = ('source', 'scheme', 'host', 'host_kind')
+
+    # 主机索引类型
+    HOST_EXACT = 'exact'        # www.example.com
+    HOST_SUFFIX = 'suffix'      # *.example.com（包含 example.com 本身）
+    HOST_ANY = 'any'            # 任意主机
+
+    def __init__(self, source):
+        self.source = source
+        self.scheme = '*'
+        self.host = ''
+        self.host_kind = self.HOST_ANY
+
+    @abstractmethod
+    def test(self, parsed):
+        """检查已拆分的URL是否匹配"""
+
+    @abstractmethod
+    def js_rule(self):
+        """页面中检查框架地址用的规则描述（可 JSON 序列化）
+
+        正则由 re.escape 和字面量组成，在 JavaScript 的 RegExp 中含义相同
+        """
+
+    def matches(self, url):
+        """检查URL字符串是否匹配"""
+        return self.test(ParsedUrl(url))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.source!r})'
+
+
+class MatchPattern(CompiledPattern):
+    """@match 规则：协议、主机、路径分别匹配"""
+
+    __slots__ = ('schemes', 'path_regex')
+
+    # * 协议只匹配 http 和 https
+    WILDCARD_SCHEMES = frozenset(('http', 'https'))
+    VALID_SCHEMES = frozenset(('http', 'https', 'file', 'ftp', 'ws', 'wss'))
+
+    _HOST_RE = re.compile(r'^(\*|(\*\.)?[^*/:]+)(:(\*|\d+))?$')
+
+    def __init__(self, source):
+        super().__init__(source)
+
+        if source == '<all_urls>':
+            self.schemes = self.VALID_SCHEMES
+            self.path_regex = None
+            return
+
+        if '://' not in source:
+            raise PatternError(f"缺少协议分隔符: {source}")
+        scheme, rest = source.split('://', 1)
+
+        # 协议
+        scheme = scheme.lower()
+        if scheme == '*':
+            self.schemes = self.WILDCARD_SCHEMES
+        elif scheme in self.VALID_SCHEMES:
+            self.schemes = frozenset((scheme,))
+            self.scheme = scheme
+        else:
+            raise PatternError(f"不支持的协议: {source}")
+
+        # 主机与路径
+        slash = rest.find('/')
+        if slash < 0:
+            raise PatternError(f"缺少路径: {source}")
+        host, path = rest[:slash].lower(), rest[slash:]
+
+        if scheme == 'file':
+            if host:
+                raise PatternError(f"file 协议不能包含主机: {source}")
+        else:
+            host_match = self._HOST_RE.match(host)
+            if not host_match:
+                raise PatternError(f"无效的主机: {source}")
+            host = host_match.group(1)
+            if host == '*':
+                pass
+            elif host.startswith('*.'):
+                self.host = host[2:]
+                self.host_kind = self.HOST_SUFFIX
+            else:
+                self.host = host
+                self.host_kind = self.HOST_EXACT
+
+        # 路径：* 匹配任意字符；"/*" 可直接跳过正则
+        if path == '/*':
+            self.path_regex = None
+        else:
+            self.path_regex = re.compile(re.escape(path).replace(r'\*', '.*'), re.DOTALL)
+
+    def test(self, parsed):
+        if parsed.scheme not in self.schemes:
+            return False
+
+        host_kind = self.host_kind
+        if host_kind == self.HOST_EXACT:
+            if parsed.host != self.host:
+                return False
+        elif host_kind == self.HOST_SUFFIX:
+            host = parsed.host
+            if host != self.host and not (
+                    host.endswith(self.host) and host[-len(self.host) - 1] == '.'):
+                return False
+
+        if self.path_regex is None:
+            return True
+        return self.path_regex.fullmatch(parsed.url, parsed.path_start,
+                                         parsed.path_end) is not None
+
+    def js_rule(self):
+        return {
+            'type': 'match',
+            'schemes': sorted(self.schemes),
+            'host_kind': self.host_kind,
+            'host': self.host,
+            'path': self.path_regex.pattern if self.path_regex is not None else None
+        }
+
+
+class GlobPattern(CompiledPattern):
+    """@include/@exclude 通配符规则：对完整URL进行匹配"""
+
+    __slots__ = ('regex',)
+
+    # 主机中出现这些字符时无法确定实际的主机，不放入主机索引
+    HOST_SPECIAL_CHARS = frozenset('*?#:')
+
+    # .tld 可匹配 .com、.cn、.co.uk 等顶级域名
+    TLD_REGEX = r'\.(?:[a-z]{2,}|(?:com?|net|org|gov|edu|ac)\.[a-z]{2})'
+
+    def __init__(self, source):
+        super().__init__(source)
+
+        regex = re.escape(source).replace(r'\*', '.*').replace(r'\.tld', self.TLD_REGEX)
+        self.regex = re.compile(regex, re.DOTALL | re.IGNORECASE)
+
+        # 协议与主机都是字面量时才能放入主机索引
+        if '://' in source:
+            scheme, rest = source.split('://', 1)
+            host = rest.split('/', 1)[0].lower()
+            if '*' not in scheme:
+                self.scheme = scheme.lower()
+            if not host or host.endswith('.tld'):
+                pass
+            elif self.HOST_SPECIAL_CHARS.isdisjoint(host):
+                self.host = host
+                self.host_kind = self.HOST_EXACT
+            elif host.startswith('*.') and self.HOST_SPECIAL_CHARS.isdisjoint(host[2:]):
+                # 篡改猴的 *.example.com 不匹配 example.com，匹配时由正则保证
+                self.host = host[2:]
+                self.host_kind = self.HOST_SUFFIX
+
+    def test(self, parsed):
+        return self.regex.fullmatch(parsed.url) is not None
+
+    def js_rule(self):
+        return {'type': 'glob', 'regex': self.regex.pattern}
+
+
+class RegexPattern(CompiledPattern):
+    """@include/@exclude 正则规则：/regex/flags"""
+
+    __slots__ = ('regex',)
+
+    _FLAGS = {'i': re.IGNORECASE, 's': re.DOTALL, 'm': re.MULTILINE}
+
+    def __init__(self, source):
+        super().__init__(source)
+
+        end = source.rfind('/')
+        body, flag_chars = source[1:end], source[end + 1:]
+        flags = 0
+        for char in flag_chars:
+            if char not in self._FLAGS:
+                raise PatternError(f"不支持的正则标志 '{char}': {source}")
+            flags |= self._FLAGS[char]
+
+        try:
+            self.regex = re.compile(body, flags)
+        except re.error as e:
+            raise PatternError(f"无效的正则表达式 {source}: {e}") from None
+
+    def test(self, parsed):
+        return self.regex.search(parsed.url) is not None
+
+    def js_rule(self):
+        flags = ''.join(char for char, flag in self._FLAGS.items() if self.regex.flags & flag)
+        return {'type': 'regex', 'regex': self.regex.pattern, 'flags': flags}
+
+
+_REGEX_SOURCE = re.compile(r'^/.+/[a-z]*$', re.DOTALL)
+
+
+def compile_pattern(source, kind='include'):
+    """编译单个规则，无效时抛出 PatternError
+
+    kind 为 'match' 时按 @match 语法解析，否则按 @include/@exclude 语法解析
+    """
+    source = source.strip()
+    if not source:
+        raise PatternError("空的匹配模式")
+
+    if kind == 'match':
+        return MatchPattern(source)
+    if _REGEX_SOURCE.match(source):
+        return RegexPattern(source)
+    return GlobPattern(source)
+
+
+class MatchIndex:
+    """按协议和主机索引的脚本匹配表"""
+
+    # 每个来源缓存的候选规则数量上限
+    ORIGIN_CACHE_SIZE = 512
+
+    def __init__(self):
+        # 规则桶：(协议, 主机) -> [(脚本键, 模式)]
+        self._exact = {}
+        self._suffix = {}
+        self._any = []
+
+        # 排除规则桶，结构相同
+        self._exclude_exact = {}
+        self._exclude_suffix = {}
+        self._exclude_any = []
+
+        # 没有匹配规则的脚本（注入所有页面）
+        self._match_all = []
+
+        # 脚本加载顺序，保证注入顺序稳定
+        self._order = {}
+        self._next_order = 0
+
+        # 脚本键 -> (匹配规则, 排除规则)，用于移除
+        self._rules = {}
+
+        # 来源 -> (候选匹配规则, 候选排除规则)
+        self._origin_cache = {}
+
+    def clear(self):
+        """清空索引"""
+        self.__init__()
+
+    def reserve(self, keys):
+        """按给定顺序预先分配加载顺序，之后以任意顺序添加的脚本仍按此顺序返回"""
+        for key in keys:
+            if key not in self._order:
+                self._order[key] = self._next_order
+                self._next_order += 1
+
+    def add(self, key, matches, excludes, match_all=False):
+        """添加脚本的匹配规则（模式需已编译）
+
+        match_all 为 True 时脚本注入所有页面（仍受排除规则约束）
+        """
+        if key in self._rules:
+            self.remove(key)
+        if key not in self._order:
+            self._order[key] = self._next_order
+            self._next_order += 1
+        self._rules[key] = (matches, excludes)
+
+        if match_all:
+            self._match_all.append(key)
+
+        for pattern in matches:
+            self._insert(pattern, key, self._exact, self._suffix, self._any)
+        for pattern in excludes:
+            self._insert(pattern, key, self._exclude_exact,
+                         self._exclude_suffix, self._exclude_any)
+
+        self._origin_cache.clear()
+
+    def remove(self, key):
+        """移除脚本的全部规则（保留其加载顺序，重新添加时位置不变）"""
+        rules = self._rules.pop(key, None)
+        if rules is None:
+            return
+        matches, excludes = rules
+
+        if key in self._match_all:
+            self._match_all.remove(key)
+
+        for pattern in matches:
+            self._discard(pattern, key, self._exact, self._suffix, self._any)
+        for pattern in excludes:
+            self._discard(pattern, key, self._exclude_exact,
+                          self._exclude_suffix, self._exclude_any)
+
+        self._origin_cache.clear()
+
+    def _bucket(self, pattern, exact, suffix, any_bucket, create=False):
+        """返回模式所属的主机桶"""
+        if pattern.host_kind == CompiledPattern.HOST_EXACT:
+            buckets = exact
+        elif pattern.host_kind == CompiledPattern.HOST_SUFFIX:
+            buckets = suffix
+        else:
+            return any_bucket
+
+        bucket_key = (pattern.scheme, pattern.host)
+        if create:
+            return buckets.setdefault(bucket_key, [])
+        return buckets.get(bucket_key)
+
+    def _discard(self, pattern, key, exact, suffix, any_bucket):
+        """从主机桶中移除脚本的模式"""
+        bucket = self._bucket(pattern, exact, suffix, any_bucket)
+        if bucket is None:
+            return
+        bucket[:] = [entry for entry in bucket if entry[0] != key]
+
+        # 删除空桶
+        if not bucket and bucket is not any_bucket:
+            buckets = exact if pattern.host_kind == CompiledPattern.HOST_EXACT else suffix
+            del buckets[(pattern.scheme, pattern.host)]
+
+    def _insert(self, pattern, key, exact, suffix, any_bucket):
+        """将模式放入对应的主机桶"""
+        self._bucket(pattern, exact, suffix, any_bucket, create=True).append((key, pattern))
+
+    def _candidates(self, scheme, host, exact, suffix, any_bucket):
+        """收集某个来源可能命中的模式"""
+        found = []
+        for key_scheme in (scheme, '*'):
+            found.extend(exact.get((key_scheme, host), ()))
+
+            # 逐级查找后缀桶：a.b.example.com -> b.example.com -> example.com
+            part = host
+            while part:
+                found.extend(suffix.get((key_scheme, part), ()))
+                dot = part.find('.')
+                if dot < 0:
+                    break
+                part = part[dot + 1:]
+
+        found.extend(any_bucket)
+        return found
+
+    def lookup(self, url):
+        """返回应注入到该URL的脚本键（按加载顺序）"""
+        parsed = ParsedUrl(url)
+
+        origin = (parsed.scheme, parsed.host)
+        cached = self._origin_cache.get(origin)
+        if cached is None:
+            cached = (
+                self._candidates(parsed.scheme, parsed.host,
+                                 self._exact, self._suffix, self._any),
+                self._candidates(parsed.scheme, parsed.host, self._exclude_exact,
+                                 self._exclude_suffix, self._exclude_any),
+            )
+            if len(self._origin_cache) >= self.ORIGIN_CACHE_SIZE:
+                self._origin_cache.clear()
+            self._origin_cache[origin] = cached
+
+        includes, excludes = cached
+
+        excluded = {key for key, pattern in excludes if pattern.test(parsed)}
+
+        matched = set(key for key in self._match_all if key not in excluded)
+        for key, pattern in includes:
+            if key not in excluded and key not in matched and pattern.test(parsed):
+                matched.add(key)
+
+        return sorted(matched, key=self._order.__getitem__)